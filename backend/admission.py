@@ -0,0 +1,161 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+
+
+class AdmissionRejected(Exception):
+    """Work refused by the admission controller: its lane queue is full or its deadline can't be met."""
+
+    def __init__(self, lane, reason, retry_after=1.0):
+        super().__init__(f"{lane} lane: {reason}")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Lane:
+    """
+    A class of work. `priority` 0 is served first; `max_concurrency` caps the
+    lane's share of the controller's slots, `max_queue` how many may wait,
+    and `max_wait` (seconds, None = unbounded) the default deadline for
+    getting a slot.
+    """
+
+    def __init__(self, name, priority, max_concurrency, max_queue, max_wait=None):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.running = 0
+        self.waiters = deque()          # (future, deadline) in arrival order
+        self.service_time = None        # EMA of slot hold time, seconds
+        self.stats = {'admitted': 0, 'completed': 0, 'rejected_queue_full': 0,
+                      'dropped_deadline': 0, 'rejected_deadline_estimate': 0}
+
+
+class AdmissionController:
+    """
+    Priority admission for CPU-bound work in a single event loop.
+
+    `capacity` slots are shared by all lanes. When a slot frees, the highest
+    priority lane with waiting work and spare lane concurrency gets it, so a
+    bulk import or feedback burst queues behind interactive predictions
+    instead of competing with them for cores. Work is refused up front when
+    its lane queue is full or the expected wait (queue ahead / capacity x the
+    lane's mean service time) already exceeds its deadline, and dropped if
+    the deadline passes while queued.
+    """
+
+    def __init__(self, capacity, lanes, ema_decay=0.9):
+        self.capacity = capacity
+        self.lanes = {lane.name: lane for lane in lanes}
+        self._by_priority = sorted(lanes, key=lambda lane: lane.priority)
+        self.ema_decay = ema_decay
+        self.running = 0
+
+    def _expected_wait(self, lane):
+        if lane.service_time is None:
+            return 0.0
+        ahead = sum(len(other.waiters) for other in self._by_priority if other.priority <= lane.priority)
+        if ahead == 0 and self.running < self.capacity and lane.running < lane.max_concurrency:
+            return 0.0
+        return (ahead + 1) * lane.service_time / max(1, min(self.capacity, lane.max_concurrency))
+
+    def _grant(self, lane):
+        lane.running += 1
+        self.running += 1
+        lane.stats['admitted'] += 1
+
+    def _dispatch(self):
+        while self.running < self.capacity:
+            lane = next((l for l in self._by_priority if l.waiters and l.running < l.max_concurrency), None)
+            if lane is None:
+                return
+            future, _ = lane.waiters.popleft()
+            self._grant(lane)
+            future.set_result(None)
+
+    async def acquire(self, lane_name, deadline=None):
+        """
+        Wait for a slot in `lane_name`. `deadline` is an absolute
+        time.monotonic() value (e.g. the request's own deadline), capped
+        at now + the lane's max_wait. Raises AdmissionRejected instead of
+        waiting past the deadline.
+        """
+        lane = self.lanes[lane_name]
+        now = time.monotonic()
+        if lane.max_wait is not None:
+            deadline = now + lane.max_wait if deadline is None else min(deadline, now + lane.max_wait)
+
+        if len(lane.waiters) >= lane.max_queue:
+            lane.stats['rejected_queue_full'] += 1
+            raise AdmissionRejected(lane.name, "queue full", retry_after=lane.service_time or 1.0)
+        expected_wait = self._expected_wait(lane)
+        if deadline is not None and now + expected_wait > deadline:
+            lane.stats['rejected_deadline_estimate'] += 1
+            raise AdmissionRejected(lane.name, "expected wait exceeds deadline", retry_after=expected_wait)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (future, deadline)
+        lane.waiters.append(entry)
+        self._dispatch()
+        if future.done():
+            return
+
+        try:
+            timeout = None if deadline is None else max(0.0, deadline - now)
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if future.done():
+                return  # Granted in the same tick the timer fired
+            lane.waiters.remove(entry)
+            future.cancel()
+            lane.stats['dropped_deadline'] += 1
+            raise AdmissionRejected(lane.name, "deadline passed while queued")
+        except asyncio.CancelledError:
+            if future.done():
+                self.release(lane_name)   # Granted, but the caller went away
+            else:
+                lane.waiters.remove(entry)
+                future.cancel()
+            raise
+
+    def release(self, lane_name, service_time=None):
+        lane = self.lanes[lane_name]
+        lane.running -= 1
+        self.running -= 1
+        lane.stats['completed'] += 1
+        if service_time is not None:
+            lane.service_time = service_time if lane.service_time is None else (
+                self.ema_decay * lane.service_time + (1 - self.ema_decay) * service_time)
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def admit(self, lane_name, deadline=None):
+        """`async with controller.admit('interactive'):` holds one slot of the lane for the block."""
+        await self.acquire(lane_name, deadline)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(lane_name, time.monotonic() - start)
+
+    def snapshot(self):
+        return {
+            'capacity': self.capacity,
+            'running': self.running,
+            'lanes': {
+                lane.name: {
+                    'priority': lane.priority,
+                    'running': lane.running,
+                    'queued': len(lane.waiters),
+                    'max_concurrency': lane.max_concurrency,
+                    'max_queue': lane.max_queue,
+                    'mean_service_ms': None if lane.service_time is None else 1000 * lane.service_time,
+                    **lane.stats
+                }
+                for lane in self._by_priority
+            }
+        }
@@ -1,23 +1,41 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Depends, BackgroundTasks # Modified import
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, BackgroundTasks, Query, Header, Request # Modified import
+from fastapi.responses import HTMLResponse, FileResponse
 import uvicorn
 from PIL import Image
 import io
 import uuid
-import base64  
 import time # Add this import
 from datetime import datetime
-from torchvision import transforms, models, datasets # Added datasets
-from supabase import create_client, Client
+from torchvision import transforms
 import os
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
+import contextlib
+import threading
+import asyncio
+import copy
+import math
 import torch.optim as optim
-from sklearn.metrics import precision_recall_fscore_support, accuracy_score
+from densenet_se import DenseNetSE, load_densenet_se
+from evaluation import EvaluationService
+from head_tuning import EmbeddingCache, HeadFineTuner, freeze_backbone
+from embedding_store import EmbeddingStore
+from replay_buffer import ReplayBuffer
+from image_cache import ImageCache
+from persistence import LocalBackend, create_backend
+from supabase_http import CircuitOpen
+from promotion import ModelRegistry, PromotionGate, split_cores
+from tta import TTAController, build_views
+from student import load_student
+from preprocessing import image_to_uint8, normalize_uint8
+from admission import AdmissionController, AdmissionRejected, Lane
+from deadline import RequestDeadline, RequestCancelled, STAGES, REASONS
+from uploads import MaxBodySizeMiddleware, UploadTooLarge, FORM_OVERHEAD_BYTES, ingest_upload
 
 
 # Load environment variables
@@ -27,13 +45,28 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
+# Where predictions, images and feedback are kept: "supabase" (default) or "local"
+# (SQLite in WAL mode + content-addressed image files under LOCAL_STORE_DIR, no network).
+# LOCAL_PUBLIC_URL prefixes the local image_url, e.g. "http://localhost:5500"; images are served at /images/.
+PERSISTENCE_BACKEND = os.getenv("PERSISTENCE_BACKEND", "supabase").lower()
+LOCAL_STORE_DIR = os.getenv("LOCAL_STORE_DIR", "local_store")
+LOCAL_PUBLIC_URL = os.getenv("LOCAL_PUBLIC_URL", "")
+IMAGE_BUCKET = "lung-scan-images"
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-   raise ValueError("Missing Supabase credentials in .env file")
+# Supabase HTTP client: shared connection pool, per-call timeout (s), retries with jittered
+# backoff, and a circuit breaker that fails fast for COOLDOWN s after THRESHOLD consecutive failures
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+SUPABASE_RETRIES = int(os.getenv("SUPABASE_RETRIES", "3"))
+SUPABASE_CIRCUIT_THRESHOLD = int(os.getenv("SUPABASE_CIRCUIT_THRESHOLD", "5"))
+SUPABASE_CIRCUIT_COOLDOWN = float(os.getenv("SUPABASE_CIRCUIT_COOLDOWN", "30"))
 
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Initialize the persistence backend (fails here if Supabase credentials are missing)
+persistence = create_backend(PERSISTENCE_BACKEND, supabase_url=SUPABASE_URL, supabase_key=SUPABASE_KEY,
+                             bucket=IMAGE_BUCKET, local_dir=LOCAL_STORE_DIR, public_url=LOCAL_PUBLIC_URL,
+                             max_connections=SUPABASE_MAX_CONNECTIONS, timeout=SUPABASE_TIMEOUT, retries=SUPABASE_RETRIES,
+                             breaker_threshold=SUPABASE_CIRCUIT_THRESHOLD, breaker_cooldown=SUPABASE_CIRCUIT_COOLDOWN)
 
 
 # Setup FastAPI app
@@ -59,16 +92,129 @@ MODEL_PATH = "lung_cancer_densenet_se_20241209_071826.pth"
 # Configuration for fine-tuning and evaluation
 # IMPORTANT: You MUST create this directory and populate it with test data
 # structured like: API_TEST_DATA_DIR/class_name/image.jpg
-API_TEST_DATA_DIR = "path_to_your_api_test_data"  # <--- !!! SET THIS PATH !!!
+API_TEST_DATA_DIR = os.getenv("API_TEST_DATA_DIR", "path_to_your_api_test_data")  # <--- !!! SET THIS PATH !!!
 FINE_TUNE_LEARNING_RATE = 0.00005  # Smaller LR for fine-tuning on single samples
 EVAL_BATCH_SIZE = 16 # Batch size for evaluation
 
+# Fine-tuning mode for /feedback/:
+#   "full" - one SGD step through the whole DenseNetSE on the uploaded image
+#   "head" - features and SE blocks frozen; only the classifier is trained on
+#            pooled embeddings cached at prediction time (no image decode)
+FINE_TUNE_MODE = os.getenv("FINE_TUNE_MODE", "full").lower()
+HEAD_FINE_TUNE_LEARNING_RATE = 0.0005
+HEAD_FINE_TUNE_MAX_SAMPLES = 5000  # Accumulated feedback embeddings kept for head training
+EMBEDDING_CACHE_SIZE = 10000  # Prediction embeddings kept in memory for head-only feedback
+
+# Replay buffer for full-model feedback fine-tuning: recent feedback plus a
+# reservoir of original training images, sampled class-balanced per step
+REPLAY_BUFFER_DIR = os.getenv("REPLAY_BUFFER_DIR", "replay_buffer")
+REPLAY_TRAIN_DATA_DIR = os.getenv("REPLAY_TRAIN_DATA_DIR")  # ImageFolder train split used to fill the reservoir
+REPLAY_FEEDBACK_PER_CLASS = 256
+REPLAY_RESERVOIR_PER_CLASS = 256
+REPLAY_BATCH_SIZE = 16
+REPLAY_STEPS = 1  # Optimizer steps per feedback
+
+# Evaluation-gated promotion: fine-tuned candidates are evaluated on
+# API_TEST_DATA_DIR in a worker process on reserved cores and only served if
+# accuracy / weighted F1 don't drop by more than PROMOTION_MAX_REGRESSION from the served
+# model, nor by more than PROMOTION_MAX_TOTAL_REGRESSION from the best promoted model.
+# Only enabled when API_TEST_DATA_DIR exists (otherwise every candidate would be rejected)
+PROMOTION_GATE_ENABLED = os.getenv("PROMOTION_GATE", "on").lower() not in ("off", "0", "false")
+MODEL_VERSIONS_DIR = os.getenv("MODEL_VERSIONS_DIR", "model_versions")
+MODEL_VERSIONS_KEEP = int(os.getenv("MODEL_VERSIONS_KEEP", "3"))  # Promoted candidate checkpoints kept for rollback
+PROMOTION_MAX_REGRESSION = float(os.getenv("PROMOTION_MAX_REGRESSION", "0.005"))
+PROMOTION_MAX_TOTAL_REGRESSION = float(os.getenv("PROMOTION_MAX_TOTAL_REGRESSION", "0.01"))
+PROMOTION_TIME_BUDGET = float(os.getenv("PROMOTION_TIME_BUDGET", "120"))  # Seconds per candidate evaluation
+EVAL_CPU_CORES = os.getenv("EVAL_CPU_CORES")  # e.g. "6,7"; default: last quarter of the cores
+
+# Test-time augmentation for /predict/ (per request via the `tta` form field, or always with TTA_DEFAULT=on)
+TTA_DEFAULT = os.getenv("TTA_DEFAULT", "off").lower() in ("on", "1", "true")
+TTA_VIEWS = int(os.getenv("TTA_VIEWS", "8"))  # Views per request, up to 10
+TTA_LATENCY_BUDGET_MS = float(os.getenv("TTA_LATENCY_BUDGET_MS", "500"))
+TTA_MAX_INFLIGHT = int(os.getenv("TTA_MAX_INFLIGHT", "4"))  # Above this many concurrent predictions, use one view
+
+# Early exit after se2/se3 for checkpoints trained with exit heads (per request via the
+# `early_exit` form field, or always with EARLY_EXIT_DEFAULT=on). Not combined with TTA.
+EARLY_EXIT_DEFAULT = os.getenv("EARLY_EXIT_DEFAULT", "off").lower() in ("on", "1", "true")
+EARLY_EXIT_THRESHOLD = float(os.getenv("EARLY_EXIT_THRESHOLD", "0.95"))  # Max softmax probability needed to exit
+
+# Two-tier triage: a distilled student (models/Distillation.py) screens every image and only
+# predictions below STUDENT_CONFIDENCE_THRESHOLD escalate to DenseNetSE. Enabled by STUDENT_MODEL_PATH.
+STUDENT_MODEL_PATH = os.getenv("STUDENT_MODEL_PATH")
+STUDENT_CONFIDENCE_THRESHOLD = float(os.getenv("STUDENT_CONFIDENCE_THRESHOLD", "0.95"))
+
+# Admission control: CPU-bound work is admitted through priority lanes sharing ADMISSION_CAPACITY
+# slots, so bulk prediction (`X-Request-Priority: bulk`), feedback fine-tuning and evaluation
+# queue behind interactive /predict/ requests. Lane: (priority, max concurrency, max queued, max wait s)
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", "4"))
+ADMISSION_LANES = [
+   Lane("interactive", 0, max_concurrency=ADMISSION_CAPACITY, max_queue=64,
+        max_wait=float(os.getenv("ADMISSION_INTERACTIVE_MAX_WAIT", "2.0"))),
+   Lane("bulk", 1, max_concurrency=max(1, ADMISSION_CAPACITY // 2), max_queue=256,
+        max_wait=float(os.getenv("ADMISSION_BULK_MAX_WAIT", "60"))),
+   Lane("feedback", 2, max_concurrency=1, max_queue=32,
+        max_wait=float(os.getenv("ADMISSION_FEEDBACK_MAX_WAIT", "300"))),
+   Lane("evaluation", 3, max_concurrency=1, max_queue=4)
+]
+
+# Per-request deadline for /predict/: the client's `X-Request-Timeout-Ms` header, else this default (0 = none).
+# Work is abandoned at the next stage once the deadline passes or the client disconnects.
+REQUEST_TIMEOUT_MS = float(os.getenv("REQUEST_TIMEOUT_MS", "0"))
+
+# Uploads are streamed in chunks: bodies over MAX_UPLOAD_BYTES are refused with 413 as they arrive,
+# and the copy kept for Supabase storage spills from memory to UPLOAD_SPOOL_DIR past UPLOAD_MEMORY_BYTES
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_MEMORY_BYTES = int(os.getenv("UPLOAD_MEMORY_BYTES", str(1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR")  # Default: the system temp directory
+app.add_middleware(MaxBodySizeMiddleware, max_bytes=MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES, paths=("/predict/", "/feedback/"))
+
+# On-disk embedding store backing /similar/{prediction_id}
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "embedding_store")
+
+# Preprocessed images of recent predictions (150 KB each), so /feedback/ needs only the prediction_id;
+# older predictions are re-fetched from the storage bucket
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "2000"))
+
+# Inference precision: "fp32" (default), "bf16", or "auto" (bf16 only if the CPU supports it natively)
+INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", "fp32").lower()
+
 # Device configuration
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
 
 # Initialize model at startup to avoid loading it on each request
 model = None
+# Resolved from INFERENCE_PRECISION at startup
+use_bf16 = False
+# Test-set evaluation services, keyed by test data directory
+evaluation_services = {}
+# Head-only fine-tuning state (FINE_TUNE_MODE == "head")
+embedding_cache = EmbeddingCache(max_items=EMBEDDING_CACHE_SIZE)
+head_tuner = HeadFineTuner(learning_rate=HEAD_FINE_TUNE_LEARNING_RATE, max_samples=HEAD_FINE_TUNE_MAX_SAMPLES)
+# Persistent embeddings of every prediction, opened at startup
+embedding_store = None
+# Preprocessed images of recent predictions for feedback, opened at startup
+image_cache = None
+# Disk-backed replay memory for full fine-tuning, opened at startup
+replay_buffer = None
+# Candidate evaluation / promotion, created at startup when enabled
+promotion_gate = None
+# Test-time augmentation view selection and saturation tracking
+tta_controller = TTAController(num_views=TTA_VIEWS, latency_budget_ms=TTA_LATENCY_BUDGET_MS, max_inflight=TTA_MAX_INFLIGHT)
+inflight_predictions = 0
+# Distilled screening model for two-tier triage, loaded at startup when configured
+student_model = None
+# Two-tier predictions answered by the student ('screened') or escalated, per predicted class
+triage_counts = {outcome: {name: 0 for name in CLASS_NAMES} for outcome in ('screened', 'escalated')}
+# Early-exit predictions served, per exit and predicted class
+early_exit_counts = {exit_name: {name: 0 for name in CLASS_NAMES} for exit_name in DenseNetSE.EXITS}
+# Priority lanes for prediction, feedback and evaluation work
+admission = AdmissionController(ADMISSION_CAPACITY, ADMISSION_LANES)
+# Predictions abandoned because the client went away or the deadline passed, per reason and stage
+cancelled_counts = {reason: {stage: 0 for stage in STAGES} for reason in REASONS}
+# Feedback fine-tuning runs one candidate at a time, always branching from the served model
+retrain_lock = asyncio.Lock()
 # Define criterion globally for reuse
 criterion = nn.CrossEntropyLoss()
 
@@ -80,225 +226,141 @@ transform = transforms.Compose([
 ])
 
 
-# Squeeze and Excitation Block
-class SEBlock(nn.Module):
-   def __init__(self, channel, reduction=16):
-       super(SEBlock, self).__init__()
-       self.avg_pool = nn.AdaptiveAvgPool2d(1)
-       self.fc = nn.Sequential(
-           nn.Linear(channel, channel // reduction, bias=False),
-           nn.ReLU(inplace=True),
-           nn.Linear(channel // reduction, channel, bias=False),
-           nn.Sigmoid()
-       )
-
-
-   def forward(self, x):
-       b, c, _, _ = x.size()
-       y = self.avg_pool(x).view(b, c)
-       y = self.fc(y).view(b, c, 1, 1)
-       return x * y.expand_as(x)
+def bf16_supported():
+   """Whether the inference device has native bfloat16 support (AVX512-BF16/AMX on CPU)."""
+   if device.type == 'cuda':
+       return torch.cuda.is_bf16_supported()
+   try:
+       return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+   except (AttributeError, RuntimeError):
+       pass
+   try:
+       with open('/proc/cpuinfo') as f:
+           flags = f.read()
+       return 'avx512_bf16' in flags or 'amx_bf16' in flags
+   except OSError:
+       return False
 
 
-# Modified DenseNet with SE blocks
-class DenseNetSE(nn.Module):
-   def __init__(self, num_classes=4):
-       super(DenseNetSE, self).__init__()
-       # Load pretrained DenseNet
-       densenet = models.densenet121(pretrained=False)
-      
-       # Get the features (all layers except the classifier)
-       self.features = densenet.features
-      
-       # Add SE blocks after each dense block
-       self.se1 = SEBlock(256)    # After first dense block
-       self.se2 = SEBlock(512)    # After second dense block
-       self.se3 = SEBlock(1024)   # After third dense block
-       self.se4 = SEBlock(1024)   # After fourth dense block
-      
-       # Classifier
-       self.classifier = nn.Sequential(
-           nn.Linear(1024, 512),
-           nn.ReLU(),
-           nn.Dropout(0.2),
-           nn.Linear(512, num_classes)
-       )
-      
-   def forward(self, x):
-       # First dense block
-       x = self.features.conv0(x)
-       x = self.features.norm0(x)
-       x = self.features.relu0(x)
-       x = self.features.pool0(x)
-       x = self.features.denseblock1(x)
-       x = self.se1(x)
-       x = self.features.transition1(x)
-      
-       # Second dense block
-       x = self.features.denseblock2(x)
-       x = self.se2(x)
-       x = self.features.transition2(x)
-      
-       # Third dense block
-       x = self.features.denseblock3(x)
-       x = self.se3(x)
-       x = self.features.transition3(x)
-      
-       # Fourth dense block
-       x = self.features.denseblock4(x)
-       x = self.se4(x)
-       x = self.features.norm5(x)
-      
-       x = F.adaptive_avg_pool2d(x, (1, 1))
-       x = torch.flatten(x, 1)
-       x = self.classifier(x)
-      
-       return x
+def inference_autocast():
+   """bfloat16 autocast for the model forward when enabled, otherwise a no-op."""
+   if not use_bf16:
+       return contextlib.nullcontext()
+   return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
 
 
 def load_model(model_path):
    """Load the saved model from a .pth file"""
-   checkpoint = torch.load(model_path, map_location=device)
-  
-   model = DenseNetSE(num_classes=4)
-  
-   # Handle different saved model formats
-   if 'model_state_dict' in checkpoint:
-       model.load_state_dict(checkpoint['model_state_dict'])
-   else:
-       model.load_state_dict(checkpoint)
-  
-   return model
+   return load_densenet_se(model_path, map_location=device, num_classes=len(CLASS_NAMES))
 
 
 @app.on_event("startup")
 async def startup_event():
    """Load model on startup."""
-   global model
+   global model, use_bf16, embedding_store, image_cache, replay_buffer, promotion_gate, student_model
    try:
        model = load_model(MODEL_PATH)
        model = model.to(device)
        model.eval()
        print("Model loaded successfully")
+
+       if FINE_TUNE_MODE == "head":
+           freeze_backbone(model)
+           print("Head-only fine-tuning enabled: features and SE blocks frozen")
+
+       if INFERENCE_PRECISION in ("bf16", "auto"):
+           use_bf16 = bf16_supported()
+           if INFERENCE_PRECISION == "bf16" and not use_bf16:
+               print("Warning: bf16 inference requested but not supported on this device; using fp32")
+       print(f"Inference precision: {'bf16' if use_bf16 else 'fp32'}")
+       if STUDENT_MODEL_PATH:
+           student_model = load_student(STUDENT_MODEL_PATH, map_location=device, num_classes=len(CLASS_NAMES)).to(device)
+           student_model.eval()
+           print(f"Two-tier triage enabled: student escalates below confidence {STUDENT_CONFIDENCE_THRESHOLD}")
+
+       if model.exit_heads:
+           print(f"Early-exit heads available (threshold {EARLY_EXIT_THRESHOLD}, default {'on' if EARLY_EXIT_DEFAULT else 'off'})")
+
+       embedding_store = EmbeddingStore(EMBEDDING_STORE_DIR, dim=model.classifier[0].in_features)
+       print(f"Embedding store: {len(embedding_store)} embeddings ({embedding_store.backend})")
+
+       image_cache = ImageCache(IMAGE_CACHE_DIR, capacity=IMAGE_CACHE_SIZE)
+       print(f"Image cache: {len(image_cache)} of {IMAGE_CACHE_SIZE} preprocessed images")
+
+       replay_buffer = ReplayBuffer(REPLAY_BUFFER_DIR, len(CLASS_NAMES),
+                                    feedback_per_class=REPLAY_FEEDBACK_PER_CLASS,
+                                    reservoir_per_class=REPLAY_RESERVOIR_PER_CLASS)
+       if REPLAY_TRAIN_DATA_DIR and os.path.isdir(REPLAY_TRAIN_DATA_DIR):
+           # Decoding the training split takes a while; don't hold up startup
+           threading.Thread(target=replay_buffer.fill_reservoir, args=(REPLAY_TRAIN_DATA_DIR, CLASS_NAMES), daemon=True).start()
+       print(f"Replay buffer: {replay_buffer.stats()}")
+
+       if PROMOTION_GATE_ENABLED and not os.path.isdir(API_TEST_DATA_DIR):
+           # Every candidate evaluation would fail and be rejected, and the reserved cores would sit idle
+           print(f"Warning: Promotion gate disabled: test data directory '{API_TEST_DATA_DIR}' not found "
+                 f"(set API_TEST_DATA_DIR); fine-tuned weights are served without evaluation gating")
+       elif PROMOTION_GATE_ENABLED:
+           serving_cores, eval_cores = split_cores(EVAL_CPU_CORES)
+           if serving_cores:
+               # Keep serving off the evaluation cores so candidate evaluation can't steal them
+               os.sched_setaffinity(0, serving_cores)
+               torch.set_num_threads(len(serving_cores))
+           promotion_gate = PromotionGate(ModelRegistry(MODEL_VERSIONS_DIR), API_TEST_DATA_DIR, CLASS_NAMES,
+                                          eval_cores=eval_cores, max_regression=PROMOTION_MAX_REGRESSION,
+                                          max_total_regression=PROMOTION_MAX_TOTAL_REGRESSION,
+                                          time_budget=PROMOTION_TIME_BUDGET, batch_size=EVAL_BATCH_SIZE,
+                                          keep_checkpoints=MODEL_VERSIONS_KEEP)
+           print(f"Promotion gate enabled (serving cores: {serving_cores}, evaluation cores: {eval_cores})")
    except Exception as e:
        print(f"Error loading model: {e}")
        raise RuntimeError(f"Failed to load model: {e}")
 
 
-async def store_image_and_prediction(image_data, filename, prediction, confidence, all_confidences, speed, user_id=None):
-    """Store image and prediction in Supabase"""
+async def store_image_and_prediction(image_data, filename, prediction, confidence, all_confidences, speed, user_id=None, sha256=None):
+    """Store image and prediction with the persistence backend. `image_data` may be bytes or a binary file."""
     try:
         # Generate a unique ID for this prediction
         prediction_id = str(uuid.uuid4())
         
-        # Generate a unique filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_extension = os.path.splitext(filename)[1]
-        unique_filename = f"{timestamp}_{prediction_id}{file_extension}"
-        
-        # Upload image to Supabase Storage
-        storage_path = f"{unique_filename}"
-        
-        # Upload the image to Supabase storage
-        res = supabase.storage.from_("lung-scan-images").upload(
-            path=storage_path,
-            file=image_data,
-            file_options={"content-type": "image/jpeg"}  # Adjust if needed for different image types
-        )
-        
-        # Get the public URL for the uploaded image
-        image_url = supabase.storage.from_("lung-scan-images").get_public_url(storage_path)
-        
-        # Store prediction data in Supabase database
+        # Store the image, then the prediction row with its image URL
         data = {
             "id": prediction_id,
-            "image_url": image_url,
             "prediction": prediction,
             "confidence": confidence,
             "speed": speed,  # Add speed here
             "user_id": user_id  # Now we can include the user_id
         }
-        
-        # Insert data into the predictions table
-        result = supabase.table("predictions").insert(data).execute()
+        await persistence.save_prediction(data, image_data, filename, sha256)
         
         return prediction_id
         
     except Exception as e:
-        print(f"Error storing data in Supabase: {e}")
+        print(f"Error storing data ({persistence.name}): {e}")
         # Print more detailed error info for debugging
         import traceback
         traceback.print_exc()
         raise e
 
 
-async def evaluate_api_model(current_model, test_data_dir, device_to_use, transform_to_use):
+def get_evaluation_service(test_data_dir):
+    """Evaluation services are cached per test directory so their tensor/feature caches survive between calls."""
+    service = evaluation_services.get(test_data_dir)
+    if service is None:
+        service = EvaluationService(test_data_dir, CLASS_NAMES, batch_size=EVAL_BATCH_SIZE)
+        evaluation_services[test_data_dir] = service
+    return service
+
+
+async def evaluate_api_model(current_model, test_data_dir, device_to_use):
     """
     Evaluates the current model on the API's test dataset.
-    Adapted from your training script's evaluate_model.
+    Preprocessed test images and pooled features are cached between calls
+    (see EvaluationService), so only what changed since the last evaluation
+    is recomputed. Runs in a worker thread to keep the event loop free.
     """
-    if not os.path.exists(test_data_dir) or not os.listdir(test_data_dir):
-        print(f"Warning: Test data directory '{test_data_dir}' is empty or does not exist. Skipping evaluation.")
-        return {"error": "Test data not found or empty."}
-
     try:
-        test_dataset = datasets.ImageFolder(test_data_dir, transform_to_use)
-        if not test_dataset.classes:
-             print(f"Warning: No classes found in '{test_data_dir}'. Check dataset structure. Skipping evaluation.")
-             return {"error": "No classes found in test dataset."}
-
-        test_dataloader = torch.utils.data.DataLoader(test_dataset, batch_size=EVAL_BATCH_SIZE, shuffle=False, num_workers=2) # Using 2 workers for API
-        
-        current_model.eval()
-        all_preds = []
-        all_labels = []
-
-        with torch.no_grad():
-            for inputs, labels in test_dataloader:
-                inputs = inputs.to(device_to_use)
-                outputs = current_model(inputs)
-                _, preds = torch.max(outputs, 1)
-                all_preds.extend(preds.cpu().numpy())
-                all_labels.extend(labels.cpu().numpy())
-        
-        if not all_labels: # Should not happen if dataset is not empty and has classes
-            print("Warning: No labels collected during evaluation. Skipping metrics calculation.")
-            return {"warning": "No data processed during evaluation."}
-
-        # Ensure CLASS_NAMES match the ones from ImageFolder
-        # For simplicity, we assume CLASS_NAMES defined globally is consistent with test_dataset.classes
-        # In a robust setup, you might want to use test_dataset.classes directly for metrics.
-        
-                
-        # Calculate metrics only if there are predictions
-        if all_preds:
-            precision, recall, f1, _ = precision_recall_fscore_support(all_labels, all_preds, average='weighted', zero_division=0)
-            accuracy = accuracy_score(all_labels, all_preds)
-            
-            per_class_precision, per_class_recall, per_class_f1, _ = precision_recall_fscore_support(all_labels, all_preds, average=None, labels=list(range(len(CLASS_NAMES))), zero_division=0)
-
-            metrics = {
-                "overall_accuracy": float(accuracy),
-                "overall_precision_weighted": float(precision),
-                "overall_recall_weighted": float(recall),
-                "overall_f1_weighted": float(f1),
-                "per_class_metrics": {}
-            }
-            for i, class_name in enumerate(CLASS_NAMES):
-                 if i < len(per_class_precision): # Check bounds
-                    metrics["per_class_metrics"][class_name] = {
-                        "precision": float(per_class_precision[i]),
-                        "recall": float(per_class_recall[i]),
-                        "f1_score": float(per_class_f1[i])
-                    }
-                 else: # Should not happen if CLASS_NAMES and dataset classes align
-                    metrics["per_class_metrics"][class_name] = {"precision": 0, "recall": 0, "f1_score": 0, "note": "Index out of bounds for metrics array"}
-
-            print(f"Evaluation complete. Accuracy: {accuracy:.4f}")
-            return metrics
-        else:
-            print("Warning: No predictions made during evaluation. Metrics cannot be calculated.")
-            return {"warning": "No predictions to evaluate."}
+        service = get_evaluation_service(test_data_dir)
+        return await run_in_threadpool(service.evaluate, current_model, device_to_use, inference_autocast)
 
     except Exception as e:
         print(f"Error during evaluation: {e}")
@@ -307,57 +369,218 @@ async def evaluate_api_model(current_model, test_data_dir, device_to_use, transf
         return {"error": f"Evaluation failed: {str(e)}"}
 
 
-async def retrain_and_evaluate_task(image_bytes: bytes, correct_label_str: str, prediction_id: str):
+def compute_embedding(image_uint8):
+    """Pooled 1024-d DenseNetSE embedding of a preprocessed uint8 [3, 224, 224] image."""
+    img_tensor = normalize_uint8(image_uint8.unsqueeze(0)).to(device)
+    with torch.no_grad():
+        with inference_autocast():
+            features = model.forward_features(img_tensor)
+    return features[0].float()
+
+
+def preprocess_for_prediction(image, num_views):
+    """Decoded PIL image -> (uint8 [3, 224, 224] kept for feedback, normalised input batch of `num_views` views)."""
+    image_uint8 = image_to_uint8(image.convert("RGB"))
+    if num_views > 1:
+        return image_uint8, build_views(image_uint8, num_views).to(device)
+    return image_uint8, normalize_uint8(image_uint8.unsqueeze(0)).to(device)
+
+
+def run_inference(img_tensor, use_early_exit, use_student):
+    """
+    Forward pass for /predict/: student screening, early exit or the full
+    model. Returns (class probabilities averaged over the views, exit name,
+    pooled embedding or None).
+    """
+    with torch.no_grad():
+        with inference_autocast():
+            screened = False
+            if use_student:
+                outputs = student_model(img_tensor)
+                screened = F.softmax(outputs.float(), dim=1).max().item() >= STUDENT_CONFIDENCE_THRESHOLD
+            if screened:
+                exit_name, embedding = 'student', None
+            elif use_early_exit:
+                outputs, exit_name, embedding = model.forward_early_exit(img_tensor, EARLY_EXIT_THRESHOLD)
+            else:
+                embedding = model.forward_features(img_tensor)
+                outputs = model.classifier(embedding)
+                exit_name = 'final'
+        # Average softmax over the views (view 0 is the original image)
+        probs = F.softmax(outputs.float(), dim=1).mean(dim=0)
+    return probs, exit_name, embedding
+
+
+async def run_in_threadpool_held(func, *args):
+    """
+    run_in_threadpool, but if the caller is cancelled (deadline, disconnect)
+    the cancellation waits for the thread to finish, so the admission slot
+    isn't handed to another request while this work still occupies a core.
+    """
+    future = asyncio.ensure_future(run_in_threadpool(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+def decode_to_uint8(image_bytes):
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return image_to_uint8(image)
+
+
+async def resolve_feedback_image(prediction_id):
+    """
+    Preprocessed uint8 image of a past prediction: from the local image
+    cache, else fetched from the persistence backend's stored image (and
+    cached). Returns None if it can't be found.
+    """
+    image_uint8 = image_cache.get(prediction_id)
+    if image_uint8 is not None:
+        return image_uint8
+
+    image_bytes = await persistence.fetch_image(prediction_id)
+    if image_bytes is None:
+        return None
+    image_uint8 = await run_in_threadpool(decode_to_uint8, image_bytes)
+    image_cache.put(prediction_id, image_uint8)
+    return image_uint8
+
+
+def fine_tune_full(net, image_uint8, label_idx, prediction_id):
+    """
+    Fine-tune the whole of `net` on class-balanced replay mini-batches that
+    include the new sample. Returns the mean loss.
+    """
+    # 1. Keep the new (preprocessed) image in the replay buffer
+    replay_buffer.add_feedback(prediction_id, image_uint8, label_idx)
+
+    # 2. Fine-tune the model on replay batches
+    # Use the same optimizer type as in your training script
+    optimizer = optim.Adam(net.parameters(), lr=FINE_TUNE_LEARNING_RATE)
+    
+    net.train()  # Set model to training mode
+    total_loss = torch.zeros((), device=device)
+    for step in range(REPLAY_STEPS):
+        include = (image_uint8, label_idx) if step == 0 else None
+        images, targets = replay_buffer.sample_batch(REPLAY_BATCH_SIZE, include=include)
+        inputs = normalize_uint8(images).to(device)
+        targets = targets.to(device)
+
+        optimizer.zero_grad()
+        outputs = net(inputs)
+        loss = criterion(outputs, targets) # Use global criterion
+        loss.backward()
+        optimizer.step()
+        total_loss += loss.detach()
+    net.eval()  # Set model back to evaluation mode
+    return (total_loss / REPLAY_STEPS).item()
+
+
+def fine_tune_head(net, image_uint8, label_idx, prediction_id):
+    """Train only the classifier of `net` on accumulated feedback embeddings. Returns the mean loss."""
+    embedding = embedding_cache.get(prediction_id)
+    if embedding is None:
+        if image_uint8 is None:
+            raise ValueError(f"No cached embedding or image available for prediction {prediction_id}")
+        embedding = compute_embedding(image_uint8)
+    head_tuner.add(prediction_id, embedding, label_idx)
+    return head_tuner.fine_tune(net.classifier, device)
+
+
+def save_model_atomic(net, path):
+    """Write weights to a temp file and rename, so a crash never leaves a truncated MODEL_PATH."""
+    tmp_path = f"{path}.tmp"
+    torch.save(net.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+
+
+async def retrain_and_evaluate_task(image_uint8: Optional[torch.Tensor], correct_label_str: str, prediction_id: str):
     """
     Background task to fine-tune the model with a new sample and evaluate it.
+    `image_uint8` is the preprocessed 224x224 image (150 KB, not the
+    upload); when None it is resolved from the image cache or storage,
+    unless head-only mode still has the prediction's embedding cached.
     """
     global model # We are modifying the global model
 
     try:
         print(f"Background task started for prediction ID: {prediction_id}, Label: {correct_label_str}")
-        
-        # 1. Preprocess the new image
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        img_tensor = transform(image).unsqueeze(0).to(device)
 
-        # 2. Convert correct_label to target tensor
         if correct_label_str not in CLASS_NAMES:
             print(f"Error: Invalid label '{correct_label_str}' provided for retraining.")
             return
         
         label_idx = CLASS_NAMES.index(correct_label_str)
-        target = torch.tensor([label_idx], dtype=torch.long).to(device)
-
-        # 3. Fine-tune the model (one step)
-        # Use the same optimizer type as in your training script
-        optimizer = optim.Adam(model.parameters(), lr=FINE_TUNE_LEARNING_RATE)
-        
-        model.train()  # Set model to training mode
-        optimizer.zero_grad()
-        outputs = model(img_tensor)
-        loss = criterion(outputs, target) # Use global criterion
-        loss.backward()
-        optimizer.step()
-        model.eval()  # Set model back to evaluation mode
-
-        print(f"Model fine-tuned for {prediction_id}. Loss: {loss.item():.4f}")
-
-        # 4. Save the updated model state (overwrites the existing model)
-        # Consider model versioning for production
-        torch.save(model.state_dict(), MODEL_PATH)
-        print(f"Updated model saved to {MODEL_PATH}")
-
-        # 5. Evaluate the updated model (Commented out as per request)
-        # print(f"Starting evaluation of the fine-tuned model...")
-        # eval_metrics = await evaluate_api_model(model, API_TEST_DATA_DIR, device, transform)
-        # print(f"Evaluation metrics for fine-tuned model: {eval_metrics}")
 
+        if image_uint8 is None and not (FINE_TUNE_MODE == "head" and prediction_id in embedding_cache):
+            image_uint8 = await resolve_feedback_image(prediction_id)
+            if image_uint8 is None:
+                print(f"Error: No cached or stored image found for prediction {prediction_id}; skipping fine-tuning.")
+                return
+
+        # retrain_lock serialises candidates, so each one starts from the last promoted weights;
+        # the feedback slot is held only while fine-tuning uses this process's cores
+        async with retrain_lock:
+            async with admission.admit("feedback"):
+                # Fine-tune a copy so the served model is untouched until promotion
+                candidate = await run_in_threadpool(copy.deepcopy, model)
+
+                if FINE_TUNE_MODE == "head":
+                    loss = await run_in_threadpool(fine_tune_head, candidate, image_uint8, label_idx, prediction_id)
+                    print(f"Classifier head fine-tuned on {len(head_tuner)} feedback embeddings for {prediction_id}. Loss: {loss:.4f}")
+                else:
+                    loss = await run_in_threadpool(fine_tune_full, candidate, image_uint8, label_idx, prediction_id)
+                    print(f"Model fine-tuned for {prediction_id} on replay batches ({replay_buffer.stats()}). Loss: {loss:.4f}")
+
+            if promotion_gate is not None:
+                # Evaluate in the worker process on its own pinned cores, within the time budget;
+                # those cores are its limit, so no admission slot is taken from the API
+                promoted, entry = await run_in_threadpool(promotion_gate.consider, candidate, MODEL_PATH, f"feedback {prediction_id}")
+                print(f"Candidate {entry['version']} {'promoted' if promoted else 'rejected'}: {entry['reason']}")
+                print(f"Evaluation metrics for candidate: {entry['metrics']}")
+                if not promoted:
+                    return
+            
+            # Swap in the new weights (a reference swap, so in-flight predictions finish on the old model)
+            model = candidate
+
+            # Save the updated model state (overwrites the existing model)
+            await run_in_threadpool(save_model_atomic, model, MODEL_PATH)
+            print(f"Updated model saved to {MODEL_PATH}")
+
+        if promotion_gate is None:
+            # Evaluate the updated model (incremental, cached test tensors/features) in the evaluation lane
+            print(f"Starting evaluation of the fine-tuned model...")
+            try:
+                async with admission.admit("evaluation"):
+                    eval_metrics = await evaluate_api_model(candidate, API_TEST_DATA_DIR, device)
+            except AdmissionRejected as e:
+                print(f"Skipped evaluation of the fine-tuned model for {prediction_id}: {e}")
+                return
+            print(f"Evaluation metrics for fine-tuned model: {eval_metrics}")
+
+    except AdmissionRejected as e:
+        print(f"Skipped fine-tuning for {prediction_id}: {e}")
     except Exception as e:
         print(f"Error in background retraining/evaluation task for {prediction_id}: {e}")
         import traceback
         traceback.print_exc()
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+   """Persist the similarity index and stop the evaluation worker."""
+   if embedding_store is not None:
+       embedding_store.save_index()
+   if image_cache is not None:
+       image_cache.flush()
+   await persistence.aclose()
+   if promotion_gate is not None:
+       promotion_gate.shutdown()
+
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
    """Serve a simple HTML page with an upload form."""
@@ -487,33 +710,64 @@ async def read_root():
 
 @app.post("/predict/")
 async def predict(
+    request: Request,
     file: UploadFile = File(...),
-    user_id: Optional[str] = Form(None)  # Added user_id as an optional form parameter
+    user_id: Optional[str] = Form(None),  # Added user_id as an optional form parameter
+    tta: Optional[bool] = Form(None),  # Test-time augmentation; defaults to TTA_DEFAULT
+    early_exit: Optional[bool] = Form(None),  # Confidence-threshold early exit; defaults to EARLY_EXIT_DEFAULT
+    two_tier: Optional[bool] = Form(None),  # Student screening; on by default when a student is loaded
+    x_request_priority: Optional[str] = Header(None),  # "bulk" for batch imports; interactive otherwise
+    x_request_timeout_ms: Optional[float] = Header(None)  # Client's deadline, relative; defaults to REQUEST_TIMEOUT_MS
 ):
    """
-   Make a prediction on the uploaded image and store in Supabase.
+   Make a prediction on the uploaded image and store it (Supabase or the local backend).
    Returns the predicted class and confidence score.
+   With TTA, softmax is averaged over up to TTA_VIEWS flipped/rotated/shifted
+   views run as one batch; fewer views are used to stay within the latency
+   budget, and a single view when the server is saturated.
+   With early exit (checkpoints with exit heads, no TTA), the prediction
+   comes from the first exit whose confidence reaches EARLY_EXIT_THRESHOLD;
+   no embedding is stored for predictions that exit before the last block.
+   In two-tier mode (STUDENT_MODEL_PATH, no TTA) the distilled student
+   answers when it is confident and only uncertain images reach DenseNetSE.
+   Decode and inference are admitted through the interactive (or bulk)
+   lane; a request that can't get a slot in time gets 503 with Retry-After.
+   If the client disconnects or its deadline passes, the request is dropped
+   at the next stage (admission, decode, inference, persistence) with 499
+   or 504, and nothing is persisted.
+   The upload is streamed once through the size limit, a sha256 and PIL's
+   incremental decoder; the storage copy is spooled to disk when large.
    """
+   global inflight_predictions
+
    if not file.content_type.startswith("image/"):
        raise HTTPException(status_code=400, detail="Uploaded file is not an image")
   
+   inflight_predictions += 1
+   upload = None
    try:
        start_time = time.time() # Record start time
-       # Read image
-       contents = await file.read()
-       image = Image.open(io.BytesIO(contents)).convert("RGB")
-       
-       # Create a copy of the contents for storage
-       image_for_storage = contents
+       lane = "bulk" if (x_request_priority or "").lower() == "bulk" else "interactive"
+       timeout_ms = REQUEST_TIMEOUT_MS if x_request_timeout_ms is None else x_request_timeout_ms
+       deadline = RequestDeadline(request, timeout_ms / 1000 if timeout_ms > 0 else None)
+       async with deadline, admission.admit(lane, deadline.deadline):
+           await deadline.checkpoint('decode')
+           # Stream, hash and decode the image
+           upload = await ingest_upload(file, MAX_UPLOAD_BYTES, UPLOAD_MEMORY_BYTES, UPLOAD_SPOOL_DIR)
       
-       # Preprocess image for model
-       img_tensor = transform(image).unsqueeze(0).to(device)
+           # Preprocess image for model (the uint8 image is kept for feedback)
+           use_tta = TTA_DEFAULT if tta is None else tta
+           num_views = tta_controller.choose_views(inflight_predictions) if use_tta else 1
+           image_uint8, img_tensor = await run_in_threadpool_held(preprocess_for_prediction, upload.image, num_views)
       
-       # Make prediction
-       with torch.no_grad():
-           outputs = model(img_tensor)
-           probs = F.softmax(outputs, dim=1)[0]
-          
+           await deadline.checkpoint('inference')
+           # Make prediction in a worker thread, so each admitted slot is a forward pass running in
+           # parallel and the event loop (deadline watcher, lane dispatch) stays responsive
+           forward_start = time.perf_counter()
+           use_early_exit = (EARLY_EXIT_DEFAULT if early_exit is None else early_exit) and model.exit_heads and not use_tta
+           use_student = student_model is not None and two_tier is not False and not use_tta
+           probs, exit_name, embedding = await run_in_threadpool_held(run_inference, img_tensor, use_early_exit, use_student)
+           
            # Get prediction and confidence
            prediction_idx = torch.argmax(probs).item()
            prediction = CLASS_NAMES[prediction_idx]
@@ -521,91 +775,137 @@ async def predict(
           
            # Get all confidences
            all_confidences = {CLASS_NAMES[i]: probs[i].item() for i in range(len(CLASS_NAMES))}
+           if use_tta:
+               tta_controller.observe(num_views, (time.perf_counter() - forward_start) * 1000)
+           if use_student:
+               triage_counts['screened' if exit_name == 'student' else 'escalated'][prediction] += 1
+           if use_early_exit and exit_name in early_exit_counts:
+               early_exit_counts[exit_name][prediction] += 1
        
        end_time = time.time() # Record end time
        processing_speed = end_time - start_time # Calculate processing speed
 
-       # Store image and prediction in Supabase with user_id
+       # Store image and prediction with user_id
+       await deadline.checkpoint('persistence')
        stored_id = await store_image_and_prediction(
-           image_for_storage, 
+           upload.storage_payload(), 
            file.filename, 
            prediction, 
            confidence, 
            all_confidences,
            processing_speed, # Pass the processing speed
-           user_id  # Pass the user_id to the store function
+           user_id,  # Pass the user_id to the store function
+           upload.sha256
        )
+
+       # Keep the preprocessed image so feedback needn't re-upload it
+       await run_in_threadpool(image_cache.put, stored_id, image_uint8)
+
+       if embedding is not None:
+           # Keep the pooled embedding for head-only feedback fine-tuning
+           if FINE_TUNE_MODE == "head":
+               embedding_cache.put(stored_id, embedding[0].float())
+
+           # Persist the embedding for similar-case search
+           await run_in_threadpool(embedding_store.add, stored_id, embedding[0].float().cpu().numpy())
           
        return {
            "prediction": prediction,
            "confidence": confidence,
            "all_confidences": all_confidences,
            "stored_id": stored_id,
-           "speed": processing_speed  # Return processing speed
+           "speed": processing_speed,  # Return processing speed
+           "tta_views": num_views,
+           "exit": exit_name
        }
   
+   except AdmissionRejected as e:
+       if deadline.remaining() is not None and deadline.remaining() <= 0:
+           # The request's own deadline ran out while it was queued
+           cancelled_counts['deadline']['admission'] += 1
+           raise HTTPException(status_code=504, detail=f"Prediction cancelled: deadline during admission")
+       raise HTTPException(status_code=503, detail=f"Server busy: {e}",
+                           headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+   except UploadTooLarge as e:
+       raise HTTPException(status_code=413, detail=f"Upload too large: {e}")
+   except CircuitOpen as e:
+       raise HTTPException(status_code=503, detail=f"Storage unavailable: {e}",
+                           headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+   except RequestCancelled as e:
+       cancelled_counts[e.reason][e.stage] += 1
+       # 499: client closed request (nobody is listening); 504 for a missed deadline
+       raise HTTPException(status_code=504 if e.reason == 'deadline' else 499, detail=f"Prediction cancelled: {e}")
    except Exception as e:
        raise HTTPException(status_code=500, detail=f"Error predicting image: {str(e)}")
+   finally:
+       inflight_predictions -= 1
+       if upload is not None:
+           upload.close()
 
 
 @app.post("/feedback/")
 async def feedback_and_retrain(
     background_tasks: BackgroundTasks, # Inject BackgroundTasks
-    file: UploadFile = File(...),
     prediction_id: str = Form(...),
-    correct_label: str = Form(...)
+    correct_label: str = Form(...),
+    file: Optional[UploadFile] = File(None)  # Optional: the image is normally resolved from the prediction
 ):
     """
     Accepts feedback (correct label) for a prediction,
     updates the Supabase record, and queues a background task
     for model fine-tuning and evaluation.
+    Only prediction_id and correct_label are needed: the training image
+    comes from the image cache filled at prediction time, or the storage
+    bucket for older predictions. An uploaded file, if sent, is used instead.
     """
-    if not file.content_type.startswith("image/"):
+    if file is not None and not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Uploaded file is not an image.")
 
     if correct_label not in CLASS_NAMES:
         raise HTTPException(status_code=400, detail=f"Invalid label. Must be one of: {CLASS_NAMES}")
 
     try:
-        image_bytes = await file.read() # Read file content once
-
-        # 1. Update Supabase record (synchronously)
-        db_response = supabase.table("predictions").select("prediction").eq("id", prediction_id).execute()
-        
-        db_update_message = f"Supabase record with ID {prediction_id} not found."
-        updated_db_status = False
-
-        if db_response.data:
-            current_prediction_in_db = db_response.data[0]['prediction']
-            if current_prediction_in_db != correct_label:
-                update_response = supabase.table("predictions").update({"prediction": correct_label}).eq("id", prediction_id).execute()
-                # Basic check, Supabase client might raise error on failure
-                if update_response.data or (hasattr(update_response, 'status_code') and 200 <= update_response.status_code < 300):
-                    db_update_message = f"Supabase record {prediction_id} updated: old_label='{current_prediction_in_db}', new_label='{correct_label}'."
-                    updated_db_status = True
-                else:
-                    db_update_message = f"Supabase record {prediction_id} update may have failed. Old: '{current_prediction_in_db}', New: '{correct_label}'."
-            else:
-                db_update_message = f"Supabase record {prediction_id} already has the correct label '{correct_label}'. No update needed."
-                updated_db_status = True # Considered successful as no change needed
-        else:
+        # Head-only mode trains on the embedding cached at prediction time, so the upload needn't be read or decoded
+        image_uint8 = None
+        if file is not None and not (FINE_TUNE_MODE == "head" and prediction_id in embedding_cache):
+            # Stream and decode without keeping the upload; only the 224x224 uint8 image goes to the background task
+            with await ingest_upload(file, MAX_UPLOAD_BYTES, UPLOAD_MEMORY_BYTES, keep=False) as upload:
+                image_uint8 = image_to_uint8(upload.image)
+
+        # 1. Update the prediction record and feedback history (one round trip)
+        record = await persistence.record_feedback(prediction_id, correct_label)
+
+        if record is None:
+            db_update_message = f"Supabase record with ID {prediction_id} not found."
+            updated_db_status = False
             # Optionally, raise HTTPException if record must exist for feedback
             print(f"Warning: Prediction ID {prediction_id} not found in database for feedback.")
-
+        elif record["updated"]:
+            db_update_message = f"Supabase record {prediction_id} updated: old_label='{record['previous_label']}', new_label='{correct_label}'."
+            updated_db_status = True
+        else:
+            db_update_message = f"Supabase record {prediction_id} already has the correct label '{correct_label}'. No update needed."
+            updated_db_status = True # Considered successful as no change needed
 
         # 2. Add fine-tuning and evaluation to background tasks
-        background_tasks.add_task(retrain_and_evaluate_task, image_bytes, correct_label, prediction_id)
+        background_tasks.add_task(retrain_and_evaluate_task, image_uint8, correct_label, prediction_id)
         
         return {
             "message": "Feedback received. Model fine-tuning and evaluation initiated in the background.",
             "prediction_id": prediction_id,
             "correct_label": correct_label,
             "database_update_status": db_update_message,
+            "original_prediction": record["original_prediction"] if record else None,
             "database_record_updated_or_confirmed": updated_db_status
         }
 
     except HTTPException as e:
         raise e # Re-raise FastAPI/HTTP exceptions
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"Upload too large: {e}")
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=f"Storage unavailable: {e}",
+                            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
     except Exception as e:
         print(f"Error processing feedback for {prediction_id}: {e}")
         import traceback
@@ -613,6 +913,144 @@ async def feedback_and_retrain(
         raise HTTPException(status_code=500, detail=f"Error processing feedback: {str(e)}")
 
 
+@app.get("/similar/{prediction_id}")
+async def similar_cases(prediction_id: str, k: int = Query(5, ge=1, le=100)):
+    """
+    Return the k past scans whose DenseNetSE embeddings are most similar
+    (cosine) to the given prediction's, with their stored prediction rows.
+    """
+    query = embedding_store.get(prediction_id)
+    if query is None:
+        raise HTTPException(status_code=404, detail=f"No embedding stored for prediction {prediction_id}")
+
+    try:
+        neighbours = await run_in_threadpool(embedding_store.search, query, k, prediction_id)
+
+        rows = {}
+        if neighbours:
+            ids = [pid for pid, _ in neighbours]
+            rows = {row["id"]: row for row in await persistence.get_predictions(ids)}
+
+        results = []
+        for pid, similarity in neighbours:
+            row = rows.get(pid, {})
+            results.append({
+                "prediction_id": pid,
+                "similarity": similarity,
+                "image_url": row.get("image_url"),
+                "prediction": row.get("prediction"),
+                "confidence": row.get("confidence")
+            })
+
+        return {
+            "prediction_id": prediction_id,
+            "k": k,
+            "index": embedding_store.backend,
+            "results": results
+        }
+
+    except Exception as e:
+        print(f"Error searching similar cases for {prediction_id}: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error searching similar cases: {str(e)}")
+
+
+@app.get("/images/{name}")
+async def local_image(name: str):
+    """Images stored by the local persistence backend (their image_url points here)."""
+    path = persistence.image_path(name) if isinstance(persistence, LocalBackend) else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path)
+
+
+@app.get("/early-exit/stats")
+async def early_exit_stats():
+    """Live early-exit counters: predictions served per exit, overall and per predicted class."""
+    totals = {name: sum(early_exit_counts[exit_name][name] for exit_name in DenseNetSE.EXITS) for name in CLASS_NAMES}
+    total = sum(totals.values())
+    return {
+        "available": bool(model is not None and model.exit_heads),
+        "threshold": EARLY_EXIT_THRESHOLD,
+        "predictions": total,
+        "exit_rate": {exit_name: sum(early_exit_counts[exit_name].values()) / total if total else 0.0
+                      for exit_name in DenseNetSE.EXITS},
+        "per_class": {
+            name: {
+                "predictions": totals[name],
+                "exit_rate": {exit_name: early_exit_counts[exit_name][name] / totals[name] if totals[name] else 0.0
+                              for exit_name in DenseNetSE.EXITS}
+            }
+            for name in CLASS_NAMES
+        }
+    }
+
+
+@app.get("/triage/stats")
+async def triage_stats():
+    """Two-tier counters: how many predictions the student answered vs. escalated, per predicted class."""
+    screened = sum(triage_counts['screened'].values())
+    escalated = sum(triage_counts['escalated'].values())
+    return {
+        "enabled": student_model is not None,
+        "threshold": STUDENT_CONFIDENCE_THRESHOLD,
+        "screened": screened,
+        "escalated": escalated,
+        "escalation_rate": escalated / (screened + escalated) if screened + escalated else 0.0,
+        "per_class": {
+            name: {"screened": triage_counts['screened'][name], "escalated": triage_counts['escalated'][name]}
+            for name in CLASS_NAMES
+        }
+    }
+
+
+@app.get("/early-exit/report")
+async def early_exit_report(thresholds: str = Query("0.8,0.9,0.95,0.99")):
+    """
+    Per-class exit rates and accuracy vs. the full model on the API test set
+    for each confidence threshold (comma separated), to pick EARLY_EXIT_THRESHOLD.
+    """
+    try:
+        values = [float(t) for t in thresholds.split(',') if t.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="thresholds must be comma separated numbers")
+
+    service = get_evaluation_service(API_TEST_DATA_DIR)
+    try:
+        async with admission.admit("evaluation"):
+            report = await run_in_threadpool(service.early_exit_report, model, device, values, inference_autocast)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=f"Server busy: {e}",
+                            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    if "error" in report:
+        raise HTTPException(status_code=400, detail=report["error"])
+    return report
+
+
+
+@app.get("/admission/stats")
+async def admission_stats():
+    """Per-lane admission counters: running, queued, admitted, rejected and dropped work, mean service time."""
+    return admission.snapshot()
+
+
+@app.get("/persistence/stats")
+async def persistence_stats():
+    """Persistence backend in use; for Supabase, connection pool utilisation, retries, failures and circuit state."""
+    return persistence.stats()
+
+
+@app.get("/cancellation/stats")
+async def cancellation_stats():
+    """Predictions abandoned because the client disconnected or its deadline passed, per stage."""
+    return {
+        "default_timeout_ms": REQUEST_TIMEOUT_MS or None,
+        "cancelled": sum(sum(stages.values()) for stages in cancelled_counts.values()),
+        "by_reason": cancelled_counts
+    }
+
+
 if __name__ == "__main__":
    # Run the server
    uvicorn.run("api:app", host="0.0.0.0", port=5500, reload=True)
\ No newline at end of file
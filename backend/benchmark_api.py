@@ -0,0 +1,323 @@
+"""
+End-to-end benchmark of the API's /predict/ endpoint.
+
+    python benchmark_api.py --concurrency 1 4 16 --image-sizes 224 512 1024 --requests 200 \
+        --output results/api_benchmark.json [--baseline results/api_benchmark_main.json]
+
+The FastAPI app is driven in-process through httpx's ASGI transport, so
+no server or network is involved. Supabase is replaced by an in-memory
+fake with configurable per-call latency, or with --persistence local by
+the API's own SQLite + filesystem backend. Without --model-path a
+randomly initialised DenseNetSE checkpoint is used: timings are
+representative, predictions are not. State directories (embedding store,
+replay buffer, image cache, model versions) go to a temporary directory, and the
+promotion gate is off unless --promotion-gate is given.
+
+For every (image size, concurrency) pair the harness reports
+throughput, p50/p95/p99 latency, error count, peak/mean RSS and process
+CPU utilisation. With --baseline it exits non-zero when throughput drops
+or p95 latency grows by more than --tolerance against a previous
+results file.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+
+class FakeSupabase:
+    """
+    In-memory stand-in for the Supabase REST and storage endpoints the
+    API's client calls, served through httpx.MockTransport. Every call
+    waits `latency_ms` (without blocking the event loop, like a real
+    round trip on the async client). record_feedback answers PGRST202,
+    so feedback takes the select + update path.
+    """
+
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self.tables = {}
+        self.objects = {}
+        self.calls = 0
+
+    @staticmethod
+    def _matches(row, params):
+        for column, condition in params.items():
+            if column == 'select':
+                continue
+            op, _, value = condition.partition('.')
+            if op == 'eq' and str(row.get(column)) != value:
+                return False
+            if op == 'in' and str(row.get(column)) not in {v.strip('"') for v in value.strip('()').split(',')}:
+                return False
+        return True
+
+    async def handle(self, request):
+        import httpx
+
+        self.calls += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        path = request.url.path
+        if path.startswith('/storage/v1/object/'):
+            bucket_and_path = path[len('/storage/v1/object/'):]
+            if request.method == 'POST':
+                self.objects[bucket_and_path] = len(await request.aread())
+                return httpx.Response(200, json={'Key': bucket_and_path})
+            return httpx.Response(404, json={'error': 'not_found', 'message': 'Object not found'})
+
+        if path.startswith('/rest/v1/rpc/'):
+            return httpx.Response(404, json={'code': 'PGRST202', 'message': 'Could not find the function'})
+
+        rows = self.tables.setdefault(path[len('/rest/v1/'):], [])
+        params = dict(request.url.params)
+        if request.method == 'POST':
+            payload = json.loads(await request.aread())
+            rows.extend(payload if isinstance(payload, list) else [payload])
+            return httpx.Response(201)
+        matched = [row for row in rows if self._matches(row, params)]
+        if request.method == 'PATCH':
+            for row in matched:
+                row.update(json.loads(await request.aread()))
+        return httpx.Response(200, json=matched)
+
+
+def make_image(size, seed):
+    """Deterministic noisy grayscale 'scan' encoded as JPEG, size x size pixels."""
+    rng = np.random.default_rng(seed)
+    pixels = rng.normal(110, 40, (size, size)).clip(0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).convert('RGB').save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def current_rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def sample_rss(samples, stop, interval=0.05):
+    while not stop.is_set():
+        samples.append(current_rss_mb())
+        await asyncio.sleep(interval)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+async def run_load(client, image_bytes, concurrency, num_requests, form):
+    """Fire `num_requests` /predict/ calls with at most `concurrency` in flight."""
+    latencies, errors = [], []
+    queue = asyncio.Queue()
+    for i in range(num_requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            response = await client.post('/predict/', files={'file': ('scan.jpg', image_bytes, 'image/jpeg')}, data=form)
+            elapsed = time.perf_counter() - start
+            if response.status_code == 200:
+                latencies.append(elapsed * 1000)
+            else:
+                errors.append(response.status_code)
+
+    rss_samples, stop = [], asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(rss_samples, stop))
+    cpu_start, wall_start = os.times(), time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - wall_start
+    cpu_end = os.times()
+    stop.set()
+    await sampler
+
+    cpu_seconds = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    return {
+        'requests': num_requests,
+        'errors': len(errors),
+        'error_codes': sorted(set(errors)),
+        'wall_s': wall,
+        'throughput_rps': len(latencies) / wall if wall > 0 else 0.0,
+        'latency_ms': {
+            'mean': float(np.mean(latencies)) if latencies else None,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies) if latencies else None
+        },
+        'rss_mb': {
+            'peak': max(rss_samples) if rss_samples else current_rss_mb(),
+            'mean': float(np.mean(rss_samples)) if rss_samples else current_rss_mb()
+        },
+        # Process CPU time / wall time: 1.0 = one core fully busy
+        'cpu_utilization': cpu_seconds / wall if wall > 0 else 0.0,
+        'cpu_utilization_per_core': cpu_seconds / wall / (os.cpu_count() or 1) if wall > 0 else 0.0
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """List regressions of throughput / p95 latency beyond `tolerance` (fraction) for matching runs."""
+    previous = {(r['image_size'], r['concurrency']): r for r in baseline['results']}
+    regressions = []
+    for run in results['results']:
+        base = previous.get((run['image_size'], run['concurrency']))
+        if base is None or run['latency_ms']['p95'] is None or base['latency_ms']['p95'] is None:
+            continue
+        key = f"size={run['image_size']} concurrency={run['concurrency']}"
+        if run['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {base['throughput_rps']:.2f} -> {run['throughput_rps']:.2f} rps")
+        if run['latency_ms']['p95'] > base['latency_ms']['p95'] * (1 + tolerance):
+            regressions.append(f"{key}: p95 {base['latency_ms']['p95']:.1f} -> {run['latency_ms']['p95']:.1f} ms")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def import_api(args, state_dir):
+    """Import backend/api.py against the fake Supabase and throwaway state directories."""
+    os.environ.setdefault('SUPABASE_URL', 'https://fake.supabase.local')
+    os.environ.setdefault('SUPABASE_SERVICE_ROLE_KEY', 'benchmark')
+    os.environ['EMBEDDING_STORE_DIR'] = os.path.join(state_dir, 'embedding_store')
+    os.environ['REPLAY_BUFFER_DIR'] = os.path.join(state_dir, 'replay_buffer')
+    os.environ['IMAGE_CACHE_DIR'] = os.path.join(state_dir, 'image_cache')
+    os.environ['MODEL_VERSIONS_DIR'] = os.path.join(state_dir, 'model_versions')
+    os.environ['PERSISTENCE_BACKEND'] = args.persistence
+    os.environ['LOCAL_STORE_DIR'] = os.path.join(state_dir, 'local_store')
+    if not args.promotion_gate:
+        os.environ['PROMOTION_GATE'] = 'off'
+
+    fake = FakeSupabase(latency_ms=args.db_latency_ms)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import httpx
+    import supabase_http
+
+    # Same pool/retry/circuit settings as the API's client, but talking to the fake
+    client_class = supabase_http.AsyncSupabaseClient
+    supabase_http.AsyncSupabaseClient = lambda url, key, **options: client_class(
+        url, key, transport=httpx.MockTransport(fake.handle), **options)
+    import api
+
+    if args.model_path:
+        api.MODEL_PATH = args.model_path
+    else:
+        import torch
+        from densenet_se import DenseNetSE
+        torch.manual_seed(0)
+        api.MODEL_PATH = os.path.join(state_dir, 'random_densenet_se.pth')
+        torch.save(DenseNetSE(num_classes=len(api.CLASS_NAMES)).state_dict(), api.MODEL_PATH)
+    return api, fake
+
+
+async def benchmark(args):
+    import httpx
+    import torch
+
+    with tempfile.TemporaryDirectory(prefix='api_benchmark_') as state_dir:
+        api, fake = import_api(args, state_dir)
+        await api.startup_event()
+        form = dict(field.split('=', 1) for field in args.form)
+
+        results = {
+            'timestamp': datetime.now().isoformat(),
+            'git_commit': git_commit(),
+            'config': {
+                'requests': args.requests,
+                'warmup': args.warmup,
+                'db_latency_ms': args.db_latency_ms,
+                'persistence': args.persistence,
+                'form': form,
+                'model': args.model_path or 'random weights',
+                'torch_threads': torch.get_num_threads(),
+                'cpu_count': os.cpu_count(),
+                'inference_precision': api.INFERENCE_PRECISION
+            },
+            'results': []
+        }
+        transport = httpx.ASGITransport(app=api.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=None) as client:
+                for size in args.image_sizes:
+                    image_bytes = make_image(size, seed=size)
+                    await run_load(client, image_bytes, 1, args.warmup, form)
+                    for concurrency in args.concurrency:
+                        run = await run_load(client, image_bytes, concurrency, args.requests, form)
+                        run.update({'image_size': size, 'image_bytes': len(image_bytes), 'concurrency': concurrency})
+                        results['results'].append(run)
+                        latency = run['latency_ms']
+                        print(f"size {size:5d} concurrency {concurrency:3d}: {run['throughput_rps']:7.2f} rps, "
+                              f"p50 {latency['p50'] or 0:7.1f} ms, p95 {latency['p95'] or 0:7.1f} ms, "
+                              f"p99 {latency['p99'] or 0:7.1f} ms, peak RSS {run['rss_mb']['peak']:6.0f} MB, "
+                              f"CPU {run['cpu_utilization']:.2f} cores, errors {run['errors']}")
+        finally:
+            await api.shutdown_event()
+
+        results['supabase_calls'] = fake.calls
+        results['peak_rss_mb_process'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--image-sizes', type=int, nargs='+', default=[224, 512, 1024],
+                        help='Side length in pixels of the uploaded JPEGs')
+    parser.add_argument('--requests', type=int, default=100, help='Requests per (image size, concurrency) run')
+    parser.add_argument('--warmup', type=int, default=5, help='Sequential warm-up requests per image size')
+    parser.add_argument('--db-latency-ms', type=float, default=0.0, help='Simulated latency of each Supabase call')
+    parser.add_argument('--persistence', choices=['supabase', 'local'], default='supabase',
+                        help='Persistence backend: the fake Supabase, or the local SQLite + filesystem store')
+    parser.add_argument('--model-path', default=None, help='Checkpoint to serve (default: random DenseNetSE weights)')
+    parser.add_argument('--form', nargs='*', default=[], metavar='FIELD=VALUE',
+                        help='Extra /predict/ form fields, e.g. tta=true early_exit=true')
+    parser.add_argument('--promotion-gate', action='store_true', help='Leave the promotion gate (and core split) on; needs API_TEST_DATA_DIR')
+    parser.add_argument('--output', default=None, help='Write results as JSON to this path')
+    parser.add_argument('--baseline', default=None, help='Previous results JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed relative regression vs. --baseline')
+    args = parser.parse_args()
+
+    results = asyncio.run(benchmark(args))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
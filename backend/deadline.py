@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+
+# Points in a request's life at which undeliverable work is abandoned
+STAGES = ('admission', 'decode', 'inference', 'persistence')
+REASONS = ('deadline', 'disconnected')
+
+
+class RequestCancelled(Exception):
+    """The client went away or the request's deadline passed; `stage` is where the work was abandoned."""
+
+    def __init__(self, stage, reason):
+        super().__init__(f"{reason} during {stage}")
+        self.stage = stage
+        self.reason = reason
+
+
+class RequestDeadline:
+    """
+    Deadline and client-disconnect tracking for one request.
+
+    `timeout` is the client's budget in seconds, relative so client and
+    server clocks needn't agree (None = no deadline). Inside
+    `async with deadline:` a watcher polls for disconnect/expiry and
+    cancels the handler task, so awaits (an admission queue, a thread pool
+    call) are interrupted; the cancellation surfaces as RequestCancelled.
+    Synchronous work can't be interrupted, so handlers also call
+    `await deadline.checkpoint(stage)` between stages, which works inside
+    or outside the block.
+    """
+
+    def __init__(self, request, timeout=None, poll_interval=0.05):
+        self.request = request
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.poll_interval = poll_interval
+        self.stage = STAGES[0]
+        self.reason = None
+        self._task = None
+        self._watcher = None
+
+    def remaining(self):
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    async def _check(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return 'deadline'
+        if await self.request.is_disconnected():
+            return 'disconnected'
+        return None
+
+    async def _watch(self):
+        while True:
+            remaining = self.remaining()
+            await asyncio.sleep(self.poll_interval if remaining is None else max(0.0, min(self.poll_interval, remaining)))
+            reason = await self._check()
+            if reason:
+                self.reason = reason
+                self._task.cancel()
+                return
+
+    async def checkpoint(self, stage):
+        """Enter `stage`, raising RequestCancelled if the result can no longer be delivered."""
+        self.stage = stage
+        reason = self.reason or await self._check()
+        if reason:
+            self.reason = reason
+            raise RequestCancelled(stage, reason)
+
+    async def __aenter__(self):
+        self._task = asyncio.current_task()
+        self._watcher = asyncio.create_task(self._watch())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._watcher.cancel()
+        if self.reason is None or (exc_type is not None and not issubclass(exc_type, asyncio.CancelledError)):
+            return False
+        if exc_type is None:
+            # The watcher fired as the block finished; consume its pending cancellation here
+            try:
+                await asyncio.sleep(0)
+            except asyncio.CancelledError:
+                pass
+        self._task.uncancel()
+        raise RequestCancelled(self.stage, self.reason) from None
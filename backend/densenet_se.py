@@ -0,0 +1,193 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torchvision import models
+from torchvision.models.densenet import _DenseBlock, _Transition
+
+
+# DenseNet-121 layout: layers per dense block, growth rate, transition output channels
+BLOCK_LAYERS = (6, 12, 24, 16)
+GROWTH_RATE = 32
+TRANSITION_CHANNELS = (128, 256, 512)
+
+
+def block_channels(transition_channels=TRANSITION_CHANNELS):
+   """Output channels of the four dense blocks (256, 512, 1024, 1024 unpruned)."""
+   channels = [64 + GROWTH_RATE * BLOCK_LAYERS[0]]
+   for k, out_channels in enumerate(transition_channels):
+       channels.append(out_channels + GROWTH_RATE * BLOCK_LAYERS[k + 1])
+   return channels
+
+
+# Squeeze and Excitation Block
+class SEBlock(nn.Module):
+   def __init__(self, channel, reduction=16, hidden=None):
+       super(SEBlock, self).__init__()
+       hidden = hidden or channel // reduction
+       self.avg_pool = nn.AdaptiveAvgPool2d(1)
+       self.fc = nn.Sequential(
+           nn.Linear(channel, hidden, bias=False),
+           nn.ReLU(inplace=True),
+           nn.Linear(hidden, channel, bias=False),
+           nn.Sigmoid()
+       )
+
+
+   def forward(self, x):
+       b, c, _, _ = x.size()
+       y = self.avg_pool(x).view(b, c)
+       y = self.fc(y).view(b, c, 1, 1)
+       if torch.is_grad_enabled() or torch.promote_types(x.dtype, y.dtype) != x.dtype:
+           return x * y
+       # Inference: scale the dense block output in place. Broadcasting y gives
+       # bit-identical results to y.expand_as(x) without allocating a second
+       # feature map (x is the block's fresh torch.cat output, used nowhere else).
+       return x.mul_(y)
+
+
+# Lightweight classifier on an intermediate feature map (same layout as
+# models/DenseNet121withSE.py ExitHead, so trained exit weights load directly)
+class ExitHead(nn.Module):
+   def __init__(self, channel, num_classes):
+       super(ExitHead, self).__init__()
+       self.norm = nn.BatchNorm2d(channel)
+       self.fc = nn.Linear(channel, num_classes)
+
+   def forward(self, x):
+       x = F.relu(self.norm(x))
+       x = F.adaptive_avg_pool2d(x, (1, 1))
+       return self.fc(torch.flatten(x, 1))
+
+
+# Modified DenseNet with SE blocks
+class DenseNetSE(nn.Module):
+   EXITS = ('se2', 'se3', 'final')
+
+   def __init__(self, num_classes=4, exit_heads=False, transition_channels=None):
+       super(DenseNetSE, self).__init__()
+       # Load pretrained DenseNet
+       densenet = models.densenet121(pretrained=False)
+      
+       # Get the features (all layers except the classifier)
+       self.features = densenet.features
+
+       # Pruned models (models/Pruning.py) keep fewer transition output channels
+       self.transition_channels = tuple(transition_channels or TRANSITION_CHANNELS)
+       channels = block_channels(self.transition_channels)
+       if self.transition_channels != TRANSITION_CHANNELS:
+           for k, out_channels in enumerate(self.transition_channels, start=1):
+               setattr(self.features, f'transition{k}', _Transition(channels[k - 1], out_channels))
+               setattr(self.features, f'denseblock{k + 1}', _DenseBlock(BLOCK_LAYERS[k], out_channels, bn_size=4,
+                                                                        growth_rate=GROWTH_RATE, drop_rate=0))
+           self.features.norm5 = nn.BatchNorm2d(channels[3])
+      
+       # Add SE blocks after each dense block (bottleneck width fixed by the unpruned sizes)
+       unpruned = block_channels()
+       self.se1 = SEBlock(channels[0], hidden=unpruned[0] // 16)    # After first dense block
+       self.se2 = SEBlock(channels[1], hidden=unpruned[1] // 16)    # After second dense block
+       self.se3 = SEBlock(channels[2], hidden=unpruned[2] // 16)    # After third dense block
+       self.se4 = SEBlock(channels[3], hidden=unpruned[3] // 16)    # After fourth dense block
+      
+       # Classifier
+       self.classifier = nn.Sequential(
+           nn.Linear(channels[3], 512),
+           nn.ReLU(),
+           nn.Dropout(0.2),
+           nn.Linear(512, num_classes)
+       )
+
+       # Optional early exits after the second and third SE blocks
+       self.exit_heads = exit_heads
+       if exit_heads:
+           self.exit2 = ExitHead(channels[1], num_classes)
+           self.exit3 = ExitHead(channels[2], num_classes)
+
+   def _to_se2(self, x):
+       # First dense block
+       x = self.features.conv0(x)
+       x = self.features.norm0(x)
+       x = self.features.relu0(x)
+       x = self.features.pool0(x)
+       x = self.features.denseblock1(x)
+       x = self.se1(x)
+       x = self.features.transition1(x)
+      
+       # Second dense block
+       x = self.features.denseblock2(x)
+       return self.se2(x)
+
+   def _to_se3(self, x):
+       # Third dense block
+       x = self.features.transition2(x)
+       x = self.features.denseblock3(x)
+       return self.se3(x)
+
+   def _to_embedding(self, x):
+       # Fourth dense block
+       x = self.features.transition3(x)
+       x = self.features.denseblock4(x)
+       x = self.se4(x)
+       x = self.features.norm5(x)
+      
+       x = F.adaptive_avg_pool2d(x, (1, 1))
+       return torch.flatten(x, 1)
+      
+   def forward_features(self, x):
+       """Pooled embedding (1024-d unpruned): norm5 output after global average pooling."""
+       return self._to_embedding(self._to_se3(self._to_se2(x)))
+
+   def forward(self, x):
+       x = self.forward_features(x)
+       x = self.classifier(x)
+      
+       return x
+
+   def forward_all_exits(self, x):
+       """Logits of every exit in one pass: {'se2': ..., 'se3': ..., 'final': ...}. Requires exit heads."""
+       x = self._to_se2(x)
+       logits = {'se2': self.exit2(x)}
+       x = self._to_se3(x)
+       logits['se3'] = self.exit3(x)
+       logits['final'] = self.classifier(self._to_embedding(x))
+       return logits
+
+   def forward_early_exit(self, x, threshold):
+       """
+       Stop at the first exit whose max softmax probability reaches
+       `threshold` for every sample in the batch.
+       Returns (logits, exit name, embedding); the pooled embedding is only
+       available (otherwise None) when the full network ran.
+       """
+       x = self._to_se2(x)
+       logits = self.exit2(x)
+       if F.softmax(logits.float(), dim=1).max(dim=1).values.min() >= threshold:
+           return logits, 'se2', None
+
+       x = self._to_se3(x)
+       logits = self.exit3(x)
+       if F.softmax(logits.float(), dim=1).max(dim=1).values.min() >= threshold:
+           return logits, 'se3', None
+
+       embedding = self._to_embedding(x)
+       return self.classifier(embedding), 'final', embedding
+
+
+def architecture_kwargs(state_dict):
+   """DenseNetSE constructor options (exit heads, pruned transition widths) matching a saved state dict."""
+   return {
+       'exit_heads': any(k.startswith('exit2.') for k in state_dict),
+       'transition_channels': tuple(state_dict[f'features.transition{k}.conv.weight'].size(0) for k in (1, 2, 3))
+   }
+
+
+def load_densenet_se(model_path, map_location='cpu', num_classes=4):
+   """Build DenseNetSE and load weights saved either as a raw state dict or as {'model_state_dict': ...}."""
+   checkpoint = torch.load(model_path, map_location=map_location)
+  
+   # Handle different saved model formats
+   state_dict = checkpoint['model_state_dict'] if 'model_state_dict' in checkpoint else checkpoint
+
+   model = DenseNetSE(num_classes=num_classes, **architecture_kwargs(state_dict))
+   model.load_state_dict(state_dict)
+  
+   return model
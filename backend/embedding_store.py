@@ -0,0 +1,341 @@
+import os
+import json
+import threading
+from datetime import datetime
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # Optional: falls back to chunked NumPy brute-force search
+    faiss = None
+
+
+ID_WIDTH = 36  # str(uuid.uuid4())
+SEARCH_CHUNK_ROWS = 65536
+TRAIN_SAMPLE_ROWS = 100000  # Rows sampled from the memmap to train the IVF-PQ index
+ID_MERGE_ROWS = 4096  # Recently added ids kept in a dict before merging into the sorted order
+
+
+def _pq_subquantizers(dim, limit=64):
+    """Largest number of PQ sub-vectors (one byte each) up to `limit` that divides `dim`."""
+    return max(m for m in range(1, limit + 1) if dim % m == 0)
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk store of L2-normalised prediction embeddings.
+
+    - embeddings.f16: raw float16 rows (2 KB per 1024-d embedding), read
+      through np.memmap so the matrix never has to be resident in RAM.
+    - ids.bin: fixed-width ASCII prediction ids, row-aligned with the matrix.
+      Ids are looked up by binary search over the memmapped file through
+      a sorted row order held in RAM (4 bytes per id), plus a dict of up
+      to ID_MERGE_ROWS ids added since the last merge into that order.
+    - meta.json: the embedding width. A store written at another width
+      (e.g. before pruning changed the feature size) is moved aside into
+      stale_dim<width>_<timestamp>/ and a new one is started.
+    - index.faiss: optional IVF-PQ index, used when faiss is installed and
+      there are at least `index_min_rows` embeddings. Only the PQ codes
+      (`pq_m` bytes), a row id (8 bytes) per embedding and the coarse
+      centroids are held in RAM: ~72 MB per million 1024-d embeddings. The
+      full vectors stay on disk; the index's top `refine * k` candidates
+      are re-ranked exactly from the memmap. The index is checkpointed
+      every `checkpoint_every` adds, so a restart only re-adds the rows
+      appended since; a missing or unusable index is rebuilt in a
+      background thread while search falls back to brute force.
+
+    Without the index, search is a chunked brute-force inner product over
+    the memmap. Similarity is cosine (inner product of normalised vectors).
+    """
+
+    def __init__(self, directory, dim=1024, nprobe=16, refine=4, index_min_rows=10000, checkpoint_every=1000,
+                 use_faiss=True):
+        self.directory = directory
+        self.dim = dim
+        self.nprobe = nprobe
+        self.refine = refine
+        self.index_min_rows = index_min_rows
+        self.checkpoint_every = checkpoint_every
+        self.use_faiss = use_faiss and faiss is not None
+        os.makedirs(directory, exist_ok=True)
+
+        self.embeddings_path = os.path.join(directory, 'embeddings.f16')
+        self.ids_path = os.path.join(directory, 'ids.bin')
+        self.index_path = os.path.join(directory, 'index.faiss')
+        self.meta_path = os.path.join(directory, 'meta.json')
+
+        self._lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+        self._sorted = (np.empty(0, dtype=f'S{ID_WIDTH}'), np.empty(0, dtype=np.uint32))
+        self._recent = {}
+        self._check_dim()
+        self._num_rows = self._load_ids()
+
+        self.index = None
+        self._building = None
+        self._adds_since_checkpoint = 0
+        if self.use_faiss:
+            self._load_index()
+
+    @property
+    def backend(self):
+        if self.index is not None:
+            return 'faiss-ivfpq'
+        return 'numpy-bruteforce (index building)' if self._building is not None else 'numpy-bruteforce'
+
+    def __len__(self):
+        return self._num_rows
+
+    def __contains__(self, prediction_id):
+        return self._row_of(prediction_id) is not None
+
+    def _check_dim(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                stored_dim = json.load(f).get('dim')
+        elif os.path.exists(self.embeddings_path):
+            # Written before meta.json: trust the width only if both files agree on the row count (give or take a torn append)
+            rows_in_ids = os.path.getsize(self.ids_path) // ID_WIDTH if os.path.exists(self.ids_path) else 0
+            rows_in_matrix = os.path.getsize(self.embeddings_path) / (self.dim * 2)
+            stored_dim = self.dim if abs(rows_in_matrix - rows_in_ids) <= 1 else None
+        else:
+            stored_dim = self.dim
+
+        if stored_dim != self.dim:
+            stale_dir = os.path.join(self.directory, f"stale_dim{stored_dim or 'unknown'}_{datetime.now():%Y%m%d_%H%M%S}")
+            os.makedirs(stale_dir)
+            for path in (self.embeddings_path, self.ids_path, self.index_path, self.meta_path):
+                if os.path.exists(path):
+                    os.replace(path, os.path.join(stale_dir, os.path.basename(path)))
+            print(f"Warning: Embedding store holds {stored_dim or 'unknown'}-d embeddings, model gives {self.dim}-d; "
+                  f"moved the old store to {stale_dir} and starting a new one")
+
+        if stored_dim != self.dim or not os.path.exists(self.meta_path):
+            with open(self.meta_path, 'w') as f:
+                json.dump({'dim': self.dim}, f)
+
+    def _load_ids(self):
+        # Rows are only counted if both files have them (guards against a torn append)
+        row_bytes = self.dim * 2
+        rows_in_matrix = os.path.getsize(self.embeddings_path) // row_bytes if os.path.exists(self.embeddings_path) else 0
+        rows_in_ids = os.path.getsize(self.ids_path) // ID_WIDTH if os.path.exists(self.ids_path) else 0
+        num_rows = min(rows_in_matrix, rows_in_ids)
+
+        # Truncate any partial trailing row so later appends stay aligned
+        for path, width in ((self.embeddings_path, row_bytes), (self.ids_path, ID_WIDTH)):
+            if os.path.exists(path) and os.path.getsize(path) != num_rows * width:
+                with open(path, 'r+b') as f:
+                    f.truncate(num_rows * width)
+
+        if num_rows:
+            ids = self._ids(num_rows)
+            self._sorted = (ids, np.argsort(ids, kind='stable').astype(np.uint32))
+        return num_rows
+
+    def _ids(self, num_rows=None):
+        num_rows = self._num_rows if num_rows is None else num_rows
+        return np.memmap(self.ids_path, dtype=f'S{ID_WIDTH}', mode='r', shape=(num_rows,))
+
+    @staticmethod
+    def _position(sorted_ids, encoded_id):
+        """Insertion point of `encoded_id` in the sorted order (a binary search reading ~log2(n) ids from disk)."""
+        ids, order = sorted_ids
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ids[order[mid]] < encoded_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _row_of(self, prediction_id):
+        row = self._recent.get(prediction_id)
+        if row is not None:
+            return row
+        try:
+            encoded_id = prediction_id.encode('ascii')
+        except UnicodeEncodeError:
+            return None
+        sorted_ids = self._sorted
+        ids, order = sorted_ids
+        position = self._position(sorted_ids, encoded_id)
+        if position < len(order) and ids[order[position]] == encoded_id:
+            return int(order[position])
+        return None
+
+    def _merge_recent(self):
+        """Fold the recently added ids into the sorted order. Called with the lock held."""
+        pending = sorted((pid.encode('ascii'), row) for pid, row in self._recent.items())
+        positions = [self._position(self._sorted, encoded_id) for encoded_id, _ in pending]
+        order = np.insert(self._sorted[1], positions, [row for _, row in pending]).astype(np.uint32)
+        # Readers check the recent ids first, so publish the new order before dropping them
+        self._sorted = (self._ids(), order)
+        self._recent = {}
+
+    def _matrix(self, num_rows=None):
+        num_rows = self._num_rows if num_rows is None else num_rows
+        if num_rows == 0:
+            return np.zeros((0, self.dim), dtype=np.float16)
+        return np.memmap(self.embeddings_path, dtype=np.float16, mode='r', shape=(num_rows, self.dim))
+
+    def _add_rows(self, index, start, stop):
+        """Add memmap rows [start, stop) to `index`; their faiss ids are the row numbers."""
+        matrix = self._matrix(stop)
+        for chunk_start in range(start, stop, SEARCH_CHUNK_ROWS):
+            index.add(np.asarray(matrix[chunk_start:min(chunk_start + SEARCH_CHUNK_ROWS, stop)], dtype=np.float32))
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            index = faiss.read_index(self.index_path)
+            if index.d == self.dim and index.ntotal <= self._num_rows:
+                # Only what was appended after the last checkpoint needs adding
+                self._add_rows(index, index.ntotal, self._num_rows)
+                index.nprobe = self.nprobe
+                self.index = index
+                return
+            print(f"Warning: Embedding index doesn't match the store ({index.ntotal} rows of {index.d}-d vs "
+                  f"{self._num_rows} of {self.dim}-d); rebuilding in the background")
+        if self._num_rows >= self.index_min_rows:
+            self._start_build()
+
+    def _start_build(self):
+        self._building = threading.Thread(target=self._build_index, daemon=True)
+        self._building.start()
+
+    def _build_index(self):
+        """Train and fill a new IVF-PQ index from the memmap, off the request path."""
+        try:
+            num_rows = self._num_rows
+            matrix = self._matrix(num_rows)
+            nlist = max(1, min(int(4 * np.sqrt(num_rows)), num_rows // 39, 65536))
+            sample = np.sort(np.random.default_rng(0).choice(num_rows, min(num_rows, TRAIN_SAMPLE_ROWS), replace=False))
+            quantizer = faiss.IndexFlatIP(self.dim)
+            index = faiss.IndexIVFPQ(quantizer, self.dim, nlist, _pq_subquantizers(self.dim), 8, faiss.METRIC_INNER_PRODUCT)
+            index.train(np.asarray(matrix[sample], dtype=np.float32))
+            self._add_rows(index, 0, num_rows)
+            index.nprobe = self.nprobe
+
+            with self._lock:
+                # Catch up with the embeddings added while training
+                self._add_rows(index, num_rows, self._num_rows)
+                self.index = index
+                data = faiss.serialize_index(index)
+                self._adds_since_checkpoint = 0
+            self._write_index(data)
+            print(f"Embedding index built: {index.ntotal} rows, {nlist} lists")
+        except Exception as e:
+            print(f"Error building embedding index: {e}")
+        finally:
+            self._building = None
+
+    def _write_index(self, data):
+        with self._checkpoint_lock:
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data.tobytes())
+            os.replace(tmp_path, self.index_path)
+
+    def save_index(self):
+        """Checkpoint the index now (also done every `checkpoint_every` adds)."""
+        with self._lock:
+            if self.index is None:
+                return
+            data = faiss.serialize_index(self.index)
+            self._adds_since_checkpoint = 0
+        self._write_index(data)
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def add(self, prediction_id, embedding):
+        """Append one embedding (any array-like of length `dim`)."""
+        encoded_id = prediction_id.encode('ascii')
+        if len(encoded_id) > ID_WIDTH:
+            raise ValueError(f"prediction_id longer than {ID_WIDTH} characters: {prediction_id}")
+        vector = self._normalize(embedding)
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"Embedding has {vector.shape[0]} dimensions, store expects {self.dim}")
+
+        checkpoint = None
+        with self._lock:
+            if self._row_of(prediction_id) is not None:
+                return
+            with open(self.embeddings_path, 'ab') as f:
+                f.write(vector.astype(np.float16).tobytes())
+            with open(self.ids_path, 'ab') as f:
+                f.write(encoded_id.ljust(ID_WIDTH, b'\0'))
+
+            self._recent[prediction_id] = self._num_rows
+            self._num_rows += 1
+            if len(self._recent) >= ID_MERGE_ROWS:
+                self._merge_recent()
+
+            if self.index is not None:
+                self.index.add(vector.reshape(1, -1))
+                self._adds_since_checkpoint += 1
+                if self._adds_since_checkpoint >= self.checkpoint_every:
+                    checkpoint = faiss.serialize_index(self.index)
+                    self._adds_since_checkpoint = 0
+            elif self.use_faiss and self._building is None and self._num_rows >= self.index_min_rows:
+                self._start_build()
+
+        if checkpoint is not None:
+            self._write_index(checkpoint)
+
+    def get(self, prediction_id):
+        row = self._row_of(prediction_id)
+        if row is None:
+            return None
+        return np.asarray(self._matrix()[row], dtype=np.float32)
+
+    def _ids_for_rows(self, rows):
+        ids = self._ids()
+        return [ids[row].decode('ascii') for row in rows]
+
+    def _bruteforce(self, query, k):
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        matrix = self._matrix()
+
+        for start in range(0, self._num_rows, SEARCH_CHUNK_ROWS):
+            chunk = np.asarray(matrix[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+            scores = chunk @ query
+            take = min(k, scores.shape[0])
+            top = np.argpartition(-scores, take - 1)[:take]
+            best_scores = np.concatenate([best_scores, scores[top]])
+            best_rows = np.concatenate([best_rows, top + start])
+
+        order = np.argsort(-best_scores)[:k]
+        return best_scores[order], best_rows[order]
+
+    def _search_index(self, query, k):
+        with self._lock:
+            _, rows = self.index.search(query.reshape(1, -1), k * self.refine)
+        rows = np.sort(rows[0][rows[0] >= 0])
+        # PQ scores are approximate; re-rank the candidates with their exact vectors from disk
+        scores = np.asarray(self._matrix()[rows], dtype=np.float32) @ query
+        order = np.argsort(-scores)[:k]
+        return scores[order], rows[order]
+
+    def search(self, embedding, k=5, exclude_id=None):
+        """Top-k most similar stored predictions as a list of (prediction_id, cosine_similarity)."""
+        if self._num_rows == 0:
+            return []
+        query = self._normalize(embedding)
+        fetch = k + 1 if exclude_id is not None else k
+
+        if self.index is not None:
+            scores, rows = self._search_index(query, fetch)
+        else:
+            scores, rows = self._bruteforce(query, fetch)
+
+        results = []
+        for pid, score in zip(self._ids_for_rows(rows), scores):
+            if pid == exclude_id:
+                continue
+            results.append((pid, float(score)))
+        return results[:k]
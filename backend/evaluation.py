@@ -0,0 +1,259 @@
+import os
+import hashlib
+import threading
+import torch
+from PIL import Image
+from sklearn.metrics import precision_recall_fscore_support, accuracy_score
+
+from preprocessing import image_to_uint8, normalize_uint8
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp')
+
+
+def _backbone_tensors(model):
+    for name, tensor in list(model.named_parameters()) + list(model.named_buffers()):
+        if not name.startswith('classifier.'):
+            yield name, tensor
+
+
+def backbone_fingerprint(model):
+    """
+    Cheap identity for the weights in front of the classifier head.
+    Every in-place update (optimizer.step, load_state_dict, copy_) bumps a
+    tensor's version counter, so (id, _version) over the feature extractor
+    and SE blocks changes whenever the pooled embeddings could change. It
+    also changes for an identical copy (copy.deepcopy gives new ids), so
+    it only decides when backbone_digest needs recomputing.
+    """
+    return tuple((id(t), t._version) for _, t in _backbone_tensors(model))
+
+
+def backbone_digest(model):
+    """Content hash of the weights in front of the classifier head (a few ms per MB of weights)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for name, tensor in _backbone_tensors(model):
+        digest.update(name.encode())
+        digest.update(tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy())
+    return digest.hexdigest()
+
+
+class EvaluationService:
+    """
+    Incremental evaluation on an ImageFolder-style test directory
+    (test_data_dir/class_name/image.jpg).
+
+    - Decoded, resized test images are cached as uint8 tensors, keyed by path
+      and (mtime, size); only new or modified files are decoded again.
+    - Pooled 1024-d features from `model.forward_features` are cached per
+      image and reused while the backbone weights are unchanged (by content,
+      so a fine-tuned copy of the model with the same backbone still hits),
+      so after a classifier-only update evaluation is a single head forward
+      over the cached embedding matrix.
+    """
+
+    def __init__(self, test_data_dir, class_names, batch_size=16):
+        self.test_data_dir = test_data_dir
+        self.class_names = list(class_names)
+        self.batch_size = batch_size
+
+        self._images = {}               # path -> (mtime_ns, size, uint8 tensor [3, H, W])
+        self._features = {}             # path -> float tensor [1024], valid for _features_digest
+        self._features_digest = None
+        self._backbone_key = None       # backbone_fingerprint the digest was last computed for
+        self._lock = threading.Lock()
+        self.stats = {'evaluations': 0, 'images_decoded': 0, 'features_computed': 0, 'features_reused': 0}
+
+    def scan(self):
+        """List (path, label) pairs like torchvision's ImageFolder (sorted class dirs)."""
+        samples = []
+        class_dirs = sorted(
+            d for d in os.listdir(self.test_data_dir)
+            if os.path.isdir(os.path.join(self.test_data_dir, d))
+        )
+        for class_name in class_dirs:
+            if class_name not in self.class_names:
+                print(f"Warning: Unknown class directory '{class_name}' in test data. Skipping.")
+                continue
+            label = self.class_names.index(class_name)
+            class_dir = os.path.join(self.test_data_dir, class_name)
+            for root, _, files in sorted(os.walk(class_dir, followlinks=True)):
+                for fname in sorted(files):
+                    if fname.lower().endswith(IMAGE_EXTENSIONS):
+                        samples.append((os.path.join(root, fname), label))
+        return samples
+
+    def _refresh_images(self, samples):
+        """Decode only new/changed files and drop cache entries for removed ones."""
+        live_paths = set()
+        for path, _ in samples:
+            live_paths.add(path)
+            stat = os.stat(path)
+            cached = self._images.get(path)
+            if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                continue
+            with Image.open(path) as img:
+                tensor = image_to_uint8(img)
+            self._images[path] = (stat.st_mtime_ns, stat.st_size, tensor)
+            self._features.pop(path, None)
+            self.stats['images_decoded'] += 1
+
+        for path in list(self._images):
+            if path not in live_paths:
+                del self._images[path]
+                self._features.pop(path, None)
+
+    def _refresh_features(self, model, device, samples, autocast_fn=None):
+        key = backbone_fingerprint(model)
+        if key != self._backbone_key:
+            # Hash the weights only when the model object or its tensors changed
+            self._backbone_key = key
+            digest = backbone_digest(model)
+            if digest != self._features_digest:
+                self._features.clear()
+                self._features_digest = digest
+
+        missing = [path for path, _ in samples if path not in self._features]
+        self.stats['features_reused'] += len(samples) - len(missing)
+
+        for start in range(0, len(missing), self.batch_size):
+            paths = missing[start:start + self.batch_size]
+            batch = torch.stack([self._images[p][2] for p in paths])
+            inputs = normalize_uint8(batch).to(device)
+            if autocast_fn is not None:
+                with autocast_fn():
+                    features = model.forward_features(inputs)
+            else:
+                features = model.forward_features(inputs)
+            features = features.float().cpu()
+            for path, feature in zip(paths, features):
+                self._features[path] = feature
+            self.stats['features_computed'] += len(paths)
+
+    def evaluate(self, model, device, autocast_fn=None):
+        """Return the metrics dict used by the API (overall + per-class)."""
+        if not os.path.exists(self.test_data_dir) or not os.listdir(self.test_data_dir):
+            print(f"Warning: Test data directory '{self.test_data_dir}' is empty or does not exist. Skipping evaluation.")
+            return {"error": "Test data not found or empty."}
+
+        with self._lock:
+            samples = self.scan()
+            if not samples:
+                print(f"Warning: No classes found in '{self.test_data_dir}'. Check dataset structure. Skipping evaluation.")
+                return {"error": "No classes found in test dataset."}
+
+            was_training = model.training
+            model.eval()
+            try:
+                with torch.no_grad():
+                    self._refresh_images(samples)
+                    self._refresh_features(model, device, samples, autocast_fn)
+
+                    features = torch.stack([self._features[path] for path, _ in samples]).to(device)
+                    outputs = model.classifier(features)
+                    all_preds = outputs.argmax(dim=1).cpu().tolist()
+            finally:
+                model.train(was_training)
+
+            all_labels = [label for _, label in samples]
+            self.stats['evaluations'] += 1
+
+        return self.metrics(all_labels, all_preds)
+
+    def early_exit_report(self, model, device, thresholds, autocast_fn=None):
+        """
+        Early-exit rates and accuracy impact per true class on the test set,
+        for each confidence threshold, against always running the full model.
+        All exits are computed in one pass; thresholds are applied afterwards.
+        """
+        if not getattr(model, 'exit_heads', False):
+            return {"error": "Model has no early-exit heads."}
+        if not os.path.exists(self.test_data_dir) or not os.listdir(self.test_data_dir):
+            return {"error": "Test data not found or empty."}
+
+        with self._lock:
+            samples = self.scan()
+            if not samples:
+                return {"error": "No classes found in test dataset."}
+
+            was_training = model.training
+            model.eval()
+            try:
+                with torch.no_grad():
+                    self._refresh_images(samples)
+                    probs = {name: [] for name in model.EXITS}
+                    for start in range(0, len(samples), self.batch_size):
+                        batch = torch.stack([self._images[path][2] for path, _ in samples[start:start + self.batch_size]])
+                        inputs = normalize_uint8(batch).to(device)
+                        if autocast_fn is not None:
+                            with autocast_fn():
+                                logits = model.forward_all_exits(inputs)
+                        else:
+                            logits = model.forward_all_exits(inputs)
+                        for name in model.EXITS:
+                            probs[name].append(torch.softmax(logits[name].float(), dim=1).cpu())
+            finally:
+                model.train(was_training)
+
+        labels = torch.tensor([label for _, label in samples])
+        confidence, preds = {}, {}
+        for name in model.EXITS:
+            confidence[name], preds[name] = torch.cat(probs[name]).max(dim=1)
+        full_correct = preds['final'] == labels
+
+        report = {
+            "num_samples": len(samples),
+            "full_model_accuracy": full_correct.float().mean().item(),
+            "exit_head_accuracy": {name: (preds[name] == labels).float().mean().item() for name in model.EXITS[:-1]},
+            "thresholds": {}
+        }
+        for threshold in thresholds:
+            # Index of the exit each sample takes: the first confident one, else the final classifier
+            taken = torch.full_like(labels, len(model.EXITS) - 1)
+            for i in reversed(range(len(model.EXITS) - 1)):
+                taken[confidence[model.EXITS[i]] >= threshold] = i
+            stacked = torch.stack([preds[name] for name in model.EXITS], dim=1)
+            correct = stacked.gather(1, taken.unsqueeze(1)).squeeze(1) == labels
+
+            def summary(mask):
+                n = int(mask.sum())
+                if n == 0:
+                    return {"num_samples": 0}
+                return {
+                    "num_samples": n,
+                    "exit_rate": {name: float(((taken == i) & mask).sum()) / n for i, name in enumerate(model.EXITS)},
+                    "accuracy": correct[mask].float().mean().item(),
+                    "full_model_accuracy": full_correct[mask].float().mean().item(),
+                    "accuracy_delta": (correct[mask].float().mean() - full_correct[mask].float().mean()).item()
+                }
+
+            result = summary(torch.ones_like(labels, dtype=torch.bool))
+            result["per_class"] = {name: summary(labels == i) for i, name in enumerate(self.class_names)}
+            report["thresholds"][str(threshold)] = result
+        return report
+
+    def metrics(self, all_labels, all_preds):
+        precision, recall, f1, _ = precision_recall_fscore_support(all_labels, all_preds, average='weighted', zero_division=0)
+        accuracy = accuracy_score(all_labels, all_preds)
+
+        per_class_precision, per_class_recall, per_class_f1, _ = precision_recall_fscore_support(
+            all_labels, all_preds, average=None, labels=list(range(len(self.class_names))), zero_division=0)
+
+        metrics = {
+            "overall_accuracy": float(accuracy),
+            "overall_precision_weighted": float(precision),
+            "overall_recall_weighted": float(recall),
+            "overall_f1_weighted": float(f1),
+            "num_samples": len(all_labels),
+            "per_class_metrics": {}
+        }
+        for i, class_name in enumerate(self.class_names):
+            metrics["per_class_metrics"][class_name] = {
+                "precision": float(per_class_precision[i]),
+                "recall": float(per_class_recall[i]),
+                "f1_score": float(per_class_f1[i])
+            }
+
+        print(f"Evaluation complete. Accuracy: {accuracy:.4f} "
+              f"(features computed: {self.stats['features_computed']}, reused: {self.stats['features_reused']})")
+        return metrics
@@ -0,0 +1,107 @@
+import copy
+import threading
+from collections import OrderedDict
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU of pooled embeddings computed at prediction time, keyed by
+    prediction_id. Stored as float16 on CPU (2 KB per 1024-d embedding).
+    """
+
+    def __init__(self, max_items=10000):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, prediction_id, embedding):
+        with self._lock:
+            self._items[prediction_id] = embedding.detach().to('cpu', torch.float16)
+            self._items.move_to_end(prediction_id)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get(self, prediction_id):
+        with self._lock:
+            embedding = self._items.get(prediction_id)
+            if embedding is not None:
+                self._items.move_to_end(prediction_id)
+            return embedding
+
+    def __contains__(self, prediction_id):
+        with self._lock:
+            return prediction_id in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+class HeadFineTuner:
+    """
+    Fine-tunes only the classifier head on accumulated (embedding, label)
+    feedback pairs. Repeated feedback for the same prediction_id replaces the
+    earlier label. Training runs on a copy of the head which is then loaded
+    into the live classifier, so concurrent predictions never see dropout or
+    half-updated weights.
+    """
+
+    def __init__(self, learning_rate, max_samples=5000, batch_size=64, epochs=1):
+        self.learning_rate = learning_rate
+        self.max_samples = max_samples
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.criterion = nn.CrossEntropyLoss()
+        self._samples = OrderedDict()   # prediction_id -> (embedding fp16, label_idx)
+        self._lock = threading.Lock()
+
+    def add(self, prediction_id, embedding, label_idx):
+        with self._lock:
+            self._samples[prediction_id] = (embedding.detach().to('cpu', torch.float16), label_idx)
+            self._samples.move_to_end(prediction_id)
+            while len(self._samples) > self.max_samples:
+                self._samples.popitem(last=False)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def fine_tune(self, classifier, device):
+        """Run `epochs` passes over the accumulated feedback and update `classifier` in place. Returns the mean loss."""
+        with self._lock:
+            if not self._samples:
+                return None
+            embeddings = torch.stack([e for e, _ in self._samples.values()]).float()
+            labels = torch.tensor([l for _, l in self._samples.values()], dtype=torch.long)
+
+        head = copy.deepcopy(classifier).to(device)
+        head.train()
+        optimizer = optim.Adam(head.parameters(), lr=self.learning_rate)
+
+        total_loss = torch.zeros((), device=device)
+        num_steps = 0
+        for _ in range(self.epochs):
+            order = torch.randperm(embeddings.size(0))
+            for start in range(0, embeddings.size(0), self.batch_size):
+                idx = order[start:start + self.batch_size]
+                inputs = embeddings[idx].to(device)
+                targets = labels[idx].to(device)
+
+                optimizer.zero_grad(set_to_none=True)
+                loss = self.criterion(head(inputs), targets)
+                loss.backward()
+                optimizer.step()
+
+                total_loss += loss.detach()
+                num_steps += 1
+
+        head.eval()
+        classifier.load_state_dict(head.state_dict())
+        return (total_loss / max(num_steps, 1)).item()
+
+
+def freeze_backbone(model):
+    """Freeze everything except `model.classifier` (features and SE blocks)."""
+    for name, param in model.named_parameters():
+        param.requires_grad = name.startswith('classifier.')
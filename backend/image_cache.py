@@ -0,0 +1,82 @@
+import os
+import threading
+import numpy as np
+import torch
+
+from preprocessing import IMAGE_SIZE
+
+
+ID_WIDTH = 36  # str(uuid.uuid4())
+
+
+class ImageCache:
+    """
+    Fixed-capacity ring of preprocessed uint8 [3, 224, 224] images (150 KB
+    each) keyed by prediction_id, so feedback can train on the image seen
+    at prediction time without a re-upload or re-decode.
+
+    - images.u8: the image slots, read and written through np.memmap.
+    - ids.bin: fixed-width ASCII prediction id per slot.
+    - seq.i64: insertion counter per slot (0 = empty), written last so a
+      torn write never exposes a half-written image; the slot after the
+      highest counter is where the ring resumes after a restart.
+
+    When full, the oldest prediction's slot is overwritten.
+    """
+
+    def __init__(self, directory, capacity=2000):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.capacity = capacity
+        image_shape = (3,) + tuple(IMAGE_SIZE)
+
+        def open_memmap(name, dtype, shape):
+            path = os.path.join(directory, name)
+            expected = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            mode = 'r+' if os.path.exists(path) and os.path.getsize(path) == expected else 'w+'
+            return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+        self.images = open_memmap('images.u8', np.uint8, (capacity,) + image_shape)
+        self.ids = open_memmap('ids.bin', f'S{ID_WIDTH}', (capacity,))
+        self.seq = open_memmap('seq.i64', np.int64, (capacity,))
+
+        self._lock = threading.Lock()
+        self._slot_of = {self.ids[slot].decode('ascii'): slot for slot in np.flatnonzero(self.seq)}
+        self._counter = int(self.seq.max()) if capacity else 0
+        self._next = (int(self.seq.argmax()) + 1) % capacity if self._counter else 0
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def __contains__(self, prediction_id):
+        return prediction_id in self._slot_of
+
+    def put(self, prediction_id, image_uint8):
+        with self._lock:
+            slot = self._slot_of.get(prediction_id)
+            if slot is None:
+                slot = self._next
+                self._next = (self._next + 1) % self.capacity
+                if self.seq[slot]:
+                    self._slot_of.pop(self.ids[slot].decode('ascii'), None)
+                self._counter += 1
+                self.seq[slot] = 0
+                self.images[slot] = image_uint8.numpy()
+                self.ids[slot] = prediction_id.encode('ascii')
+                self.seq[slot] = self._counter
+                self._slot_of[prediction_id] = slot
+            else:
+                self.images[slot] = image_uint8.numpy()
+
+    def get(self, prediction_id):
+        """The cached uint8 image for `prediction_id` (a copy), or None."""
+        with self._lock:
+            slot = self._slot_of.get(prediction_id)
+            if slot is None:
+                return None
+            return torch.from_numpy(np.array(self.images[slot]))
+
+    def flush(self):
+        with self._lock:
+            for array in (self.images, self.ids, self.seq):
+                array.flush()
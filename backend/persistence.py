@@ -0,0 +1,275 @@
+import abc
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime
+from urllib.parse import unquote
+
+from supabase_http import AsyncSupabaseClient, SupabaseError
+
+
+PREDICTIONS_TABLE = "predictions"
+
+logger = logging.getLogger(__name__)
+
+
+class PersistenceBackend(abc.ABC):
+    """
+    Where predictions, their images and feedback are kept. The API only
+    talks to this interface, so the backend can be swapped (Supabase for
+    the hosted app, LocalBackend for edge deployments and tests).
+    """
+
+    name = None
+
+    @abc.abstractmethod
+    async def save_prediction(self, row, image, filename, sha256=None):
+        """
+        Store the image (bytes or a binary file object) and insert `row`
+        (id, prediction, confidence, speed, user_id) with its image_url.
+        Returns the image_url.
+        """
+
+    @abc.abstractmethod
+    async def record_feedback(self, prediction_id, label):
+        """
+        Set the prediction's label and append to its feedback history.
+        Returns {"previous_label", "original_prediction", "updated"}, or
+        None if the prediction doesn't exist.
+        """
+
+    @abc.abstractmethod
+    async def fetch_image(self, prediction_id):
+        """The stored image bytes of a prediction, or None."""
+
+    @abc.abstractmethod
+    async def get_predictions(self, ids):
+        """Rows (id, image_url, prediction, confidence) for the given prediction ids that exist."""
+
+    def stats(self):
+        return {'backend': self.name}
+
+    async def aclose(self):
+        pass
+
+
+class SupabaseBackend(PersistenceBackend):
+    """
+    Supabase storage bucket for images and the `predictions` table for rows,
+    through AsyncSupabaseClient (pooled, with timeouts, retries and a
+    circuit breaker). Feedback uses the record_feedback function from
+    sql/feedback.sql when installed.
+    """
+
+    name = "supabase"
+
+    def __init__(self, url, key, bucket, **client_options):
+        if not url or not key:
+            raise ValueError("Missing Supabase credentials in .env file (or set PERSISTENCE_BACKEND=local)")
+        self.client = AsyncSupabaseClient(url, key, **client_options)
+        self.bucket = bucket
+        self.feedback_rpc_available = True  # Cleared if sql/feedback.sql isn't installed
+
+    async def save_prediction(self, row, image, filename, sha256=None):
+        # Unique object name with a timestamp
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        storage_path = f"{timestamp}_{row['id']}{os.path.splitext(filename)[1]}"
+        # content-type: adjust if needed for different image types
+        await self.client.upload(self.bucket, storage_path, image, "image/jpeg")
+        image_url = self.client.get_public_url(self.bucket, storage_path)
+        await self.client.insert(PREDICTIONS_TABLE, {**row, "image_url": image_url})
+        return image_url
+
+    async def record_feedback(self, prediction_id, label):
+        if self.feedback_rpc_available:
+            try:
+                rows = await self.client.rpc("record_feedback", {"p_prediction_id": prediction_id, "p_label": label})
+                return rows[0] if rows else None
+            except SupabaseError as e:
+                # PGRST202: no such function, i.e. feedback.sql hasn't been applied; anything else is a real failure
+                if e.code != "PGRST202":
+                    raise
+                self.feedback_rpc_available = False
+                logger.warning("record_feedback function not installed; falling back to select + update without feedback history")
+
+        rows = await self.client.select(PREDICTIONS_TABLE, "prediction", id=prediction_id)
+        if not rows:
+            return None
+        previous_label = rows[0]["prediction"]
+        if previous_label != label:
+            await self.client.update(PREDICTIONS_TABLE, {"prediction": label}, id=prediction_id)
+        return {"previous_label": previous_label, "original_prediction": None, "updated": previous_label != label}
+
+    async def fetch_image(self, prediction_id):
+        rows = await self.client.select(PREDICTIONS_TABLE, "image_url", id=prediction_id)
+        if not rows or not rows[0].get("image_url"):
+            return None
+        # Public URLs end in /<bucket>/<path>
+        storage_path = unquote(rows[0]["image_url"].split(f"/{self.bucket}/", 1)[-1].split("?", 1)[0])
+        return await self.client.download(self.bucket, storage_path)
+
+    async def get_predictions(self, ids):
+        return await self.client.select(PREDICTIONS_TABLE, "id, image_url, prediction, confidence", id=list(ids))
+
+    def stats(self):
+        return {'backend': self.name, 'pool': self.client.pool_stats()}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class LocalBackend(PersistenceBackend):
+    """
+    Everything on local disk, no network:
+
+    - predictions.sqlite3: `predictions` and `prediction_feedback` tables
+      (same columns as the Supabase schema) in WAL mode, so readers never
+      block the writer and each commit is a sequential log append.
+    - images/<sha256[:2]>/<sha256><ext>: content-addressed image files,
+      written once via a temp file + rename; identical uploads share a file.
+
+    image_url is `{public_url}/images/<sha256><ext>`, served by the API.
+    """
+
+    name = "local"
+    IMAGE_NAME = re.compile(r'^[0-9a-f]{64}(\.[A-Za-z0-9]{1,8})?$')
+
+    def __init__(self, directory, public_url=""):
+        self.directory = directory
+        self.images_dir = os.path.join(directory, "images")
+        self.public_url = public_url.rstrip("/")
+        os.makedirs(self.images_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(directory, "predictions.sqlite3"), check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints; a crash loses at most the last commits
+        self.db.execute("PRAGMA foreign_keys=ON")  # Off by default in SQLite; enforces prediction_feedback -> predictions
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS predictions (
+                id TEXT PRIMARY KEY,
+                image_url TEXT,
+                image_name TEXT,
+                prediction TEXT NOT NULL,
+                original_prediction TEXT,
+                confidence REAL,
+                speed REAL,
+                user_id TEXT,
+                created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            );
+            CREATE TABLE IF NOT EXISTS prediction_feedback (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                prediction_id TEXT NOT NULL REFERENCES predictions (id) ON DELETE CASCADE,
+                original_prediction TEXT NOT NULL,
+                previous_label TEXT NOT NULL,
+                corrected_label TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            );
+            CREATE INDEX IF NOT EXISTS prediction_feedback_prediction_id_idx
+                ON prediction_feedback (prediction_id, created_at);
+        """)
+
+    def image_path(self, name):
+        """Path of a stored image by its content-addressed name, or None for names that aren't one."""
+        if not self.IMAGE_NAME.match(name):
+            return None
+        path = os.path.join(self.images_dir, name[:2], name)
+        return path if os.path.exists(path) else None
+
+    def _write_image(self, image, filename, sha256):
+        if sha256 is None:
+            if not isinstance(image, (bytes, bytearray)):
+                image = image.read()
+            sha256 = hashlib.sha256(image).hexdigest()
+        name = f"{sha256}{os.path.splitext(filename)[1].lower()}"
+        if not self.IMAGE_NAME.match(name):
+            name = sha256
+        directory = os.path.join(self.images_dir, name[:2])
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_")
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(image, (bytes, bytearray)):
+                    f.write(image)
+                else:
+                    shutil.copyfileobj(image, f)
+            os.replace(tmp_path, path)
+        return name
+
+    def _save_prediction(self, row, image, filename, sha256):
+        name = self._write_image(image, filename, sha256)
+        image_url = f"{self.public_url}/images/{name}"
+        with self._lock, self.db:
+            self.db.execute(
+                "INSERT INTO predictions (id, image_url, image_name, prediction, confidence, speed, user_id) "
+                "VALUES (:id, :image_url, :image_name, :prediction, :confidence, :speed, :user_id)",
+                {**row, "image_url": image_url, "image_name": name}
+            )
+        return image_url
+
+    async def save_prediction(self, row, image, filename, sha256=None):
+        return await asyncio.to_thread(self._save_prediction, row, image, filename, sha256)
+
+    def _record_feedback(self, prediction_id, label):
+        # Same semantics as record_feedback in sql/feedback.sql, in one local transaction
+        with self._lock, self.db:
+            current = self.db.execute("SELECT prediction, COALESCE(original_prediction, prediction) AS original "
+                                      "FROM predictions WHERE id = ?", (prediction_id,)).fetchone()
+            if current is None:
+                return None
+            previous_label, original = current["prediction"], current["original"]
+            if previous_label != label:
+                self.db.execute("UPDATE predictions SET prediction = ?, original_prediction = ? WHERE id = ?",
+                                (label, original, prediction_id))
+            self.db.execute("INSERT INTO prediction_feedback (prediction_id, original_prediction, previous_label, corrected_label) "
+                            "VALUES (?, ?, ?, ?)", (prediction_id, original, previous_label, label))
+        return {"previous_label": previous_label, "original_prediction": original, "updated": previous_label != label}
+
+    async def record_feedback(self, prediction_id, label):
+        return await asyncio.to_thread(self._record_feedback, prediction_id, label)
+
+    def _fetch_image(self, prediction_id):
+        with self._lock:
+            row = self.db.execute("SELECT image_name FROM predictions WHERE id = ?", (prediction_id,)).fetchone()
+        path = self.image_path(row["image_name"]) if row and row["image_name"] else None
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def fetch_image(self, prediction_id):
+        return await asyncio.to_thread(self._fetch_image, prediction_id)
+
+    def _get_predictions(self, ids):
+        ids = list(ids)
+        if not ids:
+            return []
+        with self._lock:
+            rows = self.db.execute(
+                f"SELECT id, image_url, prediction, confidence FROM predictions WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    async def get_predictions(self, ids):
+        return await asyncio.to_thread(self._get_predictions, ids)
+
+    async def aclose(self):
+        with self._lock:
+            self.db.close()
+
+
+def create_backend(name, supabase_url=None, supabase_key=None, bucket=None, local_dir=None, public_url="", **client_options):
+    """`client_options` go to AsyncSupabaseClient (pool size, timeout, retries, circuit breaker); the local backend ignores them."""
+    if name == "supabase":
+        return SupabaseBackend(supabase_url, supabase_key, bucket, **client_options)
+    if name == "local":
+        return LocalBackend(local_dir, public_url)
+    raise ValueError(f"Unknown persistence backend '{name}' (expected 'supabase' or 'local')")
@@ -0,0 +1,31 @@
+import torch
+from torchvision import transforms
+
+
+IMAGE_SIZE = (224, 224)
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+_resize = transforms.Resize(IMAGE_SIZE)
+_to_uint8 = transforms.PILToTensor()
+_mean = torch.tensor(MEAN).view(1, -1, 1, 1)
+_std = torch.tensor(STD).view(1, -1, 1, 1)
+
+
+def image_to_uint8(image):
+    """Resize an RGB PIL image and return it as a uint8 [3, H, W] tensor (150 KB at 224x224)."""
+    return _to_uint8(_resize(image.convert("RGB")))
+
+
+def normalize(batch):
+    """Normalize a float batch in [0, 1] with the ImageNet mean/std."""
+    return (batch - _mean.to(batch.device)) / _std.to(batch.device)
+
+
+def normalize_uint8(batch_uint8):
+    """
+    uint8 [B, 3, H, W] -> normalized float batch. Identical to applying
+    ToTensor() + Normalize() to the resized PIL image, so uint8 tensors can
+    be cached/stored at a quarter of the float32 size without changing results.
+    """
+    return normalize(batch_uint8.float().div_(255.0))
@@ -0,0 +1,278 @@
+import os
+import json
+import uuid
+import threading
+import multiprocessing
+from datetime import datetime
+import torch
+
+
+# Evaluation worker state. Lives in the worker process for its whole
+# lifetime so the EvaluationService tensor/feature caches are reused
+# between candidate evaluations.
+_worker = {}
+
+
+def _init_worker(cores, num_classes, class_names, batch_size):
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(max(1, len(cores) if cores else 1))
+
+    from densenet_se import DenseNetSE
+    from evaluation import EvaluationService
+
+    _worker['num_classes'] = num_classes
+    _worker['model'] = DenseNetSE(num_classes=num_classes)
+    _worker['model'].eval()
+    _worker['services'] = {}
+    _worker['service_factory'] = lambda test_data_dir: EvaluationService(test_data_dir, class_names, batch_size=batch_size)
+
+
+def _load_changed(model, state_dict):
+    """Copy only tensors that differ, so unchanged backbones keep their version counters (and cached features)."""
+    current = model.state_dict()
+    with torch.no_grad():
+        for name, tensor in state_dict.items():
+            if not torch.equal(current[name], tensor):
+                current[name].copy_(tensor)
+
+
+def _evaluate_checkpoint(checkpoint_path, test_data_dir):
+    from densenet_se import DenseNetSE, architecture_kwargs
+
+    checkpoint = torch.load(checkpoint_path, map_location='cpu')
+    state_dict = checkpoint.get('model_state_dict', checkpoint)
+    kwargs = architecture_kwargs(state_dict)
+    model = _worker['model']
+    if (model.exit_heads, model.transition_channels) != (kwargs['exit_heads'], kwargs['transition_channels']):
+        # Served weights gained/lost exit heads or were pruned: rebuild (drops cached features once)
+        _worker['model'] = DenseNetSE(num_classes=_worker['num_classes'], **kwargs)
+        _worker['model'].eval()
+    _load_changed(_worker['model'], state_dict)
+
+    service = _worker['services'].get(test_data_dir)
+    if service is None:
+        service = _worker['service_factory'](test_data_dir)
+        _worker['services'][test_data_dir] = service
+    return service.evaluate(_worker['model'], torch.device('cpu'))
+
+
+def split_cores(eval_cores_setting=None):
+    """
+    Decide which CPU cores evaluation may use. `eval_cores_setting` is a
+    comma separated core list; by default the last quarter of the available
+    cores (at least one) is reserved, and serving keeps the rest.
+    Returns (serving_cores, eval_cores) as sorted lists, or (None, None)
+    when affinity can't be controlled on this platform.
+    """
+    if not hasattr(os, 'sched_getaffinity'):
+        return None, None
+    available = sorted(os.sched_getaffinity(0))
+    if eval_cores_setting:
+        eval_cores = sorted(int(c) for c in eval_cores_setting.split(',') if c.strip())
+    elif len(available) >= 2:
+        eval_cores = available[-max(1, len(available) // 4):]
+    else:
+        return None, None
+    serving_cores = [c for c in available if c not in eval_cores] or available
+    return serving_cores, eval_cores
+
+
+class ModelRegistry:
+    """Version history of served weights with their evaluation metrics (registry.json)."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, 'registry.json')
+        self.data = {'current': None, 'versions': []}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.data = json.load(f)
+        self._lock = threading.Lock()
+
+    def new_version_id(self):
+        return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+    def checkpoint_path(self, version_id):
+        return os.path.join(self.directory, f'candidate_{version_id}.pth')
+
+    def current(self):
+        for version in self.data['versions']:
+            if version['version'] == self.data['current']:
+                return version
+        return None
+
+    def _write(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def record(self, entry, make_current=False):
+        with self._lock:
+            self.data['versions'].append(entry)
+            if make_current:
+                self.data['current'] = entry['version']
+            self._write()
+
+    def prune_checkpoints(self, keep):
+        """
+        Delete all but the `keep` newest promoted candidate checkpoints (the
+        newest is a copy of the served weights). Pruned entries keep their
+        metrics with path None; checkpoints outside the registry directory
+        (the baseline's MODEL_PATH) are never touched.
+        """
+        with self._lock:
+            stored = [v for v in self.data['versions']
+                      if v.get('promoted') and v.get('path') == self.checkpoint_path(v['version'])]
+            superseded = stored[:len(stored) - keep] if keep > 0 else stored
+            for version in superseded:
+                if os.path.exists(version['path']):
+                    os.remove(version['path'])
+                version['path'] = None
+            if superseded:
+                self._write()
+            return len(superseded)
+
+
+class PromotionGate:
+    """
+    Evaluates fine-tuned candidates in a separate worker process pinned to
+    its own cores, and promotes a candidate only if its test metrics don't
+    regress beyond `max_regression` relative to the currently served model,
+    nor beyond `max_total_regression` relative to the best metrics ever
+    promoted (so small accepted drops can't stack up across promotions).
+    Every decision (with metrics) is recorded in the ModelRegistry; only
+    the `keep_checkpoints` newest promoted candidates keep their weights.
+    """
+
+    GATED_METRICS = ('overall_accuracy', 'overall_f1_weighted')
+
+    def __init__(self, registry, test_data_dir, class_names, eval_cores=None,
+                 max_regression=0.005, max_total_regression=0.01, time_budget=120.0, batch_size=16,
+                 keep_checkpoints=3):
+        self.registry = registry
+        self.test_data_dir = test_data_dir
+        self.class_names = list(class_names)
+        self.eval_cores = eval_cores
+        self.max_regression = max_regression
+        self.max_total_regression = max_total_regression
+        self.time_budget = time_budget
+        self.batch_size = batch_size
+        self.keep_checkpoints = keep_checkpoints
+        self._pool = None
+        self.stats = {'evaluated': 0, 'promoted': 0, 'rejected': 0, 'timeouts': 0}
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn: don't fork the serving process (threads, open sockets, model weights)
+            ctx = multiprocessing.get_context('spawn')
+            self._pool = ctx.Pool(1, initializer=_init_worker,
+                                  initargs=(self.eval_cores, len(self.class_names), self.class_names, self.batch_size))
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def evaluate(self, checkpoint_path):
+        """Blocking: evaluate a saved checkpoint in the worker within the time budget."""
+        async_result = self._get_pool().apply_async(_evaluate_checkpoint, (checkpoint_path, self.test_data_dir))
+        try:
+            return async_result.get(timeout=self.time_budget)
+        except multiprocessing.TimeoutError:
+            # The worker may be stuck mid-evaluation; kill it and start fresh next time
+            self.stats['timeouts'] += 1
+            self.shutdown()
+            return {"error": f"Evaluation exceeded time budget of {self.time_budget}s"}
+
+    def baseline_metrics(self, live_checkpoint_path):
+        """Metrics of the currently served model, evaluating (and recording) them if unknown."""
+        current = self.registry.current()
+        if current is not None and 'error' not in current.get('metrics', {}):
+            return current['metrics']
+
+        metrics = self.evaluate(live_checkpoint_path)
+        if 'error' not in metrics:
+            self.registry.record({
+                'version': self.registry.new_version_id(),
+                'path': live_checkpoint_path,
+                'created': datetime.now().isoformat(),
+                'metrics': metrics,
+                'promoted': True,
+                'note': 'baseline'
+            }, make_current=True)
+        return metrics
+
+    def reference_metrics(self):
+        """Best value of each gated metric over every promoted version, including the baseline."""
+        reference = {}
+        for version in self.registry.data['versions']:
+            metrics = version.get('metrics', {})
+            if not version.get('promoted') or 'error' in metrics:
+                continue
+            for key in self.GATED_METRICS:
+                if key in metrics:
+                    reference[key] = max(reference.get(key, metrics[key]), metrics[key])
+        return reference
+
+    def compare(self, candidate, baseline, reference=None):
+        regressions = {}
+        for key in self.GATED_METRICS:
+            delta = candidate[key] - baseline[key]
+            if delta < -self.max_regression:
+                regressions[key] = delta
+        for key, best in (reference or {}).items():
+            delta = candidate[key] - best
+            if delta < -self.max_total_regression:
+                regressions[f'{key} (vs best {best:.4f})'] = delta
+        return regressions
+
+    def consider(self, candidate_model, live_checkpoint_path, parent_note=None):
+        """
+        Blocking: save the candidate, evaluate it against the served baseline
+        and the best promoted metrics, and record the decision. Returns
+        (promoted, entry).
+        """
+        version_id = self.registry.new_version_id()
+        candidate_path = self.registry.checkpoint_path(version_id)
+        torch.save({'model_state_dict': candidate_model.state_dict()}, candidate_path)
+
+        baseline = self.baseline_metrics(live_checkpoint_path)
+        reference = self.reference_metrics()
+        metrics = self.evaluate(candidate_path)
+        self.stats['evaluated'] += 1
+
+        entry = {
+            'version': version_id,
+            'path': candidate_path,
+            'created': datetime.now().isoformat(),
+            'parent': self.registry.data['current'],
+            'metrics': metrics,
+            'baseline_metrics': baseline,
+            'reference_metrics': reference,
+            'note': parent_note
+        }
+
+        if 'error' in metrics or 'error' in baseline:
+            entry['promoted'] = False
+            entry['reason'] = metrics.get('error') or baseline.get('error')
+        else:
+            regressions = self.compare(metrics, baseline, reference)
+            entry['promoted'] = not regressions
+            entry['reason'] = f"regressed: {regressions}" if regressions else "no regression beyond threshold"
+
+        if entry['promoted']:
+            self.stats['promoted'] += 1
+        else:
+            self.stats['rejected'] += 1
+            # Rejected weights aren't kept; the registry entry keeps their metrics
+            os.remove(candidate_path)
+            entry['path'] = None
+
+        self.registry.record(entry, make_current=entry['promoted'])
+        if entry['promoted']:
+            self.registry.prune_checkpoints(self.keep_checkpoints)
+        return entry['promoted'], entry
@@ -0,0 +1,206 @@
+import os
+import json
+import random
+import threading
+import numpy as np
+import torch
+from PIL import Image
+
+from preprocessing import IMAGE_SIZE, image_to_uint8
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp')
+
+
+class ClassSlots:
+    """
+    Fixed-capacity, per-class slot array of uint8 image tensors backed by an
+    np.memmap file, with a small JSON sidecar for slot bookkeeping. Slot
+    `label * per_class + i` holds the i-th sample of class `label`.
+    """
+
+    def __init__(self, path, num_classes, per_class, image_shape):
+        self.path = path
+        self.meta_path = f'{path}.json'
+        self.num_classes = num_classes
+        self.per_class = per_class
+        self.image_shape = tuple(image_shape)
+
+        shape = (num_classes * per_class,) + self.image_shape
+        mode = 'r+' if os.path.exists(path) else 'w+'
+        self.data = np.memmap(path, dtype=np.uint8, mode=mode, shape=shape)
+
+        self.meta = {
+            'count': [0] * num_classes,      # filled slots per class
+            'next': [0] * num_classes,       # oldest slot once full, for FIFO replacement
+            'seen': [0] * num_classes,       # items offered, for reservoir sampling
+            'keys': [[None] * per_class for _ in range(num_classes)]
+        }
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+
+    def _write(self, label, index, tensor, key):
+        self.data[label * self.per_class + index] = tensor.numpy()
+        self.meta['keys'][label][index] = key
+
+    def flush(self):
+        self.data.flush()
+        tmp_path = f'{self.meta_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def put_fifo(self, label, tensor, key):
+        """Insert, overwriting the oldest sample of the class once full. Existing keys are updated in place."""
+        keys = self.meta['keys'][label]
+        if key is not None and key in keys:
+            index = keys.index(key)
+        elif self.meta['count'][label] < self.per_class:
+            index = self.meta['count'][label]
+            self.meta['count'][label] += 1
+        else:
+            index = self.meta['next'][label]
+            self.meta['next'][label] = (index + 1) % self.per_class
+        self._write(label, index, tensor, key)
+
+    def put_reservoir(self, label, tensor, key, rng):
+        """Reservoir sampling (Algorithm R): each offered sample is kept with probability per_class / seen."""
+        self.meta['seen'][label] += 1
+        if self.meta['count'][label] < self.per_class:
+            index = self.meta['count'][label]
+            self.meta['count'][label] += 1
+        else:
+            j = rng.randrange(self.meta['seen'][label])
+            if j >= self.per_class:
+                return False
+            index = j
+        self._write(label, index, tensor, key)
+        return True
+
+    def remove_key(self, key):
+        """
+        Drop the sample stored under `key` from every class (e.g. after a
+        label correction). The remaining samples are shifted down in FIFO
+        order, oldest first from slot 0, so the oldest is still replaced first.
+        """
+        for label in range(self.num_classes):
+            keys = self.meta['keys'][label]
+            if key not in keys:
+                continue
+            index = keys.index(key)
+            count = self.meta['count'][label]
+            head = self.meta['next'][label] if count == self.per_class else 0
+            order = [(head + i) % count for i in range(count)]
+            order.remove(index)
+            # Only slots from the first one whose sample changes are rewritten
+            start = next((p for p, slot in enumerate(order) if slot != p), len(order))
+            base = label * self.per_class
+            if start < len(order):
+                self.data[base + start:base + len(order)] = self.data[[base + slot for slot in order[start:]]]
+            self.meta['keys'][label] = [keys[slot] for slot in order] + [None] * (self.per_class - len(order))
+            self.meta['count'][label] = len(order)
+            self.meta['next'][label] = 0
+
+    def count(self, label):
+        return self.meta['count'][label]
+
+    def get(self, label, index):
+        return torch.from_numpy(np.array(self.data[label * self.per_class + index]))
+
+
+class ReplayBuffer:
+    """
+    Bounded, disk-backed replay memory for continual learning from feedback.
+
+    - feedback: the most recent `feedback_per_class` corrected samples per
+      class (FIFO), stored as preprocessed uint8 [3, 224, 224] tensors.
+    - reservoir: a uniform sample of up to `reservoir_per_class` original
+      training images per class, filled once from the training split.
+
+    `sample_batch` draws class-balanced mini-batches mixing both, so each
+    fine-tuning step sees every class instead of a single new image.
+    """
+
+    def __init__(self, directory, num_classes, feedback_per_class=256, reservoir_per_class=256, seed=42):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.num_classes = num_classes
+        image_shape = (3,) + tuple(IMAGE_SIZE)
+        self.feedback = ClassSlots(os.path.join(directory, 'feedback.u8'), num_classes, feedback_per_class, image_shape)
+        self.reservoir = ClassSlots(os.path.join(directory, 'reservoir.u8'), num_classes, reservoir_per_class, image_shape)
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(self.feedback.count(c) + self.reservoir.count(c) for c in range(self.num_classes))
+
+    def stats(self):
+        return {
+            'feedback_per_class': [self.feedback.count(c) for c in range(self.num_classes)],
+            'reservoir_per_class': [self.reservoir.count(c) for c in range(self.num_classes)]
+        }
+
+    def add_feedback(self, prediction_id, image_uint8, label):
+        """Store a corrected sample. Re-labelled feedback replaces the earlier entry for the prediction."""
+        with self._lock:
+            self.feedback.remove_key(prediction_id)
+            self.feedback.put_fifo(label, image_uint8, prediction_id)
+            self.feedback.flush()
+
+    def fill_reservoir(self, train_data_dir, class_names):
+        """Stream an ImageFolder-style training split through reservoir sampling. Skipped if already filled."""
+        if any(self.reservoir.meta['seen']):
+            return
+        added = 0
+        for label, class_name in enumerate(class_names):
+            class_dir = os.path.join(train_data_dir, class_name)
+            if not os.path.isdir(class_dir):
+                print(f"Warning: Replay reservoir: class directory '{class_dir}' not found. Skipping.")
+                continue
+            for root, _, files in os.walk(class_dir, followlinks=True):
+                for fname in sorted(files):
+                    if not fname.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    path = os.path.join(root, fname)
+                    with Image.open(path) as img:
+                        tensor = image_to_uint8(img)
+                    with self._lock:
+                        added += self.reservoir.put_reservoir(label, tensor, os.path.relpath(path, train_data_dir), self.rng)
+        with self._lock:
+            self.reservoir.flush()
+        print(f"Replay reservoir filled: {self.stats()['reservoir_per_class']} samples per class ({added} writes)")
+
+    def sample_batch(self, batch_size, feedback_fraction=0.5, include=None):
+        """
+        Class-balanced uint8 batch. Classes take turns; within a class a
+        feedback sample is drawn with probability `feedback_fraction` (when
+        available), otherwise a reservoir sample. `include` is an optional
+        (uint8 tensor, label) pair always placed first in the batch.
+        Returns (images [B, 3, H, W] uint8, labels [B] long).
+        """
+        images, labels = [], []
+        if include is not None:
+            images.append(include[0])
+            labels.append(include[1])
+
+        with self._lock:
+            classes = [c for c in range(self.num_classes) if self.feedback.count(c) + self.reservoir.count(c) > 0]
+            if classes:
+                self.rng.shuffle(classes)
+                i = 0
+                while len(images) < batch_size:
+                    label = classes[i % len(classes)]
+                    i += 1
+                    n_feedback = self.feedback.count(label)
+                    n_reservoir = self.reservoir.count(label)
+                    use_feedback = n_feedback > 0 and (n_reservoir == 0 or self.rng.random() < feedback_fraction)
+                    if use_feedback:
+                        images.append(self.feedback.get(label, self.rng.randrange(n_feedback)))
+                    else:
+                        images.append(self.reservoir.get(label, self.rng.randrange(n_reservoir)))
+                    labels.append(label)
+
+        if not images:
+            return None, None
+        return torch.stack(images), torch.tensor(labels, dtype=torch.long)
@@ -0,0 +1,53 @@
+-- Feedback history and the single-round-trip label update used by /feedback/.
+-- Apply once in the Supabase SQL editor (or `psql -f feedback.sql`). Safe to re-run.
+
+-- The model's own label, kept when `prediction` is overwritten by feedback
+alter table predictions add column if not exists original_prediction text;
+
+-- One row per feedback submission
+create table if not exists prediction_feedback (
+    id bigint generated always as identity primary key,
+    prediction_id uuid not null references predictions (id) on delete cascade,
+    original_prediction text not null,   -- what the model predicted
+    previous_label text not null,        -- predictions.prediction before this feedback
+    corrected_label text not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists prediction_feedback_prediction_id_idx
+    on prediction_feedback (prediction_id, created_at);
+
+-- Record feedback and update the label in one call. The prediction row is
+-- locked so concurrent feedback for it is serialised. Returns no rows for
+-- an unknown prediction_id, otherwise the label before this feedback, the
+-- model's original prediction and whether `prediction` changed.
+create or replace function record_feedback(p_prediction_id uuid, p_label text)
+returns table (previous_label text, original_prediction text, updated boolean)
+language plpgsql
+as $$
+declare
+    v_previous text;
+    v_original text;
+begin
+    select p.prediction, coalesce(p.original_prediction, p.prediction)
+      into v_previous, v_original
+      from predictions p
+     where p.id = p_prediction_id
+       for update;
+    if not found then
+        return;
+    end if;
+
+    if v_previous is distinct from p_label then
+        update predictions
+           set prediction = p_label,
+               original_prediction = v_original
+         where id = p_prediction_id;
+    end if;
+
+    insert into prediction_feedback (prediction_id, original_prediction, previous_label, corrected_label)
+    values (p_prediction_id, v_original, v_previous, p_label);
+
+    return query select v_previous, v_original, v_previous is distinct from p_label;
+end;
+$$;
@@ -0,0 +1,22 @@
+import torch
+import torch.nn as nn
+from torchvision import models
+
+
+def build_student(num_classes=4):
+    """MobileNetV3-Small with a `num_classes` output layer (same layout as models/Distillation.py)."""
+    model = models.mobilenet_v3_small(weights=None)
+    model.classifier[-1] = nn.Linear(model.classifier[-1].in_features, num_classes)
+    return model
+
+
+def load_student(model_path, map_location='cpu', num_classes=4):
+    """Load a distilled student saved by models/Distillation.py ({'model_state_dict': ..., 'metadata': ...})."""
+    checkpoint = torch.load(model_path, map_location=map_location)
+    architecture = checkpoint.get('metadata', {}).get('architecture', 'mobilenet_v3_small')
+    if architecture != 'mobilenet_v3_small':
+        raise ValueError(f"Unsupported student architecture '{architecture}'")
+
+    model = build_student(num_classes=num_classes)
+    model.load_state_dict(checkpoint.get('model_state_dict', checkpoint))
+    return model
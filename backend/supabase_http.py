@@ -0,0 +1,275 @@
+import asyncio
+import os
+import random
+import time
+from urllib.parse import quote
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:  # Optional: HTTP/1.1 keep-alive otherwise
+    HTTP2_AVAILABLE = False
+
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Failures worth retrying: the server or a proxy was briefly unavailable
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Raised before the request could have reached the server, so even non-idempotent calls can be retried
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class SupabaseError(Exception):
+    """A Supabase REST/storage call failed. `code` is PostgREST's error code (e.g. PGRST202) when given."""
+
+    def __init__(self, status, message, code=None):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.code = code
+
+
+class CircuitOpen(SupabaseError):
+    def __init__(self, retry_after):
+        super().__init__(503, f"Supabase circuit open, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed calls; while open, calls fail
+    fast for `cooldown` seconds instead of piling up on a dead service.
+    Then one trial call is let through (half-open): success closes the
+    circuit, failure re-opens it.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def before_call(self):
+        state = self.state
+        if state == 'open' or (state == 'half-open' and self.trial_in_flight):
+            raise CircuitOpen(max(0.0, self.cooldown - (time.monotonic() - self.opened_at)))
+        if state == 'half-open':
+            self.trial_in_flight = True
+
+    def record(self, success):
+        self.trial_in_flight = False
+        if success:
+            self.failures = 0
+            self.opened_at = None
+            return
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+
+
+class AsyncSupabaseClient:
+    """
+    Async client for the parts of Supabase the API uses (PostgREST tables
+    and RPC, storage objects), over one shared httpx.AsyncClient:
+
+    - a bounded connection pool (`max_connections`, kept alive between
+      calls; HTTP/2 multiplexing when the `h2` package is installed);
+    - a per-call timeout, which also bounds the wait for a pool slot;
+    - up to `retries` retries with full-jitter exponential backoff, on
+      connect errors for every call and also on timeouts/5xx/429 for
+      idempotent ones;
+    - a circuit breaker shared by all calls;
+    - pool metrics (in flight, waiting for a connection, utilisation).
+    """
+
+    def __init__(self, url, key, max_connections=20, timeout=10.0, retries=3, backoff=0.2, max_backoff=5.0,
+                 breaker_threshold=5, breaker_cooldown=30.0, transport=None):
+        self.url = url.rstrip('/')
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.http2 = HTTP2_AVAILABLE and transport is None
+        self.http = httpx.AsyncClient(
+            base_url=self.url,
+            headers={'apikey': key, 'Authorization': f'Bearer {key}'},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                keepalive_expiry=60.0),
+            timeout=httpx.Timeout(timeout),
+            http2=self.http2,
+            transport=transport
+        )
+        self._slots = asyncio.Semaphore(max_connections)
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_in_flight = 0
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'rejected_circuit_open': 0, 'pool_timeouts': 0}
+        self.latency_ms = None  # EMA of successful call latency
+
+    async def _send(self, method, path, idempotent, **kwargs):
+        """One logical call: retries, circuit breaking and metrics around httpx."""
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            self.stats['rejected_circuit_open'] += 1
+            raise
+
+        body = kwargs.pop('file', None)
+        try:
+            for attempt in range(self.retries + 1):
+                if body is not None:
+                    kwargs['content'] = self._file_body(body)
+                response, error, elapsed = await self._attempt(method, path, **kwargs)
+
+                if response is not None and response.status_code < 400:
+                    self.latency_ms = elapsed if self.latency_ms is None else 0.9 * self.latency_ms + 0.1 * elapsed
+                    self.breaker.record(True)
+                    return response
+
+                retryable = (isinstance(error, CONNECT_ERRORS)
+                             or (idempotent and (isinstance(error, httpx.TransportError)
+                                                 or (response is not None and response.status_code in RETRY_STATUSES))))
+                if not retryable or attempt == self.retries:
+                    break
+                self.stats['retries'] += 1
+                # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+                await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+        except asyncio.CancelledError:
+            # The caller went away; don't leave a half-open trial slot taken
+            self.breaker.trial_in_flight = False
+            raise
+
+        self.stats['failures'] += 1
+        # Client errors (bad request, missing function, conflict) say nothing about the service's health
+        server_side = response is None or response.status_code >= 500 or response.status_code == 429
+        self.breaker.record(not server_side)
+        if response is None:
+            raise SupabaseError(None, f'{type(error).__name__}: {error}') from error
+        raise self._error(response)
+
+    async def _attempt(self, method, path, **kwargs):
+        """One HTTP request on a pool slot. Returns (response or None, transport error or None, ms)."""
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            # Never reached the server, so this is retried like a connect error
+            self.stats['pool_timeouts'] += 1
+            return None, httpx.PoolTimeout(f"No connection slot free within {self.timeout}s"), 1000 * self.timeout
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.stats['requests'] += 1
+        start = time.perf_counter()
+        try:
+            return await self.http.request(method, path, **kwargs), None, 1000 * (time.perf_counter() - start)
+        except httpx.HTTPError as e:
+            return None, e, 1000 * (time.perf_counter() - start)
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    @staticmethod
+    def _file_body(f):
+        """
+        Stream a binary file from its start (re-read on each retry) instead of
+        loading it into memory. Reads happen in worker threads, off the event loop.
+        """
+        async def chunks():
+            await asyncio.to_thread(f.seek, 0)
+            while chunk := await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE):
+                yield chunk
+        return chunks()
+
+    @staticmethod
+    def _error(response):
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        if not isinstance(payload, dict):
+            payload = {}
+        message = payload.get('message') or payload.get('error') or response.text[:200]
+        return SupabaseError(response.status_code, message, code=payload.get('code') or payload.get('statusCode'))
+
+    # PostgREST
+
+    @staticmethod
+    def _filters(filters):
+        """{'id': 'eq.x'} -> query params; list values become an `in` filter."""
+        params = {}
+        for column, value in filters.items():
+            if isinstance(value, (list, tuple, set)):
+                params[column] = 'in.(' + ','.join(f'"{v}"' for v in value) + ')'
+            else:
+                params[column] = f'eq.{value}'
+        return params
+
+    async def select(self, table, columns, **filters):
+        response = await self._send('GET', f'/rest/v1/{table}', True,
+                                    params={'select': columns, **self._filters(filters)})
+        return response.json()
+
+    async def insert(self, table, row):
+        # The primary key comes from the caller, so a retried insert that already landed fails with 409 instead of duplicating
+        await self._send('POST', f'/rest/v1/{table}', False, json=row, headers={'Prefer': 'return=minimal'})
+
+    async def update(self, table, values, **filters):
+        # Setting the same values again is harmless, so updates are retried like reads
+        response = await self._send('PATCH', f'/rest/v1/{table}', True, json=values,
+                                    params=self._filters(filters), headers={'Prefer': 'return=representation'})
+        return response.json()
+
+    async def rpc(self, function, params, idempotent=False):
+        response = await self._send('POST', f'/rest/v1/rpc/{function}', idempotent, json=params)
+        return response.json() if response.content else None
+
+    # Storage
+
+    async def upload(self, bucket, path, data, content_type):
+        """Upload bytes or a binary file (streamed, with its size as Content-Length)."""
+        headers = {'Content-Type': content_type, 'x-upsert': 'false'}
+        url = f'/storage/v1/object/{bucket}/{quote(path)}'
+        if isinstance(data, (bytes, bytearray)):
+            await self._send('POST', url, False, content=data, headers=headers)
+        else:
+            headers['Content-Length'] = str(os.fstat(data.fileno()).st_size)
+            await self._send('POST', url, False, file=data, headers=headers)
+
+    def get_public_url(self, bucket, path):
+        # Computed locally, as supabase-py does; no round trip
+        return f'{self.url}/storage/v1/object/public/{bucket}/{quote(path)}'
+
+    async def download(self, bucket, path):
+        response = await self._send('GET', f'/storage/v1/object/{bucket}/{quote(path)}', True)
+        return response.content
+
+    def pool_stats(self):
+        return {
+            'http2': self.http2,
+            'max_connections': self.max_connections,
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'waiting_for_connection': self.waiting,
+            'utilization': self.in_flight / self.max_connections,
+            'mean_latency_ms': self.latency_ms,
+            'circuit': self.breaker.state,
+            'circuit_opened': self.breaker.times_opened,
+            **self.stats
+        }
+
+    async def aclose(self):
+        await self.http.aclose()
@@ -0,0 +1,97 @@
+import math
+import torch
+import torch.nn.functional as F
+
+from preprocessing import normalize
+
+
+# Deterministic test-time views as (rotation degrees, x shift, y shift, horizontal flip).
+# Shifts are fractions of the image size. All are inside the training
+# augmentation ranges of models/DenseNet121withSE.py (flip, +-10 deg, +-10%).
+TTA_VIEWS = [
+    (0.0, 0.0, 0.0, False),     # original
+    (0.0, 0.0, 0.0, True),      # flip
+    (5.0, 0.0, 0.0, False),
+    (-5.0, 0.0, 0.0, False),
+    (0.0, 0.05, 0.0, False),
+    (0.0, -0.05, 0.0, False),
+    (0.0, 0.0, 0.05, False),
+    (0.0, 0.0, -0.05, False),
+    (5.0, 0.0, 0.0, True),
+    (-5.0, 0.0, 0.0, True),
+]
+
+
+def view_thetas(num_views, height, width):
+    """
+    (K, 2, 3) affine_grid matrices for the first `num_views` TTA views:
+    the inverse of flip -> rotate -> translate, with aspect correction
+    (same construction as BatchAugment.affine_theta in models/augmentation.py).
+    """
+    thetas = torch.zeros(num_views, 2, 3)
+    for i, (angle, shift_x, shift_y, flip) in enumerate(TTA_VIEWS[:num_views]):
+        rad = math.radians(angle)
+        cos, sin = math.cos(rad), math.sin(rad)
+        f = -1.0 if flip else 1.0
+        m00, m01 = f * cos, f * sin * (height / width)
+        m10, m11 = -sin * (width / height), cos
+        # Shift as a fraction of size -> normalized [-1, 1] coordinates
+        t_x, t_y = 2.0 * shift_x, 2.0 * shift_y
+        thetas[i] = torch.tensor([
+            [m00, m01, -(m00 * t_x + m01 * t_y)],
+            [m10, m11, -(m10 * t_x + m11 * t_y)]
+        ])
+    return thetas
+
+
+def build_views(image_uint8, num_views):
+    """uint8 [3, H, W] image -> normalized [K, 3, H, W] batch of TTA views (view 0 is the original)."""
+    num_views = max(1, min(num_views, len(TTA_VIEWS)))
+    x = image_uint8.float().div_(255.0).unsqueeze(0)
+    _, _, h, w = x.size()
+    if num_views == 1:
+        return normalize(x)
+
+    thetas = view_thetas(num_views, h, w)
+    grid = F.affine_grid(thetas, [num_views, 3, h, w], align_corners=False)
+    # Zero padding in [0, 1] space = black border, as in the training transforms
+    views = F.grid_sample(x.expand(num_views, -1, -1, -1), grid, mode='bilinear',
+                          padding_mode='zeros', align_corners=False)
+    views[0] = x[0]  # Keep the original view exact (no resampling)
+    return normalize(views)
+
+
+class TTAController:
+    """
+    Decides how many views a request gets. Tracks an EMA of per-view
+    latency to stay inside the latency budget, and falls back to a single
+    view while more than `max_inflight` predictions are running.
+    """
+
+    def __init__(self, num_views=8, latency_budget_ms=500.0, max_inflight=4, ema_decay=0.9):
+        self.num_views = num_views
+        self.latency_budget_ms = latency_budget_ms
+        self.max_inflight = max_inflight
+        self.ema_decay = ema_decay
+        self.per_view_ms = None
+        self.stats = {'tta_requests': 0, 'fallback_saturated': 0, 'reduced_for_budget': 0}
+
+    def choose_views(self, inflight):
+        self.stats['tta_requests'] += 1
+        if inflight > self.max_inflight:
+            self.stats['fallback_saturated'] += 1
+            return 1
+        views = self.num_views
+        if self.per_view_ms:
+            affordable = int(self.latency_budget_ms // self.per_view_ms)
+            if affordable < views:
+                self.stats['reduced_for_budget'] += 1
+                views = max(1, affordable)
+        return views
+
+    def observe(self, num_views, elapsed_ms):
+        per_view = elapsed_ms / max(num_views, 1)
+        if self.per_view_ms is None:
+            self.per_view_ms = per_view
+        else:
+            self.per_view_ms = self.ema_decay * self.per_view_ms + (1 - self.ema_decay) * per_view
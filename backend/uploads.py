@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+
+from PIL import Image, ImageFile
+
+
+CHUNK_SIZE = 64 * 1024
+# Multipart framing and the small form fields sent alongside the file
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, size, max_bytes):
+        super().__init__(f"upload exceeds {max_bytes} bytes (got at least {size})")
+        self.size = size
+        self.max_bytes = max_bytes
+
+
+class MaxBodySizeMiddleware:
+    """
+    Reject request bodies over `max_bytes` with 413 while they stream in,
+    before multipart parsing spools them: up front from Content-Length, and
+    by counting received chunks for chunked uploads. Only `paths` are checked.
+    """
+
+    def __init__(self, app, max_bytes, paths=()):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = set(paths)
+
+    async def _reject(self, send):
+        body = b'{"detail":"Upload too large"}'
+        await send({'type': 'http.response.start', 'status': 413,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope['headers']).get(b'content-length')
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            return await self._reject(send)
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise UploadTooLarge(received, self.max_bytes)
+            return message
+
+        async def guarded_send(message):
+            # Once over the limit, the app's own error response (a body parse failure) is replaced by our 413
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            pass
+        if exceeded:
+            await self._reject(send)
+
+
+class IngestedUpload:
+    """
+    An upload read once, in chunks: its size and sha256, the decoded PIL
+    image, and a copy for storage that is held in memory up to
+    `memory_bytes` and spooled to a temp file beyond that. Call close()
+    (or use as a context manager) to delete the spool file.
+    """
+
+    def __init__(self, memory_bytes, spool_dir=None):
+        self.memory_bytes = memory_bytes
+        self.spool_dir = spool_dir
+        self.size = 0
+        self.sha256 = None
+        self.image = None
+        self.path = None
+        self._buffer = io.BytesIO()
+        self._spool = None
+        self._reader = None
+
+    def _write(self, chunk):
+        if self._spool is None and self.size + len(chunk) > self.memory_bytes:
+            fd, self.path = tempfile.mkstemp(prefix='upload_', dir=self.spool_dir)
+            self._spool = os.fdopen(fd, 'wb')
+            self._spool.write(self._buffer.getbuffer())
+            self._buffer = None
+        (self._spool or self._buffer).write(chunk)
+        self.size += len(chunk)
+
+    @property
+    def spooled(self):
+        return self.path is not None
+
+    def storage_payload(self):
+        """What to hand to Supabase storage: bytes for small uploads, a read handle on the spool file otherwise."""
+        if self.path is None:
+            return self._buffer.getvalue()
+        self._spool.flush()
+        if self._reader is not None:
+            self._reader.close()
+        self._reader = open(self.path, 'rb')
+        return self._reader
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._spool is not None:
+            self._spool.close()
+            os.remove(self.path)
+            self._spool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _decode_fallback(upload):
+    upload.file.seek(0)
+    image = Image.open(upload.file)
+    image.load()
+    return image
+
+
+def _finish_decode(parser, upload):
+    try:
+        return parser.close()
+    except (OSError, SyntaxError):
+        # A few formats can't be decoded incrementally; decode from the spooled multipart file instead
+        return _decode_fallback(upload)
+
+
+async def ingest_upload(upload, max_bytes, memory_bytes, spool_dir=None, decode=True, keep=True, chunk_size=CHUNK_SIZE):
+    """
+    Stream a FastAPI UploadFile in `chunk_size` pieces, enforcing
+    `max_bytes`, hashing, and feeding PIL's incremental decoder as bytes
+    arrive instead of materialising the whole file first. Decoding runs in
+    worker threads; the event loop only reads, counts and hashes. With
+    keep=False no copy is kept for storage (e.g. feedback, which only needs
+    pixels).
+    Raises UploadTooLarge, or PIL's error for undecodable images.
+    """
+    result = IngestedUpload(memory_bytes, spool_dir)
+    parser = ImageFile.Parser() if decode else None
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        await upload.seek(0)
+        while chunk := await upload.read(chunk_size):
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(size, max_bytes)
+            digest.update(chunk)
+            if keep:
+                result._write(chunk)
+            if parser is not None:
+                await asyncio.to_thread(parser.feed, chunk)
+        result.size = size
+        result.sha256 = digest.hexdigest()
+        if parser is not None:
+            result.image = await asyncio.to_thread(_finish_decode, parser, upload)
+        return result
+    except BaseException:
+        result.close()
+        raise
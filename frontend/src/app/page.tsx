@@ -224,7 +224,6 @@ export default function Home() {
                       className="bg-inherit text-green-600 border-green-600 border hover:bg-green-200 transition duration-300"
                       onClick={async () => {
                         const formData = new FormData();
-                        formData.append("file", file); // `file` must be a File object
                         formData.append("prediction_id", result.stored_id);
                         formData.append("correct_label", result.prediction);
                       
@@ -410,7 +409,6 @@ export default function Home() {
                   <Button
                     onClick={async () => {
                       const formData = new FormData();
-                      formData.append("file", file); // File object
                       formData.append("prediction_id", result.stored_id);
                       formData.append("correct_label", selectedOption); // Send selectedOption instead
                   
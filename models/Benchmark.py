@@ -0,0 +1,167 @@
+import torch
+import torch.nn as nn
+import argparse
+import multiprocessing
+import resource
+import time
+import json
+import os
+import engine
+
+# Configuration
+class Config(engine.Config):
+    model_name = 'benchmark'
+    device = torch.device('cpu')   # Serving cost is CPU cost
+    architectures = ('alexnet', 'resnet50', 'inception_v3', 'densenet121', 'densenet121_se')
+    batch_sizes = (1, 8, 32)
+    modes = ('eager', 'torchscript', 'quantized')
+    warmup = 3
+    iterations = 10
+    calibration_batches = 4
+
+def input_size(architecture):
+    return engine.get_config(architecture).image_size or (224, 224)
+
+def quantize(model, size):
+    """
+    int8 post-training quantization. FX graph-mode static quantization
+    (convs and linears, calibrated on random batches) where the model is
+    symbolically traceable; otherwise dynamic quantization of the Linear
+    layers only (DenseNetSE's SE blocks branch on tensor sizes/dtypes,
+    which FX can't trace). Returns (model, method).
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    example = torch.randn(1, 3, *size)
+    try:
+        prepared = prepare_fx(model, get_default_qconfig_mapping('x86'), (example,))
+        with torch.no_grad():
+            for _ in range(Config.calibration_batches):
+                prepared(torch.randn(8, 3, *size))
+        return convert_fx(prepared), 'static-fx'
+    except Exception:
+        return quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8), 'dynamic-linear'
+
+def prepare(model, mode, size):
+    """Model variant for `mode`, plus a description of how it was built."""
+    if mode == 'eager':
+        return model, 'eager'
+    if mode == 'torchscript':
+        with torch.no_grad():
+            traced = torch.jit.trace(model, torch.randn(1, 3, *size))
+            return torch.jit.optimize_for_inference(torch.jit.freeze(traced)), 'trace+freeze'
+    if mode == 'quantized':
+        return quantize(model, size)
+    raise ValueError(f"Unknown mode '{mode}'")
+
+def _benchmark_worker(architecture, mode, batch_sizes, threads, iterations, results):
+    """One (architecture, mode) per fresh process, so ru_maxrss is its own peak."""
+    if threads:
+        torch.set_num_threads(threads)
+    torch.manual_seed(Config.seed)
+    size = input_size(architecture)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    row = {'architecture': architecture, 'mode': mode, 'input_size': list(size), 'batches': {}}
+    try:
+        model = engine.build_model(architecture, num_classes=Config.num_classes, pretrained=False).eval()
+        row['params'] = engine.count_parameters(model)
+        row['gflops'] = engine.count_flops(model, size) / 1e9
+        model, row['method'] = prepare(model, mode, size)
+
+        with torch.no_grad():
+            for batch_size in batch_sizes:
+                inputs = torch.randn(batch_size, 3, *size)
+                timings = []
+                for i in range(Config.warmup + iterations):
+                    start = time.perf_counter()
+                    model(inputs)
+                    if i >= Config.warmup:
+                        timings.append(1000 * (time.perf_counter() - start))
+                median = sorted(timings)[len(timings) // 2]
+                # Batches run smallest first, so the running peak is this batch size's peak
+                peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                row['batches'][str(batch_size)] = {
+                    'latency_ms': median,
+                    'ms_per_image': median / batch_size,
+                    'throughput_images_per_s': 1000 * batch_size / median,
+                    'peak_rss_mb': peak_rss / 1024,
+                    'peak_rss_over_baseline_mb': (peak_rss - base_rss) / 1024
+                }
+    except Exception as e:
+        row['error'] = f'{type(e).__name__}: {e}'
+    results.put(row)
+
+def benchmark(architectures=Config.architectures, modes=Config.modes, batch_sizes=Config.batch_sizes,
+              threads=None, iterations=Config.iterations, save_dir=None):
+    """
+    CPU latency, throughput, peak RSS, params and FLOPs of every
+    architecture (random weights) under each mode and batch size.
+    """
+    save_dir = save_dir or Config.results_dir
+    os.makedirs(save_dir, exist_ok=True)
+    ctx = multiprocessing.get_context('spawn')
+    rows = []
+    for architecture in architectures:
+        for mode in modes:
+            print(f"Benchmarking {architecture} ({mode})...")
+            results = ctx.Queue()
+            process = ctx.Process(target=_benchmark_worker,
+                                  args=(architecture, mode, list(batch_sizes), threads, iterations, results))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                # Most likely killed by the OOM killer
+                rows.append({'architecture': architecture, 'mode': mode, 'error': f'exit code {process.exitcode}'})
+                continue
+            rows.append(results.get())
+
+    report = {
+        'torch_version': torch.__version__,
+        'threads': threads or torch.get_num_threads(),
+        'cpu_count': os.cpu_count(),
+        'results': rows
+    }
+    report_path = os.path.join(save_dir, f'{Config.model_name}_models.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    print_table(rows, batch_sizes)
+    print(f"\nReport saved to: {report_path}")
+    return report
+
+def print_table(rows, batch_sizes):
+    header = f"| {'architecture':16} | {'mode':11} | {'params (M)':>10} | {'GFLOPs':>6} |"
+    for batch_size in batch_sizes:
+        header += f" {'b=' + str(batch_size) + ' ms':>10} |"
+    header += f" {'img/s @' + str(max(batch_sizes)):>11} | {'peak RSS MB':>11} |"
+    print('\n' + header)
+    print('|' + '|'.join('-' * (len(cell)) for cell in header.split('|')[1:-1]) + '|')
+    for row in rows:
+        if 'error' in row:
+            print(f"| {row['architecture']:16} | {row['mode']:11} | {row['error']}")
+            continue
+        line = f"| {row['architecture']:16} | {row['mode']:11} | {row['params'] / 1e6:10.2f} | {row['gflops']:6.2f} |"
+        for batch_size in batch_sizes:
+            line += f" {row['batches'][str(batch_size)]['latency_ms']:10.1f} |"
+        largest = row['batches'][str(max(batch_sizes))]
+        line += f" {largest['throughput_images_per_s']:11.1f} | {largest['peak_rss_mb']:11.0f} |"
+        print(line)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='CPU micro-benchmark of the architectures in models/ (random weights)')
+    parser.add_argument('--architectures', nargs='+', default=list(Config.architectures),
+                        choices=sorted(engine.ARCHITECTURE_MODULES))
+    parser.add_argument('--modes', nargs='+', default=list(Config.modes), choices=list(Config.modes))
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=list(Config.batch_sizes))
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads (default: all cores)')
+    parser.add_argument('--iterations', type=int, default=Config.iterations)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    benchmark(args.architectures, args.modes, sorted(args.batch_sizes), args.threads, args.iterations)
+
+if __name__ == '__main__':
+    main()
@@ -1,62 +1,62 @@
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torchvision import models, transforms, datasets
-from torch.utils.data import DataLoader
-import numpy as np
-from sklearn.metrics import precision_recall_fscore_support, confusion_matrix, accuracy_score
-import matplotlib.pyplot as plt
-import seaborn as sns
-from tqdm import tqdm
-import os
-import json
-from datetime import datetime
+from torchvision import models
+from torchvision.models.densenet import _DenseBlock, _DenseLayer, _Transition
 from torch.nn import functional as F
-
-# Set random seed for reproducibility
-torch.manual_seed(42)
-if torch.cuda.is_available():
-    torch.cuda.manual_seed(42)
+import torch.utils.checkpoint
+import multiprocessing
+import resource
+import argparse
+import time
+import json
+import os
+import engine
+from engine import register_model
 
 # Configuration
-class Config:
+class Config(engine.Config):
     windows_input_path = r'C:\Users\rohit\OneDrive\Desktop\Data\PreProcessed2' # Update this
     data_dir = f"/mnt/{windows_input_path[0].lower()}{windows_input_path[2:].replace('\\', '/')}"  
-    batch_size = 32
-    num_epochs = 50
     learning_rate = 0.0005  # Reduced learning rate for SE blocks
-    num_classes = 4
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    batch_augment = True
+    early_stopping_patience = 5
+    model_name = 'densenet_se'
+    architecture = 'densenet121_se'
+    exit_heads = False      # Train early-exit heads after se2/se3 jointly with the model
+    aux_loss_weight = 0.3   # Weight of each early-exit loss when exit_heads is on
+    transition_channels = None  # Output channels of transition1-3 for pruned models (Pruning.py)
+    memory_efficient = False    # Checkpoint dense layer bottlenecks and recompute concat+SE in backward
 
-# Data transforms
-data_transforms = {
-    'train': transforms.Compose([
-        transforms.RandomHorizontalFlip(),
-        transforms.RandomRotation(10),
-        transforms.RandomAffine(0, translate=(0.1, 0.1)),
-        transforms.ColorJitter(brightness=0.2, contrast=0.2),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ]),
-    'valid': transforms.Compose([
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ]),
-    'test': transforms.Compose([
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
-}
+# DenseNet-121 layout: layers per dense block, growth rate, transition output channels
+BLOCK_LAYERS = (6, 12, 24, 16)
+GROWTH_RATE = 32
+TRANSITION_CHANNELS = (128, 256, 512)
+
+def block_channels(transition_channels=TRANSITION_CHANNELS):
+    """Output channels of the four dense blocks (256, 512, 1024, 1024 unpruned)."""
+    channels = [64 + GROWTH_RATE * BLOCK_LAYERS[0]]
+    for k, out_channels in enumerate(transition_channels):
+        channels.append(out_channels + GROWTH_RATE * BLOCK_LAYERS[k + 1])
+    return channels
+
+def architecture_kwargs(state_dict):
+    """DenseNetSE constructor options (exit heads, transition widths) matching a saved state dict."""
+    return {
+        'exit_heads': any(k.startswith('exit2.') for k in state_dict),
+        'transition_channels': tuple(state_dict[f'features.transition{k}.conv.weight'].size(0) for k in (1, 2, 3))
+    }
 
 # Squeeze and Excitation Block
 class SEBlock(nn.Module):
-    def __init__(self, channel, reduction=16):
+    def __init__(self, channel, reduction=16, hidden=None):
         super(SEBlock, self).__init__()
+        hidden = hidden or channel // reduction
         self.avg_pool = nn.AdaptiveAvgPool2d(1)
         self.fc = nn.Sequential(
-            nn.Linear(channel, channel // reduction, bias=False),
+            nn.Linear(channel, hidden, bias=False),
             nn.ReLU(inplace=True),
-            nn.Linear(channel // reduction, channel, bias=False),
+            nn.Linear(hidden, channel, bias=False),
             nn.Sigmoid()
         )
 
@@ -64,31 +64,90 @@ class SEBlock(nn.Module):
         b, c, _, _ = x.size()
         y = self.avg_pool(x).view(b, c)
         y = self.fc(y).view(b, c, 1, 1)
-        return x * y.expand_as(x)
+        if torch.is_grad_enabled() or torch.promote_types(x.dtype, y.dtype) != x.dtype:
+            return x * y
+        # Inference: scale the dense block output in place. Broadcasting y gives
+        # bit-identical results to y.expand_as(x) without allocating a second
+        # feature map (x is the block's fresh torch.cat output, used nowhere else).
+        return x.mul_(y)
+
+# Lightweight classifier on an intermediate feature map. Dense block outputs
+# are pre-activation (transitions start with BN+ReLU), so the head does too.
+class ExitHead(nn.Module):
+    def __init__(self, channel, num_classes):
+        super(ExitHead, self).__init__()
+        self.norm = nn.BatchNorm2d(channel)
+        self.fc = nn.Linear(channel, num_classes)
+
+    def forward(self, x):
+        x = F.relu(self.norm(x))
+        x = F.adaptive_avg_pool2d(x, (1, 1))
+        return self.fc(torch.flatten(x, 1))
 
 # Modified DenseNet with SE blocks
 class DenseNetSE(nn.Module):
-    def __init__(self, num_classes=4):
+    def __init__(self, num_classes=4, pretrained=True, exit_heads=False, transition_channels=None,
+                 memory_efficient=False, recompute_se=None):
         super(DenseNetSE, self).__init__()
         # Load pretrained DenseNet
-        densenet = models.densenet121(pretrained=True)
+        densenet = models.densenet121(pretrained=pretrained)
         
         # Get the features (all layers except the classifier)
         self.features = densenet.features
+
+        # Pruned models keep fewer transition output channels: rebuild the
+        # transitions and the dense blocks reading from them at those widths
+        self.transition_channels = tuple(transition_channels or TRANSITION_CHANNELS)
+        channels = block_channels(self.transition_channels)
+        if self.transition_channels != TRANSITION_CHANNELS:
+            for k, out_channels in enumerate(self.transition_channels, start=1):
+                setattr(self.features, f'transition{k}', _Transition(channels[k - 1], out_channels))
+                setattr(self.features, f'denseblock{k + 1}', _DenseBlock(BLOCK_LAYERS[k], out_channels, bn_size=4,
+                                                                         growth_rate=GROWTH_RATE, drop_rate=0))
+            self.features.norm5 = nn.BatchNorm2d(channels[3])
         
-        # Add SE blocks after each dense block
-        self.se1 = SEBlock(256)    # After first dense block
-        self.se2 = SEBlock(512)    # After second dense block
-        self.se3 = SEBlock(1024)   # After third dense block
-        self.se4 = SEBlock(1024)   # After fourth dense block
+        # Add SE blocks after each dense block (bottleneck width fixed by the unpruned sizes)
+        unpruned = block_channels()
+        self.se1 = SEBlock(channels[0], hidden=unpruned[0] // 16)    # After first dense block
+        self.se2 = SEBlock(channels[1], hidden=unpruned[1] // 16)    # After second dense block
+        self.se3 = SEBlock(channels[2], hidden=unpruned[2] // 16)    # After third dense block
+        self.se4 = SEBlock(channels[3], hidden=unpruned[3] // 16)    # After fourth dense block
         
         # Classifier
         self.classifier = nn.Sequential(
-            nn.Linear(1024, 512),
+            nn.Linear(channels[3], 512),
             nn.ReLU(),
             nn.Dropout(0.2),
             nn.Linear(512, num_classes)
         )
+
+        # Optional early exits after the second and third SE blocks
+        self.exit_heads = exit_heads
+        if exit_heads:
+            self.exit2 = ExitHead(channels[1], num_classes)
+            self.exit3 = ExitHead(channels[2], num_classes)
+
+        # Memory-efficient training: torchvision's checkpointed bottlenecks
+        # (concat -> BN -> ReLU -> 1x1 conv recomputed in backward) ...
+        for module in self.features.modules():
+            if isinstance(module, _DenseLayer):
+                module.memory_efficient = memory_efficient
+        # ... and each block's output concat + SE recomputed from the layer outputs
+        self.recompute_se = memory_efficient if recompute_se is None else recompute_se
+
+    def dense_block(self, index, x):
+        """Dense block `index` followed by its SE block."""
+        block = getattr(self.features, f'denseblock{index}')
+        se = getattr(self, f'se{index}')
+        if not (self.recompute_se and self.training and torch.is_grad_enabled()):
+            return se(block(x))
+        # The layer outputs are kept for the dense layers' backward anyway;
+        # don't also keep their concatenation and the SE-scaled copy of it
+        features = [x]
+        for layer in block.values():
+            features.append(layer(features))
+        return torch.utils.checkpoint.checkpoint(lambda *tensors: se(torch.cat(tensors, 1)), *features,
+                                                 use_reentrant=False)
         
     def forward(self, x):
         # First dense block
@@ -96,251 +155,173 @@ class DenseNetSE(nn.Module):
         x = self.features.norm0(x)
         x = self.features.relu0(x)
         x = self.features.pool0(x)
-        x = self.features.denseblock1(x)
-        x = self.se1(x)
+        x = self.dense_block(1, x)
         x = self.features.transition1(x)
         
         # Second dense block
-        x = self.features.denseblock2(x)
-        x = self.se2(x)
+        x = self.dense_block(2, x)
+        exit2 = self.exit2(x) if self.exit_heads and self.training else None
         x = self.features.transition2(x)
         
         # Third dense block
-        x = self.features.denseblock3(x)
-        x = self.se3(x)
+        x = self.dense_block(3, x)
+        exit3 = self.exit3(x) if self.exit_heads and self.training else None
         x = self.features.transition3(x)
         
         # Fourth dense block
-        x = self.features.denseblock4(x)
-        x = self.se4(x)
+        x = self.dense_block(4, x)
         x = self.features.norm5(x)
         
         x = F.adaptive_avg_pool2d(x, (1, 1))
         x = torch.flatten(x, 1)
         x = self.classifier(x)
         
+        # In training the exit logits are returned as auxiliary outputs
+        # (weighted by Config.aux_loss_weight in engine.compute_loss)
+        if exit2 is not None:
+            return x, exit2, exit3
         return x
 
-# Load datasets
-def load_data():
-    image_datasets = {
-        x: datasets.ImageFolder(os.path.join(Config.data_dir, x), data_transforms[x])
-        for x in ['train', 'valid', 'test']
-    }
-    
-    dataloaders = {
-        x: DataLoader(image_datasets[x], batch_size=Config.batch_size, shuffle=(x == 'train'), num_workers=4)
-        for x in ['train', 'valid', 'test']
-    }
-    
-    return dataloaders, image_datasets
-
 # Create model
-def create_model():
-    model = DenseNetSE(num_classes=Config.num_classes)
+@register_model('densenet121_se')
+def create_model(num_classes=Config.num_classes, pretrained=True):
+    model = DenseNetSE(num_classes=num_classes, pretrained=pretrained, exit_heads=Config.exit_heads,
+                       transition_channels=Config.transition_channels, memory_efficient=Config.memory_efficient)
     return model
 
-# Training function
-def train_model(model, dataloaders, criterion, optimizer, scheduler):
-    best_model_wts = model.state_dict()
-    best_acc = 0.0
-    
-    for epoch in range(Config.num_epochs):
-        print(f'Epoch {epoch+1}/{Config.num_epochs}')
-        print('-' * 10)
-        
-        for phase in ['train', 'valid']:
-            if phase == 'train':
-                model.train()
-            else:
-                model.eval()
-                
-            running_loss = 0.0
-            running_corrects = 0
-            
-            for inputs, labels in tqdm(dataloaders[phase]):
-                inputs = inputs.to(Config.device)
-                labels = labels.to(Config.device)
-                
-                optimizer.zero_grad()
-                
-                with torch.set_grad_enabled(phase == 'train'):
-                    outputs = model(inputs)
-                    _, preds = torch.max(outputs, 1)
-                    loss = criterion(outputs, labels)
-                    
-                    if phase == 'train':
-                        loss.backward()
-                        optimizer.step()
-                
-                running_loss += loss.item() * inputs.size(0)
-                running_corrects += torch.sum(preds == labels.data)
-            
-            if phase == 'train':
-                scheduler.step()
-                
-            epoch_loss = running_loss / len(dataloaders[phase].dataset)
-            epoch_acc = running_corrects.double() / len(dataloaders[phase].dataset)
-            
-            print(f'{phase} Loss: {epoch_loss:.4f} Acc: {epoch_acc:.4f}')
-            
-            if phase == 'valid' and epoch_acc > best_acc:
-                best_acc = epoch_acc
-                best_model_wts = model.state_dict()
-                
-        print()
-    
-    model.load_state_dict(best_model_wts)
-    return model
+def create_optimizer(model):
+    return optim.Adam(model.parameters(), lr=Config.learning_rate)
 
-# Evaluation function (same as original)
-def evaluate_model(model, dataloader, save_dir='results'):
-    model.eval()
-    all_preds = []
-    all_labels = []
-    
-    os.makedirs(save_dir, exist_ok=True)
-    
-    with torch.no_grad():
-        for inputs, labels in tqdm(dataloader):
-            inputs = inputs.to(Config.device)
-            outputs = model(inputs)
-            _, preds = torch.max(outputs, 1)
-            all_preds.extend(preds.cpu().numpy())
-            all_labels.extend(labels.numpy())
-    
-    all_preds = np.array(all_preds)
-    all_labels = np.array(all_labels)
-    
-    precision, recall, f1, support = precision_recall_fscore_support(all_labels, all_preds, average=None)
-    
-    class_names = ['adenocarcinoma', 'large_cell_carcinoma', 'normal', 'squamous_cell_carcinoma']
-    per_class_accuracy = {}
-    
-    for i, class_name in enumerate(class_names):
-        class_mask = (all_labels == i)
-        class_correct = np.sum((all_preds == i) & class_mask)
-        class_total = np.sum(class_mask)
-        accuracy = class_correct / class_total if class_total > 0 else 0
-        per_class_accuracy[class_name] = {
-            'correct': int(class_correct),
-            'total': int(class_total),
-            'accuracy': float(accuracy),
-            'precision': float(precision[i]),
-            'recall': float(recall[i]),
-            'f1': float(f1[i])
-        }
-    
-    cm = confusion_matrix(all_labels, all_preds)
-    
-    plt.figure(figsize=(10, 8))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', 
-                xticklabels=class_names, yticklabels=class_names)
-    plt.title('Confusion Matrix')
-    plt.ylabel('True Label')
-    plt.xlabel('Predicted Label')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    
-    confusion_matrix_path = os.path.join(save_dir, 'confusion_matrix.png')
-    plt.savefig(confusion_matrix_path)
-    plt.close()
-    
-    overall_metrics = {
-        'precision': float(np.mean(precision)),
-        'recall': float(np.mean(recall)),
-        'f1': float(np.mean(f1)),
-        'accuracy': float(accuracy_score(all_labels, all_preds))
-    }
-    
-    results = {
-        'per_class_metrics': per_class_accuracy,
-        'overall_metrics': overall_metrics,
-        'confusion_matrix': cm.tolist()
-    }
-    
-    metrics_path = os.path.join(save_dir, 'dense_net_se_test_metrics.json')
-    with open(metrics_path, 'w') as f:
-        json.dump(results, f, indent=4)
-    
-    return results
+def create_scheduler(optimizer):
+    return optim.lr_scheduler.StepLR(optimizer, step_size=7, gamma=0.1)
 
 def save_model_with_metadata(model, metrics, save_dir='models'):
-    os.makedirs(save_dir, exist_ok=True)
-    
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    
-    model_filename = f'lung_cancer_densenet_se_{timestamp}.pth'
-    model_path = os.path.join(save_dir, model_filename)
-    
-    metadata = {
-        'timestamp': timestamp,
-        'architecture': 'densenet121_se',
-        'num_classes': Config.num_classes,
-        'metrics': metrics,
-        'model_filename': model_filename
-    }
-    
-    torch.save({
-        'model_state_dict': model.state_dict(),
-        'metadata': metadata
-    }, model_path)
-    
-    metadata_path = os.path.join(save_dir, f'densenet_se_metadata_{timestamp}.json')
-    with open(metadata_path, 'w') as f:
-        json.dump(metadata, f, indent=4)
-    
-    return model_path, metadata_path
+    return engine.save_model_with_metadata(model, metrics, Config, save_dir)
 
 def load_model(model_path):
-    checkpoint = torch.load(model_path)
-    
-    model = create_model()
-    model.load_state_dict(checkpoint['model_state_dict'])
-    
-    return model, checkpoint['metadata']
+    checkpoint = torch.load(model_path, map_location=Config.device)
+    # Build with exit heads / pruned widths if the checkpoint has them
+    kwargs = architecture_kwargs(checkpoint['model_state_dict'])
+    Config.exit_heads = kwargs['exit_heads']
+    Config.transition_channels = kwargs['transition_channels']
+    return engine.load_model(model_path, Config, checkpoint)
 
-def main():
-    # Load data
-    dataloaders, image_datasets = load_data()
-    
-    # Create model
-    model = create_model()
-    model = model.to(Config.device)
-    
-    # Loss function and optimizer
+# Training memory benchmark: (memory_efficient dense layers, SE recomputation) per mode
+MEMORY_MODES = {
+    'standard': (False, False),
+    'memory_efficient': (True, False),
+    'memory_efficient+se': (True, True)
+}
+
+def _memory_benchmark_step(mode, batch_size, steps, results):
+    """Runs in a fresh process so ru_maxrss reflects only this configuration."""
+    torch.manual_seed(Config.seed)
+    memory_efficient, recompute_se = MEMORY_MODES[mode]
+    model = DenseNetSE(num_classes=Config.num_classes, pretrained=False,
+                       memory_efficient=memory_efficient, recompute_se=recompute_se)
+    model.train()
+    optimizer = create_optimizer(model)
     criterion = nn.CrossEntropyLoss()
-    optimizer = optim.Adam(model.parameters(), lr=Config.learning_rate)
-    scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=7, gamma=0.1)
-    
-    # Train model
-    model = train_model(model, dataloaders, criterion, optimizer, scheduler)
-    
-    # Evaluate on test set
-    print("\nEvaluating on test set:")
-    test_metrics = evaluate_model(model, dataloaders['test'])
-    
-    # Print detailed results
-    print("\nPer-Class Performance:")
-    for class_name, class_metrics in test_metrics['per_class_metrics'].items():
-        print(f"\n{class_name}:")
-        print(f"Correct predictions: {class_metrics['correct']}/{class_metrics['total']}")
-        print(f"Accuracy: {class_metrics['accuracy']:.4f}")
-        print(f"Precision: {class_metrics['precision']:.4f}")
-        print(f"Recall: {class_metrics['recall']:.4f}")
-        print(f"F1-Score: {class_metrics['f1']:.4f}")
-    
-    # Calculate and print overall metrics
-    print("\nOverall Metrics:")
-    print(f"Accuracy: {test_metrics['overall_metrics']['accuracy']:.4f}")
-    print(f"Precision: {test_metrics['overall_metrics']['precision']:.4f}")
-    print(f"Recall: {test_metrics['overall_metrics']['recall']:.4f}")
-    print(f"F1-Score: {test_metrics['overall_metrics']['f1']:.4f}")
-    
-    # Save model with metadata
-    model_path, metadata_path = save_model_with_metadata(model, test_metrics)
-    print(f"\nModel saved to: {model_path}")
-    print(f"Metadata saved to: {metadata_path}")
+    inputs = torch.randn(batch_size, 3, 224, 224)
+    labels = torch.randint(0, Config.num_classes, (batch_size,))
+    setup_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    step_times = []
+    for _ in range(steps + 1):  # First step warms up allocator / oneDNN kernels
+        start = time.perf_counter()
+        optimizer.zero_grad(set_to_none=True)
+        loss = criterion(model(inputs), labels)
+        loss.backward()
+        optimizer.step()
+        step_times.append(time.perf_counter() - start)
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+    results.put({
+        'mode': mode,
+        'batch_size': batch_size,
+        'peak_rss_mb': peak_rss / 1024,
+        'training_rss_mb': (peak_rss - setup_rss) / 1024,
+        'step_time_s': sorted(step_times[1:])[len(step_times[1:]) // 2]
+    })
+
+def memory_benchmark(batch_sizes=(16, 32, 64), steps=3, save_dir=None):
+    """
+    Peak RSS vs. step time of a CPU training step for each MEMORY_MODES
+    entry and batch size (random 224x224 inputs, random weights).
+    """
+    save_dir = save_dir or Config.results_dir
+    os.makedirs(save_dir, exist_ok=True)
+    ctx = multiprocessing.get_context('spawn')
+    rows = []
+    for batch_size in batch_sizes:
+        for mode in MEMORY_MODES:
+            results = ctx.Queue()
+            process = ctx.Process(target=_memory_benchmark_step, args=(mode, batch_size, steps, results))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                # Most likely killed by the OOM killer at this batch size
+                rows.append({'mode': mode, 'batch_size': batch_size, 'error': f'exit code {process.exitcode}'})
+                continue
+            rows.append(results.get())
+
+    print(f"\n{'mode':22} {'batch':>5} {'peak RSS MB':>12} {'training MB':>12} {'step s':>8}")
+    for row in rows:
+        if 'error' in row:
+            print(f"{row['mode']:22} {row['batch_size']:5d} {row['error']}")
+            continue
+        print(f"{row['mode']:22} {row['batch_size']:5d} {row['peak_rss_mb']:12.0f} {row['training_rss_mb']:12.0f} "
+              f"{row['step_time_s']:8.2f}")
+
+    report_path = os.path.join(save_dir, f'{Config.model_name}_memory_benchmark.json')
+    with open(report_path, 'w') as f:
+        json.dump({'torch_threads': torch.get_num_threads(), 'results': rows}, f, indent=4)
+    print(f"Report saved to: {report_path}")
+    return rows
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train / evaluate DenseNet121 with SE blocks')
+    parser.add_argument('--precision', choices=['fp32', 'bf16', 'auto'], default=Config.precision,
+                        help='Autocast precision for training and evaluation')
+    parser.add_argument('--compare-precision', metavar='CHECKPOINT', default=None,
+                        help='Skip training; report fp32 vs bf16 accuracy/latency of CHECKPOINT on the test split')
+    parser.add_argument('--resume', nargs='?', const=True, default=False, metavar='CHECKPOINT',
+                        help='Resume training from CHECKPOINT (default: the last checkpoint in Config.checkpoint_dir)')
+    parser.add_argument('--ddp', action='store_true',
+                        help='Distributed data-parallel training (gloo); launch with torchrun, e.g. '
+                             'torchrun --nproc_per_node=4 DenseNet121withSE.py --ddp')
+    parser.add_argument('--exit-heads', action='store_true',
+                        help='Jointly train early-exit heads after se2/se3 (for the API early-exit mode)')
+    parser.add_argument('--memory-efficient', action='store_true',
+                        help='Checkpointed dense layers and SE recomputation: less memory per batch, slower steps')
+    parser.add_argument('--batch-size', type=int, default=Config.batch_size)
+    parser.add_argument('--memory-benchmark', nargs='*', type=int, default=None, metavar='BATCH_SIZE',
+                        help='Skip training; report peak RSS vs step time per memory mode (default batches 16 32 64)')
+    parser.add_argument('--patience', type=int, default=Config.early_stopping_patience,
+                        help='Early stopping patience in epochs (0 disables)')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    Config.precision = args.precision
+    Config.early_stopping_patience = args.patience or None
+    Config.distributed = args.ddp
+    Config.exit_heads = args.exit_heads
+    Config.memory_efficient = args.memory_efficient
+    Config.batch_size = args.batch_size
+
+    if args.memory_benchmark is not None:
+        memory_benchmark(args.memory_benchmark or (16, 32, 64))
+        return
+
+    if args.compare_precision:
+        dataloaders, image_datasets = engine.load_data(Config)
+        model, _ = load_model(args.compare_precision)
+        model = model.to(Config.device)
+        engine.compare_precision(model, dataloaders['test'], Config, image_datasets['test'].classes)
+        return
+
+    engine.run(Config, create_optimizer, create_scheduler, resume=args.resume)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,163 @@
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torchvision import models
+import argparse
+import json
+import os
+import engine
+from engine import register_model
+import DenseNet121withSE
+
+# Configuration
+class Config(engine.Config):
+    windows_input_path = r'C:\Users\rohit\OneDrive\Desktop\Data\PreProcessed2' # Update this
+    data_dir = f"/mnt/{windows_input_path[0].lower()}{windows_input_path[2:].replace('\\', '/')}"
+    learning_rate = 0.001
+    batch_augment = True
+    early_stopping_patience = 5
+    model_name = 'student_mobilenet_v3'
+    architecture = 'mobilenet_v3_small'
+    distill_temperature = 4.0
+    distill_alpha = 0.7
+    triage_thresholds = (0.8, 0.9, 0.95, 0.99)  # Student confidences below which a slice escalates to the teacher
+
+# Compact student: MobileNetV3-Small (~1.5M params vs ~7M for DenseNetSE)
+@register_model('mobilenet_v3_small')
+def create_model(num_classes=Config.num_classes, pretrained=True):
+    model = models.mobilenet_v3_small(weights=models.MobileNet_V3_Small_Weights.DEFAULT if pretrained else None)
+    num_ftrs = model.classifier[-1].in_features
+    model.classifier[-1] = nn.Linear(num_ftrs, num_classes)
+    return model
+
+def create_optimizer(model):
+    return optim.Adam(model.parameters(), lr=Config.learning_rate)
+
+def create_scheduler(optimizer):
+    return optim.lr_scheduler.StepLR(optimizer, step_size=7, gamma=0.1)
+
+def save_model_with_metadata(model, metrics, save_dir='models'):
+    return engine.save_model_with_metadata(model, metrics, Config, save_dir)
+
+def load_model(model_path):
+    return engine.load_model(model_path, Config)
+
+def load_any_model(model_path):
+    """Load a checkpoint of any registered architecture. Returns (model, architecture)."""
+    checkpoint = torch.load(model_path, map_location=Config.device)
+    architecture = checkpoint.get('metadata', {}).get('architecture')
+    if architecture == 'densenet121_se':
+        model, _ = DenseNet121withSE.load_model(model_path)
+    else:
+        model, _ = engine.load_model(model_path, engine.get_config(architecture), checkpoint)
+    return model.to(Config.device).eval(), architecture
+
+def triage_report(teacher_path, student_path, compare_paths=(), thresholds=Config.triage_thresholds, save_dir=None):
+    """
+    Test-split throughput vs accuracy of the student, the teacher, the
+    two-tier cascade at each threshold (student screens, uncertain slices
+    escalate) and any other checkpoints from models/ for comparison.
+    Cascade throughput assumes escalated slices are re-run on the teacher.
+    """
+    save_dir = save_dir or Config.results_dir
+    os.makedirs(save_dir, exist_ok=True)
+
+    loaders = {}
+    def test_loader(architecture):
+        # Each architecture is evaluated at its own input size (InceptionV3: 299)
+        image_size = engine.get_config(architecture).image_size
+        if image_size not in loaders:
+            size_config = type('ReportConfig', (Config,), {'image_size': image_size})
+            dataloaders, image_datasets = engine.load_data(size_config)
+            loaders[image_size] = (dataloaders['test'], image_datasets['test'].classes)
+        return loaders[image_size]
+
+    report = {'device': str(Config.device), 'models': {}, 'two_tier': {}}
+    outputs = {}
+    for role, path in [('student', student_path), ('teacher', teacher_path)] + [(None, p) for p in compare_paths]:
+        model, architecture = load_any_model(path)
+        dataloader, class_names = test_loader(architecture)
+        probs, labels, elapsed = engine.collect_probabilities(model, dataloader, Config)
+        cm = engine.update_confusion(torch.zeros(Config.num_classes, Config.num_classes, dtype=torch.long),
+                                     probs.argmax(dim=1), labels)
+        metrics = engine.metrics_from_confusion(cm, class_names)
+        name = role or f'{architecture} ({os.path.basename(path)})'
+        report['models'][name] = {
+            'architecture': architecture,
+            'params': engine.count_parameters(model),
+            'accuracy': metrics['overall_metrics']['accuracy'],
+            'f1': metrics['overall_metrics']['f1'],
+            'ms_per_image': 1000 * elapsed / len(labels),
+            'throughput_images_per_s': len(labels) / elapsed if elapsed > 0 else 0.0
+        }
+        if role:
+            outputs[role] = (probs, labels, elapsed)
+        del model
+
+    student_probs, labels, student_time = outputs['student']
+    teacher_probs, _, teacher_time = outputs['teacher']
+    student_conf, student_preds = student_probs.max(dim=1)
+    teacher_preds = teacher_probs.argmax(dim=1)
+    for threshold in thresholds:
+        escalate = student_conf < threshold
+        preds = torch.where(escalate, teacher_preds, student_preds)
+        cm = engine.update_confusion(torch.zeros(Config.num_classes, Config.num_classes, dtype=torch.long), preds, labels)
+        metrics = engine.metrics_from_confusion(cm, class_names)
+        escalation_rate = escalate.float().mean().item()
+        seconds_per_image = (student_time + escalation_rate * teacher_time) / len(labels)
+        report['two_tier'][str(threshold)] = {
+            'escalation_rate': escalation_rate,
+            'escalation_rate_per_class': {
+                name: escalate[labels == i].float().mean().item() if (labels == i).any() else 0.0
+                for i, name in enumerate(class_names)
+            },
+            'accuracy': metrics['overall_metrics']['accuracy'],
+            'f1': metrics['overall_metrics']['f1'],
+            'ms_per_image': 1000 * seconds_per_image,
+            'throughput_images_per_s': 1.0 / seconds_per_image if seconds_per_image > 0 else 0.0
+        }
+
+    report_path = os.path.join(save_dir, f'{Config.model_name}_triage_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    print("\nThroughput vs accuracy (test split):")
+    for name, values in report['models'].items():
+        print(f"{name}: Accuracy {values['accuracy']:.4f}, {values['throughput_images_per_s']:.1f} img/s")
+    for threshold, values in report['two_tier'].items():
+        print(f"two-tier @ {threshold}: Accuracy {values['accuracy']:.4f}, {values['throughput_images_per_s']:.1f} img/s, "
+              f"{values['escalation_rate']:.1%} escalated")
+    print(f"Report saved to: {report_path}")
+
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Distill DenseNetSE into a compact MobileNetV3-Small student')
+    parser.add_argument('--teacher', required=True, metavar='CHECKPOINT',
+                        help='Trained DenseNetSE checkpoint (DenseNet121withSE.py) providing the soft labels')
+    parser.add_argument('--report', metavar='STUDENT_CHECKPOINT', default=None,
+                        help='Skip training; write the throughput vs accuracy report for this student')
+    parser.add_argument('--compare', nargs='*', default=[], metavar='CHECKPOINT',
+                        help='Other checkpoints from models/ to include in the report')
+    parser.add_argument('--precision', choices=['fp32', 'bf16', 'auto'], default=Config.precision,
+                        help='Autocast precision for training and evaluation')
+    parser.add_argument('--temperature', type=float, default=Config.distill_temperature)
+    parser.add_argument('--alpha', type=float, default=Config.distill_alpha,
+                        help='Weight of the soft-label loss (1 - alpha for the hard labels)')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    Config.precision = args.precision
+    Config.distill_temperature = args.temperature
+    Config.distill_alpha = args.alpha
+
+    if args.report:
+        triage_report(args.teacher, args.report, args.compare)
+        return
+
+    teacher, _ = DenseNet121withSE.load_model(args.teacher)
+    engine.run(Config, create_optimizer, create_scheduler, teacher=teacher)
+
+if __name__ == '__main__':
+    main()
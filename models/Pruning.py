@@ -0,0 +1,183 @@
+import torch
+import torch.nn as nn
+import torch.optim as optim
+import argparse
+import json
+import os
+from tqdm import tqdm
+import engine
+import DenseNet121withSE
+from DenseNet121withSE import DenseNetSE, BLOCK_LAYERS, GROWTH_RATE, block_channels
+
+# Configuration
+class Config(DenseNet121withSE.Config):
+    model_name = 'densenet_se_pruned'
+    learning_rate = 0.0001      # Short fine-tune after pruning
+    num_epochs = 3
+    early_stopping_patience = None
+    keep_ratio = 0.5            # Fraction of each transition's output channels to keep
+    min_channels = 32
+
+def se_statistics(model, dataloader, config):
+    """
+    Mean SE excitation per channel of se2-se4 over `dataloader`.
+    The first channels of dense block k+1's output are transition k's
+    outputs passed straight through the concatenation, so se(k+1)'s
+    weights on them score how much the model uses each transition channel.
+    """
+    sums = {}
+    def hook(name):
+        def record(module, inputs, output):
+            sums[name] = sums.get(name, 0) + output.float().sum(dim=0)
+        return record
+
+    handles = [getattr(model, name).fc.register_forward_hook(hook(name)) for name in ('se2', 'se3', 'se4')]
+    model.eval()
+    num_images = 0
+    try:
+        with torch.no_grad():
+            for inputs, _ in tqdm(dataloader, desc='SE statistics'):
+                with engine.autocast(config):
+                    model(inputs.to(config.device))
+                num_images += inputs.size(0)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return {name: (total / max(num_images, 1)).cpu() for name, total in sums.items()}
+
+def select_channels(stats, transition_channels, keep_ratio, min_channels=32):
+    """Sorted indices of the transition1-3 output channels with the highest mean SE weight."""
+    keep = []
+    for k, name in enumerate(('se2', 'se3', 'se4')):
+        scores = stats[name][:transition_channels[k]]
+        count = max(min_channels, int(round(keep_ratio * transition_channels[k])))
+        keep.append(scores.topk(min(count, transition_channels[k])).indices.sort().values)
+    return keep
+
+def prune_model(model, keep):
+    """
+    Copy of `model` keeping only the `keep[k]` output channels of transition
+    k+1. Everything reading those channels is sliced to match: the next dense
+    block's layers, its SE block and exit head, the following transition
+    and, after the last block, norm5 and the classifier input.
+    """
+    slim = DenseNetSE(num_classes=model.classifier[-1].out_features, pretrained=False, exit_heads=model.exit_heads,
+                      transition_channels=[len(index) for index in keep])
+    state = {name: tensor.clone() for name, tensor in model.state_dict().items()}
+
+    # Original channel indices of each dense block's output after pruning
+    block_out = [torch.arange(block_channels(model.transition_channels)[0])]
+    for k, index in enumerate(keep):
+        original = model.transition_channels[k]
+        growth = torch.arange(original, original + GROWTH_RATE * BLOCK_LAYERS[k + 1])
+        block_out.append(torch.cat([index, growth]))
+
+    def select(name, dim, index):
+        state[name] = state[name].index_select(dim, index.to(state[name].device))
+
+    def select_norm(prefix, index):
+        for param in ('weight', 'bias', 'running_mean', 'running_var'):
+            select(f'{prefix}.{param}', 0, index)
+
+    for k, index in enumerate(keep):
+        transition = f'features.transition{k + 1}'
+        select_norm(f'{transition}.norm', block_out[k])
+        select(f'{transition}.conv.weight', 1, block_out[k])
+        select(f'{transition}.conv.weight', 0, index)
+        for j in range(BLOCK_LAYERS[k + 1]):
+            layer = f'features.denseblock{k + 2}.denselayer{j + 1}'
+            layer_in = block_out[k + 1][:len(index) + GROWTH_RATE * j]
+            select_norm(f'{layer}.norm1', layer_in)
+            select(f'{layer}.conv1.weight', 1, layer_in)
+        select(f'se{k + 2}.fc.0.weight', 1, block_out[k + 1])
+        select(f'se{k + 2}.fc.2.weight', 0, block_out[k + 1])
+
+    select_norm('features.norm5', block_out[3])
+    select('classifier.0.weight', 1, block_out[3])
+    if model.exit_heads:
+        for name, index in (('exit2', block_out[1]), ('exit3', block_out[2])):
+            select_norm(f'{name}.norm', index)
+            select(f'{name}.fc.weight', 1, index)
+
+    slim.load_state_dict(state)
+    return slim
+
+def profile(model, dataloader, config, class_names):
+    cm = engine.predict_confusion(model, dataloader, config)
+    metrics = engine.metrics_from_confusion(cm, class_names)
+    return {
+        'params': engine.count_parameters(model),
+        'gflops': engine.count_flops(model) / 1e9,
+        'latency_ms_batch1': engine.measure_latency(model, config, batch_size=1),
+        'latency_ms_batch32': engine.measure_latency(model, config, batch_size=32, iterations=5),
+        'accuracy': metrics['overall_metrics']['accuracy'],
+        'f1': metrics['overall_metrics']['f1'],
+        'transition_channels': list(model.transition_channels)
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='SE-guided structured channel pruning of DenseNetSE')
+    parser.add_argument('checkpoint', help='Trained DenseNetSE checkpoint (DenseNet121withSE.py)')
+    parser.add_argument('--keep-ratio', type=float, default=Config.keep_ratio,
+                        help='Fraction of transition output channels to keep')
+    parser.add_argument('--finetune-epochs', type=int, default=Config.num_epochs,
+                        help='Fine-tuning epochs after pruning (0 skips)')
+    parser.add_argument('--precision', choices=['fp32', 'bf16', 'auto'], default=Config.precision)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    Config.precision = args.precision
+    Config.num_epochs = args.finetune_epochs
+    engine.set_seed(Config.seed)
+
+    model, _ = DenseNet121withSE.load_model(args.checkpoint)
+    model = model.to(Config.device)
+
+    dataloaders, image_datasets = engine.load_data(Config)
+    class_names = image_datasets['test'].classes
+    # Statistics use un-augmented, normalized training images
+    eval_transforms = engine.build_transforms(Config.image_size)
+    stats_loaders, _ = engine.load_data(Config, {x: eval_transforms['valid'] for x in ['train', 'valid', 'test']})
+
+    print("Profiling the original model...")
+    before = profile(model, dataloaders['test'], Config, class_names)
+
+    stats = se_statistics(model, stats_loaders['train'], Config)
+    keep = select_channels(stats, model.transition_channels, args.keep_ratio, Config.min_channels)
+    slim = prune_model(model, keep).to(Config.device)
+    print(f"Transition channels: {list(model.transition_channels)} -> {list(slim.transition_channels)}")
+
+    if args.finetune_epochs > 0:
+        print(f"Fine-tuning the pruned model for {args.finetune_epochs} epochs...")
+        optimizer = optim.Adam(slim.parameters(), lr=Config.learning_rate)
+        slim = engine.train_model(slim, dataloaders, nn.CrossEntropyLoss(), optimizer, config=Config)
+
+    print("Profiling the pruned model...")
+    after = profile(slim, dataloaders['test'], Config, class_names)
+    test_metrics = engine.evaluate_model(slim, dataloaders['test'], Config, class_names)
+    model_path, metadata_path = engine.save_model_with_metadata(slim, test_metrics, Config)
+
+    report = {
+        'source_checkpoint': args.checkpoint,
+        'keep_ratio': args.keep_ratio,
+        'finetune_epochs': args.finetune_epochs,
+        'mean_se_weight_kept': [float(stats[name][index].mean()) for name, index in zip(('se2', 'se3', 'se4'), keep)],
+        'before': before,
+        'after': after,
+        'pruned_model': model_path
+    }
+    os.makedirs(Config.results_dir, exist_ok=True)
+    report_path = os.path.join(Config.results_dir, f'{Config.model_name}_pruning_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    print("\n          params      GFLOPs   ms (b=1)  accuracy")
+    for name, values in (('before', before), ('after', after)):
+        print(f"{name:8} {values['params']:10,d} {values['gflops']:9.3f} {values['latency_ms_batch1']:9.1f} "
+              f"{values['accuracy']:9.4f}")
+    print(f"\nPruned model saved to: {model_path} (load with the API's MODEL_PATH)")
+    print(f"Report saved to: {report_path}")
+
+if __name__ == '__main__':
+    main()
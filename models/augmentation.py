@@ -0,0 +1,119 @@
+import math
+import torch
+from torch.nn import functional as F
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+# Luma weights used by torchvision's ColorJitter contrast (rgb_to_grayscale)
+GRAYSCALE_WEIGHTS = [0.299, 0.587, 0.114]
+
+
+class BatchAugment:
+    """
+    Batched replacement for the per-sample PIL train transforms
+    (RandomHorizontalFlip, RandomRotation, RandomAffine translate, ColorJitter
+    brightness/contrast, Normalize).
+
+    Expects a float batch in [0, 1] of shape (B, 3, H, W), i.e. the output of
+    transforms.ToTensor() collated by the DataLoader. Flip, rotation and
+    translation are folded into one affine matrix per sample and applied with a
+    single grid_sample call for the whole batch; brightness and contrast are
+    broadcast tensor ops. Parameters are drawn from a private generator that is
+    reseeded every epoch, so a given (seed, epoch, batch order) always produces
+    the same augmentations regardless of DataLoader worker count.
+    """
+
+    def __init__(self, degrees=10, translate=(0.1, 0.1), flip_p=0.5,
+                 brightness=0.2, contrast=0.2,
+                 mean=IMAGENET_MEAN, std=IMAGENET_STD, seed=42):
+        self.degrees = degrees
+        self.translate = translate
+        self.flip_p = flip_p
+        self.brightness = brightness
+        self.contrast = contrast
+        self.mean = torch.tensor(mean).view(1, -1, 1, 1)
+        self.std = torch.tensor(std).view(1, -1, 1, 1)
+        self.gray_weights = torch.tensor(GRAYSCALE_WEIGHTS).view(1, -1, 1, 1)
+        self.seed = seed
+        self.generator = torch.Generator()
+        self.set_epoch(0)
+
+    def set_epoch(self, epoch):
+        """Reseed the parameter generator so each epoch is reproducible on its own."""
+        self.generator.manual_seed(self.seed + epoch)
+
+    def _uniform(self, n, low, high):
+        return torch.rand(n, generator=self.generator) * (high - low) + low
+
+    def sample_params(self, batch_size, height, width):
+        """Draw one set of augmentation parameters per sample (on CPU)."""
+        flip = torch.rand(batch_size, generator=self.generator) < self.flip_p
+        angle = self._uniform(batch_size, -self.degrees, self.degrees)
+        # Same pixel ranges as RandomAffine: round(uniform(-t * size, t * size))
+        max_dx = self.translate[0] * width
+        max_dy = self.translate[1] * height
+        tx = torch.round(self._uniform(batch_size, -max_dx, max_dx))
+        ty = torch.round(self._uniform(batch_size, -max_dy, max_dy))
+        brightness = self._uniform(batch_size, 1 - self.brightness, 1 + self.brightness)
+        contrast = self._uniform(batch_size, 1 - self.contrast, 1 + self.contrast)
+        return {
+            'flip': flip,
+            'angle': angle,
+            'tx': tx,
+            'ty': ty,
+            'brightness': brightness,
+            'contrast': contrast
+        }
+
+    @staticmethod
+    def affine_theta(flip, angle, tx, ty, height, width):
+        """
+        Build the (B, 2, 3) sampling matrices for F.affine_grid.
+
+        The content transform is flip -> rotate -> translate (torchvision's
+        order). affine_grid maps output coordinates to input coordinates, so we
+        need the inverse: p_in = M (p_out - t), with M = S^-1 F R^T S where S
+        rescales normalized coordinates to pixels to keep rotations rigid on
+        non-square images.
+        """
+        rad = angle * (math.pi / 180.0)
+        cos = torch.cos(rad)
+        sin = torch.sin(rad)
+        f = torch.where(flip, -torch.ones_like(cos), torch.ones_like(cos))
+
+        theta = torch.zeros(angle.size(0), 2, 3)
+        theta[:, 0, 0] = f * cos
+        theta[:, 0, 1] = f * sin * (height / width)
+        theta[:, 1, 0] = -sin * (width / height)
+        theta[:, 1, 1] = cos
+
+        # Pixel shift -> normalized [-1, 1] shift
+        t_x = 2.0 * tx / width
+        t_y = 2.0 * ty / height
+        theta[:, 0, 2] = -(theta[:, 0, 0] * t_x + theta[:, 0, 1] * t_y)
+        theta[:, 1, 2] = -(theta[:, 1, 0] * t_x + theta[:, 1, 1] * t_y)
+        return theta
+
+    def __call__(self, inputs):
+        b, _, h, w = inputs.size()
+        params = self.sample_params(b, h, w)
+        device = inputs.device
+        dtype = inputs.dtype
+
+        # Geometric: flip + rotation + translation in one resample
+        theta = self.affine_theta(params['flip'], params['angle'], params['tx'], params['ty'], h, w)
+        grid = F.affine_grid(theta.to(device=device, dtype=dtype), list(inputs.size()), align_corners=False)
+        x = F.grid_sample(inputs, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+
+        # Photometric: brightness then contrast, blended against black / grey mean
+        brightness = params['brightness'].to(device=device, dtype=dtype).view(b, 1, 1, 1)
+        x = (x * brightness).clamp_(0.0, 1.0)
+
+        contrast = params['contrast'].to(device=device, dtype=dtype).view(b, 1, 1, 1)
+        gray_mean = (x * self.gray_weights.to(device=device, dtype=dtype)).sum(dim=1, keepdim=True).mean(dim=(2, 3), keepdim=True)
+        x = ((x - gray_mean) * contrast + gray_mean).clamp_(0.0, 1.0)
+
+        # Normalize
+        x = (x - self.mean.to(device=device, dtype=dtype)) / self.std.to(device=device, dtype=dtype)
+        return x
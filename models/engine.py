@@ -0,0 +1,856 @@
+import torch
+import torch.nn as nn
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data.distributed import DistributedSampler
+from torchvision import transforms, datasets
+from torch.utils.data import DataLoader
+import matplotlib.pyplot as plt
+import seaborn as sns
+from tqdm import tqdm
+import numpy as np
+import importlib
+import functools
+import contextlib
+import copy
+import time
+import random
+import os
+import json
+from datetime import datetime
+
+from augmentation import BatchAugment, IMAGENET_MEAN, IMAGENET_STD
+
+CLASS_NAMES = ['adenocarcinoma', 'large_cell_carcinoma', 'normal', 'squamous_cell_carcinoma']
+
+
+# Base configuration. Each architecture script subclasses this and overrides
+# what differs (data_dir, learning_rate, image_size, model_name, ...).
+class Config:
+    data_dir = None
+    model_name = 'model'        # Used for checkpoint / metrics file names
+    architecture = None         # Registry key, stored in checkpoint metadata
+    batch_size = 32
+    num_epochs = 50
+    learning_rate = 0.001
+    num_classes = 4
+    image_size = None           # (H, W) to resize to, None if data is pre-sized
+    num_workers = 4
+    seed = 42
+    precision = 'fp32'          # 'fp32', 'bf16' or 'auto' (bf16 when the device supports it)
+    aux_loss_weight = 0.4       # Weight of each auxiliary logits output (InceptionV3, exit heads)
+    distill_temperature = 4.0   # Softmax temperature for knowledge distillation from a teacher
+    distill_alpha = 0.7         # Weight of the soft-label (teacher) loss vs. the hard-label loss
+    save_dir = 'models'
+    results_dir = 'results'
+    checkpoint_dir = 'checkpoints'
+    checkpoint_every = 1        # Epochs between resumable checkpoints (0 disables)
+    batch_augment = False       # Augment on whole batches (BatchAugment) instead of per-sample PIL transforms
+    early_stopping_metric = 'valid_acc'   # 'valid_acc' or 'valid_loss'
+    early_stopping_patience = None        # Epochs without improvement, None disables
+    early_stopping_min_delta = 0.0
+    distributed = False         # DDP mode, launched with torchrun (one process per rank)
+    dist_backend = 'gloo'
+    linear_lr_scaling = True    # Multiply learning_rate by world_size under DDP
+    rank = 0
+    world_size = 1
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+
+# Model factory registry
+MODEL_REGISTRY = {}
+
+# Registry key -> script module defining the factory, imported on first use
+ARCHITECTURE_MODULES = {
+    'alexnet': 'AlexNet',
+    'resnet50': 'ResNet50',
+    'inception_v3': 'InceptionV3',
+    'densenet121': 'DenseNet121',
+    'densenet121_se': 'DenseNet121withSE',
+    'mobilenet_v3_small': 'Distillation'
+}
+
+
+def register_model(name):
+    """Decorator registering a `factory(num_classes, pretrained)` under `name`."""
+    def decorator(factory):
+        MODEL_REGISTRY[name] = factory
+        return factory
+    return decorator
+
+
+def get_model_factory(name):
+    if name not in MODEL_REGISTRY and name in ARCHITECTURE_MODULES:
+        importlib.import_module(ARCHITECTURE_MODULES[name])
+    if name not in MODEL_REGISTRY:
+        raise KeyError(f"Unknown architecture '{name}'. Available: {sorted(ARCHITECTURE_MODULES)}")
+    return MODEL_REGISTRY[name]
+
+
+def build_model(name, num_classes=4, pretrained=True):
+    return get_model_factory(name)(num_classes=num_classes, pretrained=pretrained)
+
+
+def get_config(name):
+    """The Config class of the script defining architecture `name` (data_dir, image_size, ...)."""
+    if name not in ARCHITECTURE_MODULES:
+        raise KeyError(f"Unknown architecture '{name}'. Available: {sorted(ARCHITECTURE_MODULES)}")
+    return importlib.import_module(ARCHITECTURE_MODULES[name]).Config
+
+
+def set_seed(seed):
+    torch.manual_seed(seed)
+    if torch.cuda.is_available():
+        torch.cuda.manual_seed(seed)
+
+
+@functools.lru_cache(maxsize=None)
+def bf16_supported(device):
+    """Whether `device` has native bfloat16 matmul/conv support (AVX512-BF16/AMX on CPU)."""
+    if device.type == 'cuda':
+        return torch.cuda.is_bf16_supported()
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        pass
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+        return 'avx512_bf16' in flags or 'amx_bf16' in flags
+    except OSError:
+        return False
+
+
+_bf16_warned = set()
+
+
+def resolve_precision(config):
+    """Turn config.precision into the precision actually used ('fp32' or 'bf16')."""
+    requested = getattr(config, 'precision', 'fp32')
+    if requested == 'fp32':
+        return 'fp32'
+    supported = bf16_supported(config.device)
+    if requested == 'bf16' and not supported and config.device not in _bf16_warned:
+        _bf16_warned.add(config.device)
+        print(f"Warning: bfloat16 requested but not supported natively on {config.device}; falling back to fp32.")
+    return 'bf16' if supported else 'fp32'
+
+
+def autocast(config):
+    """
+    Autocast context for config.precision. bfloat16 keeps fp32's exponent
+    range, so unlike fp16 no GradScaler / loss scaling is needed.
+    """
+    if resolve_precision(config) != 'bf16':
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=config.device.type, dtype=torch.bfloat16)
+
+
+def init_distributed(config):
+    """
+    Join the process group set up by torchrun (env:// rendezvous). Each rank
+    gets an equal share of the local cores for intra-op parallelism.
+    """
+    if not config.distributed:
+        return
+    dist.init_process_group(backend=config.dist_backend)
+    config.rank = dist.get_rank()
+    config.world_size = dist.get_world_size()
+
+    local_rank = int(os.environ.get('LOCAL_RANK', 0))
+    local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', config.world_size))
+    if config.device.type == 'cuda':
+        config.device = torch.device(f'cuda:{local_rank}')
+        torch.cuda.set_device(config.device)
+    else:
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world_size))
+
+    print(f'Rank {config.rank}/{config.world_size} initialised ({config.dist_backend}, {torch.get_num_threads()} threads)')
+
+
+def cleanup_distributed(config):
+    if config.distributed and dist.is_initialized():
+        dist.destroy_process_group()
+
+
+def is_main_process(config):
+    return config.rank == 0
+
+
+def barrier(config):
+    if config.world_size > 1:
+        dist.barrier()
+
+
+def all_reduce_sum(tensor, config):
+    if config.world_size > 1:
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+
+def broadcast_object(obj, config, src=0):
+    """Rank `src`'s (picklable) `obj` on every rank."""
+    if config.world_size > 1:
+        holder = [obj]
+        dist.broadcast_object_list(holder, src=src)
+        obj = holder[0]
+    return obj
+
+
+def unwrap_model(model):
+    return model.module if isinstance(model, DistributedDataParallel) else model
+
+
+# Data transforms. With batch_augment, train augmentation is done batched by
+# BatchAugment, so the train split is only resized and converted to a [0, 1]
+# tensor here; otherwise it gets the per-sample PIL augmentations.
+def build_transforms(image_size=None, batch_augment=False):
+    resize = [transforms.Resize(image_size)] if image_size else []
+    eval_transform = transforms.Compose(resize + [
+        transforms.ToTensor(),
+        transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+    ])
+    if batch_augment:
+        train_transform = transforms.Compose(resize + [transforms.ToTensor()])
+    else:
+        train_transform = transforms.Compose(resize + [
+            transforms.RandomHorizontalFlip(),
+            transforms.RandomRotation(10),
+            transforms.RandomAffine(0, translate=(0.1, 0.1)),
+            transforms.ColorJitter(brightness=0.2, contrast=0.2),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+        ])
+    return {
+        'train': train_transform,
+        'valid': eval_transform,
+        'test': eval_transform
+    }
+
+
+def load_data(config, data_transforms=None):
+    if data_transforms is None:
+        data_transforms = build_transforms(config.image_size, config.batch_augment)
+
+    image_datasets = {
+        x: datasets.ImageFolder(os.path.join(config.data_dir, x), data_transforms[x])
+        for x in ['train', 'valid', 'test']
+    }
+
+    # Under DDP train/valid are sharded across ranks; test is evaluated on rank 0 only
+    samplers = {x: None for x in ['train', 'valid', 'test']}
+    if config.world_size > 1:
+        for x in ['train', 'valid']:
+            samplers[x] = DistributedSampler(image_datasets[x], num_replicas=config.world_size, rank=config.rank,
+                                             shuffle=(x == 'train'), seed=config.seed)
+
+    dataloaders = {
+        x: DataLoader(image_datasets[x], batch_size=config.batch_size,
+                      shuffle=(x == 'train' and samplers[x] is None), sampler=samplers[x],
+                      num_workers=config.num_workers, pin_memory=config.device.type == 'cuda',
+                      persistent_workers=config.num_workers > 0)
+        for x in ['train', 'valid', 'test']
+    }
+
+    return dataloaders, image_datasets
+
+
+def primary_output(outputs):
+    """Main logits from a model output (InceptionV3 / DenseNetSE with exit heads return (logits, *aux) in train mode)."""
+    if isinstance(outputs, tuple):
+        return outputs[0]
+    return outputs
+
+
+def compute_loss(outputs, labels, criterion, aux_loss_weight=0.4):
+    if isinstance(outputs, tuple):
+        loss = criterion(outputs[0], labels)
+        for aux_logits in outputs[1:]:
+            loss = loss + aux_loss_weight * criterion(aux_logits, labels)
+        return loss
+    return criterion(outputs, labels)
+
+
+def distillation_loss(student_logits, teacher_logits, labels, criterion, temperature=4.0, alpha=0.7):
+    """
+    Hinton et al. knowledge distillation: KL divergence between temperature
+    softened student and teacher distributions (scaled by T^2 so gradients
+    keep their magnitude), mixed with the hard-label loss.
+    """
+    soft = nn.functional.kl_div(
+        nn.functional.log_softmax(student_logits.float() / temperature, dim=1),
+        nn.functional.softmax(teacher_logits.float() / temperature, dim=1),
+        reduction='batchmean'
+    ) * temperature ** 2
+    return alpha * soft + (1 - alpha) * compute_loss(student_logits, labels, criterion)
+
+
+def update_confusion(cm, preds, labels):
+    """Accumulate a (num_classes, num_classes) confusion matrix on-device; rows are true labels."""
+    num_classes = cm.size(0)
+    cm += torch.bincount(labels * num_classes + preds, minlength=num_classes * num_classes).view(num_classes, num_classes)
+    return cm
+
+
+def run_epoch(model, dataloader, criterion, optimizer, config, phase, augment=None, teacher=None):
+    """
+    One pass over `dataloader`. Loss and correct counts are accumulated as
+    device tensors and only synced to Python (and across DDP ranks) once at
+    the end of the epoch. With a `teacher` (eval mode), training batches use
+    the distillation loss on the same augmented inputs; validation keeps the
+    plain loss so early stopping compares like with like.
+    """
+    is_train = phase == 'train'
+    model.train(is_train)
+
+    running_loss = torch.zeros((), device=config.device)
+    running_corrects = torch.zeros((), dtype=torch.long, device=config.device)
+    num_samples = 0
+
+    for inputs, labels in tqdm(dataloader, desc=phase, disable=not is_main_process(config)):
+        inputs = inputs.to(config.device, non_blocking=True)
+        labels = labels.to(config.device, non_blocking=True)
+        if is_train and augment is not None:
+            inputs = augment(inputs)
+
+        if is_train:
+            optimizer.zero_grad(set_to_none=True)
+
+        with torch.set_grad_enabled(is_train):
+            with autocast(config):
+                outputs = model(inputs)
+                if is_train and teacher is not None:
+                    with torch.no_grad():
+                        teacher_logits = primary_output(teacher(inputs))
+                    loss = distillation_loss(outputs, teacher_logits, labels, criterion,
+                                             config.distill_temperature, config.distill_alpha)
+                else:
+                    loss = compute_loss(outputs, labels, criterion, config.aux_loss_weight)
+
+            if is_train:
+                loss.backward()
+                optimizer.step()
+
+        preds = primary_output(outputs).detach().argmax(dim=1)
+        running_loss += loss.detach() * inputs.size(0)
+        running_corrects += (preds == labels).sum()
+        num_samples += inputs.size(0)
+
+    totals = torch.stack([
+        running_loss.double(),
+        running_corrects.double(),
+        torch.tensor(float(num_samples), dtype=torch.float64, device=config.device)
+    ])
+    loss_sum, corrects, num_samples = all_reduce_sum(totals, config).tolist()
+    num_samples = max(num_samples, 1)
+    return loss_sum / num_samples, corrects / num_samples
+
+
+def checkpoint_path(config):
+    return os.path.join(config.checkpoint_dir, f'{config.model_name}_last.pth')
+
+
+def capture_rng_state():
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state()
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def save_checkpoint(path, epoch, model, optimizer, scheduler, state):
+    """
+    Write a resumable training checkpoint. The file is written to a temp
+    path and renamed so a crash mid-write never corrupts the last good one.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    checkpoint = {
+        'epoch': epoch,
+        'model_state_dict': unwrap_model(model).state_dict(),
+        'optimizer_state_dict': optimizer.state_dict(),
+        'scheduler_state_dict': scheduler.state_dict() if scheduler is not None else None,
+        'rng_state': capture_rng_state(),
+        **state
+    }
+    tmp_path = f'{path}.tmp'
+    torch.save(checkpoint, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path, model, optimizer, scheduler, config):
+    """
+    Restore model/optimizer/scheduler/RNG state; returns the checkpoint dict,
+    or None if there is no checkpoint at `path`. Under DDP only rank 0 (which
+    writes checkpoints) reads the file and broadcasts it, so every rank
+    resumes from the same weights and epoch without a shared filesystem.
+    """
+    checkpoint = None
+    if is_main_process(config) and os.path.exists(path):
+        # Broadcast on CPU; load_state_dict copies onto each rank's device
+        map_location = 'cpu' if config.world_size > 1 else config.device
+        checkpoint = torch.load(path, map_location=map_location, weights_only=False)
+    checkpoint = broadcast_object(checkpoint, config)
+    if checkpoint is None:
+        return None
+    unwrap_model(model).load_state_dict(checkpoint['model_state_dict'])
+    optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+    if scheduler is not None and checkpoint.get('scheduler_state_dict') is not None:
+        scheduler.load_state_dict(checkpoint['scheduler_state_dict'])
+    restore_rng_state(checkpoint['rng_state'])
+    return checkpoint
+
+
+def is_improvement(value, best, config):
+    if best is None:
+        return True
+    if config.early_stopping_metric == 'valid_loss':
+        return value < best - config.early_stopping_min_delta
+    return value > best + config.early_stopping_min_delta
+
+
+def train_model(model, dataloaders, criterion, optimizer, scheduler=None, config=Config, augment=None, resume_from=None,
+                teacher=None):
+    """
+    Train with per-epoch validation, restoring the weights with the best
+    validation metric. Every `config.checkpoint_every` epochs the full
+    training state is written to `checkpoint_path(config)`; pass that path
+    as `resume_from` to continue after a crash. Training stops early when
+    the validation metric hasn't improved for `config.early_stopping_patience`
+    epochs (None disables early stopping).
+
+    `model` may be wrapped in DistributedDataParallel; epoch metrics are then
+    global across ranks, so every rank takes the same early-stopping decision,
+    and only rank 0 writes checkpoints.
+
+    `teacher`, if given, is a frozen model whose soft labels the training
+    loss distills from (see distillation_loss).
+    """
+    if augment is None and config.batch_augment:
+        # Offset by rank so ranks don't apply identical augmentations per batch slot
+        augment = BatchAugment(seed=config.seed + 1000 * config.rank)
+
+    best_model_wts = copy.deepcopy(unwrap_model(model).state_dict())
+    best_metric = None
+    epochs_without_improvement = 0
+    history = []
+    start_epoch = 0
+
+    if resume_from is not None:
+        checkpoint = load_checkpoint(resume_from, model, optimizer, scheduler, config)
+        if checkpoint is not None:
+            start_epoch = checkpoint['epoch'] + 1
+            best_model_wts = checkpoint['best_model_state_dict']
+            best_metric = checkpoint['best_metric']
+            epochs_without_improvement = checkpoint['epochs_without_improvement']
+            history = checkpoint['history']
+            print(f'Resumed from {resume_from} at epoch {start_epoch+1}')
+        else:
+            print(f'Warning: checkpoint {resume_from} not found, starting from scratch')
+
+    for epoch in range(start_epoch, config.num_epochs):
+        print(f'Epoch {epoch+1}/{config.num_epochs}')
+        print('-' * 10)
+        if augment is not None:
+            augment.set_epoch(epoch)
+        for phase in ['train', 'valid']:
+            if isinstance(dataloaders[phase].sampler, DistributedSampler):
+                dataloaders[phase].sampler.set_epoch(epoch)
+
+        epoch_stats = {'epoch': epoch + 1}
+        for phase in ['train', 'valid']:
+            epoch_loss, epoch_acc = run_epoch(model, dataloaders[phase], criterion, optimizer, config, phase, augment, teacher)
+
+            if phase == 'train' and scheduler is not None:
+                scheduler.step()
+
+            print(f'{phase} Loss: {epoch_loss:.4f} Acc: {epoch_acc:.4f}')
+            epoch_stats[f'{phase}_loss'] = epoch_loss
+            epoch_stats[f'{phase}_acc'] = epoch_acc
+
+        history.append(epoch_stats)
+
+        monitored = epoch_stats[config.early_stopping_metric]
+        if is_improvement(monitored, best_metric, config):
+            best_metric = monitored
+            best_model_wts = copy.deepcopy(unwrap_model(model).state_dict())
+            epochs_without_improvement = 0
+        else:
+            epochs_without_improvement += 1
+
+        patience = config.early_stopping_patience
+        stop_early = patience is not None and epochs_without_improvement >= patience
+
+        if is_main_process(config) and config.checkpoint_every and ((epoch + 1) % config.checkpoint_every == 0 or stop_early
+                                        or epoch + 1 == config.num_epochs):
+            save_checkpoint(checkpoint_path(config), epoch, model, optimizer, scheduler, {
+                'best_model_state_dict': best_model_wts,
+                'best_metric': best_metric,
+                'epochs_without_improvement': epochs_without_improvement,
+                'history': history
+            })
+
+        print()
+
+        if stop_early:
+            print(f'Early stopping: no {config.early_stopping_metric} improvement for {patience} epochs')
+            break
+
+    unwrap_model(model).load_state_dict(best_model_wts)
+    return model
+
+
+def predict_confusion(model, dataloader, config):
+    """Run `model` over `dataloader` and return the confusion matrix as a CPU tensor."""
+    model.eval()
+    cm = torch.zeros(config.num_classes, config.num_classes, dtype=torch.long, device=config.device)
+
+    with torch.no_grad():
+        for inputs, labels in tqdm(dataloader, desc='eval'):
+            inputs = inputs.to(config.device, non_blocking=True)
+            labels = labels.to(config.device, non_blocking=True)
+            with autocast(config):
+                outputs = model(inputs)
+            preds = primary_output(outputs).argmax(dim=1)
+            update_confusion(cm, preds, labels)
+
+    return cm.cpu()
+
+
+def metrics_from_confusion(cm, class_names=CLASS_NAMES):
+    """Per-class and macro-averaged metrics from a confusion matrix (rows = true labels)."""
+    cm = cm.double()
+    true_positives = cm.diag()
+    support = cm.sum(dim=1)
+    predicted = cm.sum(dim=0)
+
+    # Same zero_division=0 behaviour as sklearn
+    precision = torch.where(predicted > 0, true_positives / predicted.clamp(min=1), torch.zeros_like(true_positives))
+    recall = torch.where(support > 0, true_positives / support.clamp(min=1), torch.zeros_like(true_positives))
+    denom = precision + recall
+    f1 = torch.where(denom > 0, 2 * precision * recall / denom.clamp(min=1e-12), torch.zeros_like(denom))
+
+    per_class_metrics = {}
+    for i, class_name in enumerate(class_names):
+        per_class_metrics[class_name] = {
+            'correct': int(true_positives[i]),
+            'total': int(support[i]),
+            'accuracy': float(recall[i]),
+            'precision': float(precision[i]),
+            'recall': float(recall[i]),
+            'f1': float(f1[i])
+        }
+
+    total = float(support.sum())
+    overall_metrics = {
+        'precision': float(precision.mean()),
+        'recall': float(recall.mean()),
+        'f1': float(f1.mean()),
+        'accuracy': float(true_positives.sum() / total) if total > 0 else 0.0
+    }
+
+    return {
+        'per_class_metrics': per_class_metrics,
+        'overall_metrics': overall_metrics,
+        'confusion_matrix': cm.long().tolist()
+    }
+
+
+def plot_confusion_matrix(cm, class_names, path, title='Confusion Matrix'):
+    plt.figure(figsize=(10, 8))
+    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
+                xticklabels=class_names, yticklabels=class_names)
+    plt.title(title)
+    plt.ylabel('True Label')
+    plt.xlabel('Predicted Label')
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+
+
+def evaluate_model(model, dataloader, config=Config, class_names=CLASS_NAMES, save_dir=None):
+    save_dir = save_dir or config.results_dir
+    os.makedirs(save_dir, exist_ok=True)
+
+    cm = predict_confusion(model, dataloader, config)
+    results = metrics_from_confusion(cm, class_names)
+
+    plot_confusion_matrix(results['confusion_matrix'], class_names,
+                          os.path.join(save_dir, f'{config.model_name}_confusion_matrix.png'),
+                          title=f'Confusion Matrix - {config.model_name}')
+
+    metrics_path = os.path.join(save_dir, f'{config.model_name}_test_metrics.json')
+    with open(metrics_path, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    return results
+
+
+def compare_precision(model, dataloader, config=Config, class_names=CLASS_NAMES, save_dir=None):
+    """
+    Evaluate `model` on `dataloader` in fp32 and bf16 and report accuracy and
+    per-batch latency side by side. bf16 is skipped if the device lacks support.
+    """
+    save_dir = save_dir or config.results_dir
+    os.makedirs(save_dir, exist_ok=True)
+    model.eval()
+
+    report = {'device': str(config.device), 'bf16_supported': bf16_supported(config.device), 'modes': {}}
+    for precision in ['fp32', 'bf16']:
+        if precision == 'bf16' and not report['bf16_supported']:
+            continue
+
+        mode_config = type('PrecisionConfig', (config,), {'precision': precision})
+        cm = torch.zeros(config.num_classes, config.num_classes, dtype=torch.long, device=config.device)
+        batch_times = []
+        num_samples = 0
+
+        with torch.no_grad():
+            for inputs, labels in tqdm(dataloader, desc=precision):
+                inputs = inputs.to(config.device)
+                labels = labels.to(config.device)
+                start = time.perf_counter()
+                with autocast(mode_config):
+                    outputs = model(inputs)
+                preds = primary_output(outputs).argmax(dim=1)
+                if config.device.type == 'cuda':
+                    torch.cuda.synchronize()
+                batch_times.append(time.perf_counter() - start)
+                update_confusion(cm, preds, labels)
+                num_samples += inputs.size(0)
+
+        metrics = metrics_from_confusion(cm.cpu(), class_names)
+        total_time = sum(batch_times)
+        report['modes'][precision] = {
+            'accuracy': metrics['overall_metrics']['accuracy'],
+            'f1': metrics['overall_metrics']['f1'],
+            'mean_batch_latency_ms': 1000 * total_time / max(len(batch_times), 1),
+            'throughput_images_per_s': num_samples / total_time if total_time > 0 else 0.0,
+            'per_class_metrics': metrics['per_class_metrics']
+        }
+
+    if 'bf16' in report['modes']:
+        fp32, bf16 = report['modes']['fp32'], report['modes']['bf16']
+        report['accuracy_delta'] = bf16['accuracy'] - fp32['accuracy']
+        report['speedup'] = fp32['mean_batch_latency_ms'] / bf16['mean_batch_latency_ms'] if bf16['mean_batch_latency_ms'] > 0 else 0.0
+
+    report_path = os.path.join(save_dir, f'{config.model_name}_precision_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    print("\nPrecision comparison:")
+    for precision, values in report['modes'].items():
+        print(f"{precision}: Accuracy {values['accuracy']:.4f}, "
+              f"{values['mean_batch_latency_ms']:.1f} ms/batch, {values['throughput_images_per_s']:.1f} img/s")
+    print(f"Report saved to: {report_path}")
+
+    return report
+
+
+def collect_probabilities(model, dataloader, config):
+    """
+    Softmax outputs and labels of `model` over `dataloader` (CPU tensors, in
+    loader order) plus the total forward time in seconds.
+    """
+    model.eval()
+    all_probs, all_labels = [], []
+    elapsed = 0.0
+
+    with torch.no_grad():
+        for inputs, labels in tqdm(dataloader, desc='eval'):
+            inputs = inputs.to(config.device)
+            start = time.perf_counter()
+            with autocast(config):
+                outputs = model(inputs)
+            probs = torch.softmax(primary_output(outputs).float(), dim=1)
+            if config.device.type == 'cuda':
+                torch.cuda.synchronize()
+            elapsed += time.perf_counter() - start
+            all_probs.append(probs.cpu())
+            all_labels.append(labels)
+
+    return torch.cat(all_probs), torch.cat(all_labels), elapsed
+
+
+def count_parameters(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+def count_flops(model, input_size=(224, 224), device=None):
+    """
+    Multiply-accumulates of one forward pass on a single image, counted with
+    hooks on every Conv2d and Linear (the convention torchvision's GFLOPS
+    figures use, e.g. 2.83 for DenseNet-121).
+    """
+    device = device or next(model.parameters()).device
+    total = [0]
+
+    def conv_hook(module, inputs, output):
+        kernel = module.kernel_size[0] * module.kernel_size[1] * (module.in_channels // module.groups)
+        total[0] += output.numel() * kernel
+
+    def linear_hook(module, inputs, output):
+        total[0] += output.numel() * module.in_features
+
+    handles = []
+    for module in model.modules():
+        if isinstance(module, nn.Conv2d):
+            handles.append(module.register_forward_hook(conv_hook))
+        elif isinstance(module, nn.Linear):
+            handles.append(module.register_forward_hook(linear_hook))
+
+    was_training = model.training
+    model.eval()
+    try:
+        with torch.no_grad():
+            model(torch.zeros(1, 3, *input_size, device=device))
+    finally:
+        model.train(was_training)
+        for handle in handles:
+            handle.remove()
+    return total[0]
+
+
+def measure_latency(model, config, input_size=(224, 224), batch_size=1, warmup=5, iterations=20):
+    """Median forward latency in milliseconds for a random batch, under config.precision."""
+    model.eval()
+    inputs = torch.randn(batch_size, 3, *input_size, device=config.device)
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + iterations):
+            start = time.perf_counter()
+            with autocast(config):
+                model(inputs)
+            if config.device.type == 'cuda':
+                torch.cuda.synchronize()
+            if i >= warmup:
+                timings.append(1000 * (time.perf_counter() - start))
+    return float(np.median(timings))
+
+
+def print_metrics(metrics):
+    print("\nPer-Class Performance:")
+    for class_name, class_metrics in metrics['per_class_metrics'].items():
+        print(f"\n{class_name}:")
+        print(f"Correct predictions: {class_metrics['correct']}/{class_metrics['total']}")
+        print(f"Accuracy: {class_metrics['accuracy']:.4f}")
+        print(f"Precision: {class_metrics['precision']:.4f}")
+        print(f"Recall: {class_metrics['recall']:.4f}")
+        print(f"F1-Score: {class_metrics['f1']:.4f}")
+
+    print("\nOverall Metrics:")
+    for metric, value in metrics['overall_metrics'].items():
+        print(f"{metric.capitalize()}: {value:.4f}")
+
+
+def save_model_with_metadata(model, metrics, config=Config, save_dir=None):
+    """
+    Save model with metadata including architecture details and performance metrics
+    """
+    save_dir = save_dir or config.save_dir
+    os.makedirs(save_dir, exist_ok=True)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    model_filename = f'lung_cancer_{config.model_name}_{timestamp}.pth'
+    model_path = os.path.join(save_dir, model_filename)
+
+    metadata = {
+        'timestamp': timestamp,
+        'architecture': config.architecture,
+        'num_classes': config.num_classes,
+        'metrics': metrics,
+        'model_filename': model_filename
+    }
+
+    torch.save({
+        'model_state_dict': model.state_dict(),
+        'metadata': metadata
+    }, model_path)
+
+    metadata_path = os.path.join(save_dir, f'{config.model_name}_metadata_{timestamp}.json')
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=4)
+
+    return model_path, metadata_path
+
+
+def load_model(model_path, config=Config, checkpoint=None):
+    """
+    Load a saved model with its metadata. `checkpoint` may be passed if the
+    file was already loaded by the caller.
+    """
+    if checkpoint is None:
+        checkpoint = torch.load(model_path, map_location=config.device)
+    metadata = checkpoint.get('metadata', {})
+    architecture = metadata.get('architecture') or config.architecture
+
+    model = build_model(architecture, num_classes=metadata.get('num_classes', config.num_classes), pretrained=False)
+    model.load_state_dict(checkpoint['model_state_dict'])
+
+    return model, metadata
+
+
+def run(config, create_optimizer, create_scheduler=None, criterion=None, resume=False, teacher=None):
+    """
+    Standard script entry point: load data, build the registered model,
+    train, evaluate on the test split and save with metadata. `resume` may be
+    True (use the default checkpoint path) or a checkpoint path. `teacher`
+    switches training to knowledge distillation from that model.
+    """
+    init_distributed(config)
+    set_seed(config.seed)
+
+    print("Loading data...")
+    dataloaders, image_datasets = load_data(config)
+
+    print(f"Creating {config.architecture} model...")
+    model = build_model(config.architecture, num_classes=config.num_classes, pretrained=True)
+    model = model.to(config.device)
+
+    if config.world_size > 1:
+        if config.linear_lr_scaling:
+            config.learning_rate = config.learning_rate * config.world_size
+            print(f"Linear LR scaling: learning_rate = {config.learning_rate} for world size {config.world_size}")
+        model = DistributedDataParallel(model, device_ids=[config.device.index] if config.device.type == 'cuda' else None)
+
+    criterion = criterion or nn.CrossEntropyLoss()
+    optimizer = create_optimizer(unwrap_model(model))
+    scheduler = create_scheduler(optimizer) if create_scheduler else None
+
+    print(f"Training model ({resolve_precision(config)})...")
+    resume_from = None
+    if resume:
+        resume_from = checkpoint_path(config) if resume is True else resume
+    if teacher is not None:
+        teacher = teacher.to(config.device).eval()
+        for param in teacher.parameters():
+            param.requires_grad = False
+    model = train_model(model, dataloaders, criterion, optimizer, scheduler, config, resume_from=resume_from, teacher=teacher)
+    model = unwrap_model(model)
+
+    test_metrics = None
+    if is_main_process(config):
+        print("\nEvaluating on test set:")
+        test_metrics = evaluate_model(model, dataloaders['test'], config, image_datasets['test'].classes)
+        print_metrics(test_metrics)
+
+        model_path, metadata_path = save_model_with_metadata(model, test_metrics, config)
+        print(f"\nModel saved to: {model_path}")
+        print(f"Metadata saved to: {metadata_path}")
+
+    barrier(config)
+    cleanup_distributed(config)
+
+    return model, test_metrics
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# backend/ and models/ are script directories with flat imports (`from admission import ...`,
+# `import engine`), so tests import their modules the same way
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('backend', 'models'):
+    sys.path.insert(0, os.path.join(ROOT, directory))
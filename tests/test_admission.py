@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, Lane
+
+
+def controller(capacity=1, bulk_concurrency=1, max_queue=8):
+    return AdmissionController(capacity, [
+        Lane("interactive", 0, max_concurrency=capacity, max_queue=max_queue),
+        Lane("bulk", 1, max_concurrency=bulk_concurrency, max_queue=max_queue),
+        Lane("evaluation", 3, max_concurrency=1, max_queue=1),
+    ])
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_freed_slot_goes_to_the_highest_priority_waiter():
+    async def scenario():
+        admission = controller()
+        await admission.acquire("interactive")
+        order = []
+
+        async def worker(lane):
+            await admission.acquire(lane)
+            order.append(lane)
+
+        # Bulk queued first, interactive later: interactive still goes first
+        tasks = [asyncio.create_task(worker("bulk"))]
+        await settle()
+        tasks.append(asyncio.create_task(worker("interactive")))
+        await settle()
+        assert order == []
+
+        admission.release("interactive")
+        await settle()
+        assert order == ["interactive"]
+        admission.release("interactive")
+        await settle()
+        assert order == ["interactive", "bulk"]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+
+def test_lane_concurrency_cap_leaves_slots_for_other_lanes():
+    async def scenario():
+        admission = controller(capacity=2, bulk_concurrency=1)
+        await admission.acquire("bulk")
+        second_bulk = asyncio.create_task(admission.acquire("bulk"))
+        await settle()
+        assert not second_bulk.done()
+
+        # The free slot isn't taken by bulk, so interactive gets it without waiting
+        await asyncio.wait_for(admission.acquire("interactive"), 0.1)
+        assert admission.snapshot()["lanes"]["bulk"]["queued"] == 1
+
+        admission.release("bulk")
+        await asyncio.wait_for(second_bulk, 0.1)
+        assert admission.running == 2
+
+    asyncio.run(scenario())
+
+
+def test_deadline_passing_while_queued_drops_the_waiter():
+    async def scenario():
+        admission = controller()
+        await admission.acquire("interactive")
+
+        with pytest.raises(AdmissionRejected, match="deadline passed while queued"):
+            await admission.acquire("bulk", deadline=time.monotonic() + 0.05)
+        lane = admission.snapshot()["lanes"]["bulk"]
+        assert lane["dropped_deadline"] == 1
+        assert lane["queued"] == 0
+
+        # The dropped waiter doesn't receive the next free slot
+        admission.release("interactive")
+        assert admission.running == 0
+
+    asyncio.run(scenario())
+
+
+def test_expected_wait_beyond_deadline_is_rejected_up_front():
+    async def scenario():
+        admission = controller()
+        async with admission.admit("interactive"):
+            pass
+        admission.lanes["interactive"].service_time = 1.0  # One second per request
+        await admission.acquire("interactive")
+
+        with pytest.raises(AdmissionRejected, match="expected wait exceeds deadline") as rejected:
+            await admission.acquire("interactive", deadline=time.monotonic() + 0.5)
+        assert rejected.value.retry_after == pytest.approx(1.0)
+        assert admission.snapshot()["lanes"]["interactive"]["rejected_deadline_estimate"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_rejected():
+    async def scenario():
+        admission = controller()
+        await admission.acquire("evaluation")
+        queued = asyncio.create_task(admission.acquire("evaluation"))
+        await settle()
+
+        with pytest.raises(AdmissionRejected, match="queue full"):
+            await admission.acquire("evaluation")
+        assert admission.snapshot()["lanes"]["evaluation"]["rejected_queue_full"] == 1
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_is_removed_and_releases_nothing():
+    async def scenario():
+        admission = controller()
+        await admission.acquire("interactive")
+        waiter = asyncio.create_task(admission.acquire("bulk"))
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert admission.snapshot()["lanes"]["bulk"]["queued"] == 0
+
+        admission.release("interactive")
+        assert admission.running == 0
+        assert admission.snapshot()["lanes"]["bulk"]["admitted"] == 0
+
+    asyncio.run(scenario())
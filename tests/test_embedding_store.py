@@ -0,0 +1,108 @@
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+import embedding_store
+from embedding_store import EmbeddingStore
+
+
+def random_rows(count, dim, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+def test_bruteforce_search_returns_nearest_and_excludes_query(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=16, use_faiss=False)
+    rows = random_rows(50, 16)
+    for i, row in enumerate(rows):
+        store.add(f"id{i}", row)
+
+    results = store.search(rows[7], k=3, exclude_id="id7")
+    assert len(results) == 3
+    assert "id7" not in [pid for pid, _ in results]
+
+    best_pid, best_score = store.search(rows[7], k=1)[0]
+    assert best_pid == "id7"
+    assert best_score == pytest.approx(1.0, abs=1e-3)
+
+
+def test_reopen_keeps_rows_and_rejects_wrong_width(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=16, use_faiss=False)
+    for i, row in enumerate(random_rows(10, 16)):
+        store.add(f"id{i}", row)
+    with pytest.raises(ValueError):
+        store.add("wrong", np.ones(8))
+
+    reopened = EmbeddingStore(str(tmp_path), dim=16, use_faiss=False)
+    assert len(reopened) == 10
+    assert "id3" in reopened
+
+
+def test_ids_resolve_before_and_after_merging_into_the_sorted_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, "ID_MERGE_ROWS", 8)
+    rows = random_rows(30, 16)
+    pids = [f"{(i * 7919) % 1000:03d}-prediction" for i in range(30)]  # Not added in sorted order
+    store = EmbeddingStore(str(tmp_path), dim=16, use_faiss=False)
+    for pid, row in zip(pids, rows):
+        store.add(pid, row)
+        store.add(pid, row)  # Already stored: ignored
+    assert len(store) == 30
+    assert len(store._recent) == 30 % 8
+
+    for reopened in (store, EmbeddingStore(str(tmp_path), dim=16, use_faiss=False)):
+        for i in (0, 13, 29):
+            np.testing.assert_allclose(reopened.get(pids[i]), rows[i] / np.linalg.norm(rows[i]), atol=1e-3)
+        assert "999-missing" not in reopened and reopened.get("999-missing") is None
+        assert "000-prediction" in reopened and "00-prediction" not in reopened
+
+
+def test_width_change_starts_a_new_store(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=16, use_faiss=False)
+    for i, row in enumerate(random_rows(10, 16)):
+        store.add(f"id{i}", row)
+
+    # e.g. a pruned model with narrower features
+    narrower = EmbeddingStore(str(tmp_path), dim=8, use_faiss=False)
+    assert len(narrower) == 0
+    with open(tmp_path / "meta.json") as f:
+        assert json.load(f) == {"dim": 8}
+    stale = [name for name in os.listdir(tmp_path) if name.startswith("stale_dim16_")]
+    assert len(stale) == 1
+    assert os.path.getsize(tmp_path / stale[0] / "embeddings.f16") == 10 * 16 * 2
+
+
+def test_torn_append_is_truncated(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=16, use_faiss=False)
+    for i, row in enumerate(random_rows(3, 16)):
+        store.add(f"id{i}", row)
+    # Crash between the two appends: the matrix has a row the id file doesn't
+    with open(tmp_path / "embeddings.f16", "ab") as f:
+        f.write(b"\0" * 32)
+
+    reopened = EmbeddingStore(str(tmp_path), dim=16, use_faiss=False)
+    assert len(reopened) == 3
+    assert os.path.getsize(tmp_path / "embeddings.f16") == 3 * 16 * 2
+
+
+def test_faiss_index_is_built_checkpointed_and_caught_up(tmp_path):
+    pytest.importorskip("faiss")
+    rows = random_rows(400, 16)
+    store = EmbeddingStore(str(tmp_path), dim=16, index_min_rows=300, checkpoint_every=50)
+    for i, row in enumerate(rows[:300]):
+        store.add(f"id{i}", row)
+    building = store._building
+    if building is not None:
+        building.join()
+    assert store.backend == "faiss-ivfpq"
+    assert store.index.ntotal == 300
+    assert store.search(rows[42], k=1)[0][0] == "id42"  # Exact re-rank from the memmap
+
+    # 60 more adds: one checkpoint at 50, the last 10 only in memory when the process dies
+    for i, row in enumerate(rows[300:360], start=300):
+        store.add(f"id{i}", row)
+
+    reopened = EmbeddingStore(str(tmp_path), dim=16, index_min_rows=300)
+    assert reopened._building is None
+    assert reopened.index.ntotal == 360
+    assert reopened.search(rows[355], k=1)[0][0] == "id355"
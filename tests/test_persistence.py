@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import io
+import os
+import sqlite3
+import uuid
+
+import pytest
+
+pytest.importorskip("httpx")
+from persistence import LocalBackend, PersistenceBackend
+
+
+def new_row(prediction="adenocarcinoma"):
+    return {"id": str(uuid.uuid4()), "prediction": prediction, "confidence": 0.9, "speed": 0.1, "user_id": None}
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = LocalBackend(str(tmp_path), public_url="http://localhost:5500")
+    yield backend
+    asyncio.run(backend.aclose())
+
+
+def history(backend, prediction_id):
+    rows = backend.db.execute("SELECT original_prediction, previous_label, corrected_label FROM prediction_feedback "
+                              "WHERE prediction_id = ? ORDER BY id", (prediction_id,)).fetchall()
+    return [tuple(row) for row in rows]
+
+
+def test_incomplete_backend_fails_at_construction():
+    class Incomplete(PersistenceBackend):
+        async def save_prediction(self, row, image, filename, sha256=None):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_record_feedback_unknown_prediction(backend):
+    assert asyncio.run(backend.record_feedback(str(uuid.uuid4()), "normal")) is None
+    assert backend.db.execute("SELECT COUNT(*) FROM prediction_feedback").fetchone()[0] == 0
+
+
+def test_feedback_rows_must_reference_a_prediction(backend):
+    with pytest.raises(sqlite3.IntegrityError):
+        with backend.db:
+            backend.db.execute("INSERT INTO prediction_feedback (prediction_id, original_prediction, previous_label, "
+                               "corrected_label) VALUES (?, 'normal', 'normal', 'normal')", (str(uuid.uuid4()),))
+    assert backend.db.execute("SELECT COUNT(*) FROM prediction_feedback").fetchone()[0] == 0
+
+
+def test_record_feedback_matches_feedback_sql(backend):
+    row = new_row("adenocarcinoma")
+    asyncio.run(backend.save_prediction(row, b"image", "scan.png"))
+    pid = row["id"]
+
+    first = asyncio.run(backend.record_feedback(pid, "normal"))
+    assert first == {"previous_label": "adenocarcinoma", "original_prediction": "adenocarcinoma", "updated": True}
+
+    # The model's label stays the original through later corrections
+    second = asyncio.run(backend.record_feedback(pid, "squamous_cell_carcinoma"))
+    assert second == {"previous_label": "normal", "original_prediction": "adenocarcinoma", "updated": True}
+
+    # Confirming the current label changes nothing but is still recorded
+    same = asyncio.run(backend.record_feedback(pid, "squamous_cell_carcinoma"))
+    assert same == {"previous_label": "squamous_cell_carcinoma", "original_prediction": "adenocarcinoma",
+                    "updated": False}
+
+    stored = backend.db.execute("SELECT prediction, original_prediction FROM predictions WHERE id = ?", (pid,)).fetchone()
+    assert tuple(stored) == ("squamous_cell_carcinoma", "adenocarcinoma")
+    assert history(backend, pid) == [
+        ("adenocarcinoma", "adenocarcinoma", "normal"),
+        ("adenocarcinoma", "normal", "squamous_cell_carcinoma"),
+        ("adenocarcinoma", "squamous_cell_carcinoma", "squamous_cell_carcinoma"),
+    ]
+
+
+def test_confirming_the_model_label_leaves_original_unset(backend):
+    row = new_row("normal")
+    asyncio.run(backend.save_prediction(row, b"image", "scan.png"))
+
+    result = asyncio.run(backend.record_feedback(row["id"], "normal"))
+    assert result == {"previous_label": "normal", "original_prediction": "normal", "updated": False}
+    stored = backend.db.execute("SELECT original_prediction FROM predictions WHERE id = ?", (row["id"],)).fetchone()
+    assert stored[0] is None
+
+
+def test_images_are_content_addressed_and_fetchable(backend):
+    data = b"\x89PNG fake image bytes"
+    sha256 = hashlib.sha256(data).hexdigest()
+    first, second = new_row(), new_row()
+    url = asyncio.run(backend.save_prediction(first, data, "scan.PNG"))
+    # A file object with a precomputed hash stores to the same file
+    assert asyncio.run(backend.save_prediction(second, io.BytesIO(data), "other.png", sha256)) == url
+    assert url == f"http://localhost:5500/images/{sha256}.png"
+
+    assert backend.image_path(f"{sha256}.png") == os.path.join(backend.images_dir, sha256[:2], f"{sha256}.png")
+    assert asyncio.run(backend.fetch_image(second["id"])) == data
+    assert asyncio.run(backend.fetch_image(str(uuid.uuid4()))) is None
+
+    rows = asyncio.run(backend.get_predictions([first["id"], second["id"], str(uuid.uuid4())]))
+    assert sorted(row["id"] for row in rows) == sorted([first["id"], second["id"]])
+
+
+def test_image_path_rejects_names_that_are_not_hashes(backend):
+    assert backend.image_path("../predictions.sqlite3") is None
+    assert backend.image_path("0" * 64 + ".png") is None  # Well-formed but not stored
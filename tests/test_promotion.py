@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+from promotion import ModelRegistry, PromotionGate
+
+
+def promote(registry, note):
+    version = registry.new_version_id()
+    path = registry.checkpoint_path(version)
+    with open(path, 'wb') as f:
+        f.write(b'weights')
+    registry.record({'version': version, 'path': path, 'promoted': True, 'metrics': {}, 'note': note}, make_current=True)
+    return version
+
+
+def test_prune_checkpoints_keeps_the_newest_promoted_candidates(tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+    baseline = str(tmp_path / 'served.pth')
+    open(baseline, 'wb').close()
+    registry.record({'version': 'baseline', 'path': baseline, 'promoted': True, 'metrics': {}}, make_current=True)
+    versions = [promote(registry, i) for i in range(4)]
+
+    assert registry.prune_checkpoints(keep=2) == 2
+    assert [os.path.exists(registry.checkpoint_path(v)) for v in versions] == [False, False, True, True]
+    assert os.path.exists(baseline)  # Not a registry candidate
+
+    reloaded = ModelRegistry(str(tmp_path))
+    paths = {entry['version']: entry['path'] for entry in reloaded.data['versions']}
+    assert paths[versions[0]] is None and paths[versions[3]] == registry.checkpoint_path(versions[3])
+    assert reloaded.prune_checkpoints(keep=2) == 0
+
+
+def test_gate_rejects_drops_that_stack_up_across_promotions(tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+    gate = PromotionGate(registry, str(tmp_path / 'test'), ['a', 'b'], max_regression=0.005, max_total_regression=0.01)
+    served = {'overall_accuracy': 0.90, 'overall_f1_weighted': 0.90}
+    registry.record({'version': 'baseline', 'promoted': True, 'metrics': dict(served)}, make_current=True)
+    registry.record({'version': 'rejected', 'promoted': False, 'metrics': {'overall_accuracy': 0.99}})
+
+    # Each step is within max_regression of the served model...
+    for step in range(2):
+        candidate = {key: value - 0.004 for key, value in served.items()}
+        assert gate.compare(candidate, served, gate.reference_metrics()) == {}
+        registry.record({'version': f'step{step}', 'promoted': True, 'metrics': candidate}, make_current=True)
+        served = candidate
+
+    # ...until the total drop from the best promoted metrics passes max_total_regression
+    assert gate.reference_metrics() == {'overall_accuracy': 0.90, 'overall_f1_weighted': 0.90}
+    candidate = {key: value - 0.004 for key, value in served.items()}
+    regressions = gate.compare(candidate, served, gate.reference_metrics())
+    assert set(regressions) == {'overall_accuracy (vs best 0.9000)', 'overall_f1_weighted (vs best 0.9000)'}
+    assert regressions['overall_accuracy (vs best 0.9000)'] == pytest.approx(-0.012)
@@ -0,0 +1,76 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+
+from DenseNet121withSE import DenseNetSE, BLOCK_LAYERS, GROWTH_RATE, TRANSITION_CHANNELS, block_channels
+from Pruning import prune_model, select_channels
+
+
+def every_other_channel():
+    return [torch.arange(0, channels, 2) for channels in TRANSITION_CHANNELS]
+
+
+def test_select_channels_takes_top_scores_within_the_transition_outputs():
+    stats = {}
+    for k, name in enumerate(('se2', 'se3', 'se4')):
+        scores = torch.zeros(block_channels()[k + 1])
+        scores[TRANSITION_CHANNELS[k]:] = 100.0         # Growth channels aren't candidates
+        scores[:TRANSITION_CHANNELS[k]] = torch.arange(TRANSITION_CHANNELS[k], 0, -1).float()
+        stats[name] = scores
+
+    keep = select_channels(stats, TRANSITION_CHANNELS, keep_ratio=0.5, min_channels=32)
+    for k, index in enumerate(keep):
+        assert index.tolist() == list(range(TRANSITION_CHANNELS[k] // 2))
+
+    # A small ratio is floored at min_channels, and never exceeds the transition width
+    keep = select_channels(stats, TRANSITION_CHANNELS, keep_ratio=0.1, min_channels=32)
+    assert [len(index) for index in keep] == [32, 32, 51]
+    keep = select_channels(stats, (16, 256, 512), keep_ratio=0.5, min_channels=32)
+    assert len(keep[0]) == 16
+
+
+def test_prune_model_shapes_and_copied_weights():
+    torch.manual_seed(0)
+    model = DenseNetSE(num_classes=4, pretrained=False, exit_heads=True).eval()
+    keep = every_other_channel()
+    slim = prune_model(model, keep)
+
+    assert slim.transition_channels == (64, 128, 256)
+    assert slim.classifier[0].in_features == 256 + GROWTH_RATE * BLOCK_LAYERS[3]
+    assert torch.equal(slim.features.transition1.conv.weight, model.features.transition1.conv.weight[keep[0]])
+    # Block 2's first layer reads the kept transition1 channels, then nothing else yet
+    assert torch.equal(slim.features.denseblock2.denselayer1.conv1.weight,
+                       model.features.denseblock2.denselayer1.conv1.weight[:, keep[0]])
+    # Later layers also read the earlier growth channels, which follow the transition channels
+    layer_in = torch.cat([keep[0], torch.arange(128, 128 + GROWTH_RATE * 3)])
+    assert torch.equal(slim.features.denseblock2.denselayer4.conv1.weight,
+                       model.features.denseblock2.denselayer4.conv1.weight[:, layer_in])
+    assert slim.exit3.fc.weight.shape[1] == 128 + GROWTH_RATE * BLOCK_LAYERS[2]
+
+
+def test_prune_model_is_exact_when_pruned_channels_are_unused():
+    torch.manual_seed(0)
+    model = DenseNetSE(num_classes=4, pretrained=False).eval()
+    keep = every_other_channel()
+
+    # Zero every weight reading a dropped channel: the model no longer depends on it,
+    # so removing it must not change the output if the slicing is right
+    with torch.no_grad():
+        for k, index in enumerate(keep):
+            dropped = torch.ones(TRANSITION_CHANNELS[k], dtype=torch.bool)
+            dropped[index] = False
+            dropped = dropped.nonzero().flatten()
+            block = getattr(model.features, f'denseblock{k + 2}')
+            for layer in block.values():
+                layer.conv1.weight[:, dropped] = 0
+            getattr(model, f'se{k + 2}').fc[0].weight[:, dropped] = 0
+            if k < 2:
+                getattr(model.features, f'transition{k + 2}').conv.weight[:, dropped] = 0
+            else:
+                model.classifier[0].weight[:, dropped] = 0
+
+    slim = prune_model(model, keep).eval()
+    x = torch.randn(2, 3, 64, 64)
+    with torch.no_grad():
+        assert torch.allclose(slim(x), model(x), atol=1e-5)
@@ -0,0 +1,52 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+
+from replay_buffer import ClassSlots
+
+
+def slots(tmp_path, per_class=4):
+    return ClassSlots(str(tmp_path / 'feedback.u8'), num_classes=2, per_class=per_class, image_shape=(1, 2, 2))
+
+
+def put(store, key, label=0):
+    store.put_fifo(label, torch.full((1, 2, 2), ord(key), dtype=torch.uint8), key)
+
+
+def stored(store, label=0):
+    """Keys in slot order, checking each slot's pixels still belong to its key."""
+    keys = store.meta['keys'][label][:store.count(label)]
+    for index, key in enumerate(keys):
+        assert store.get(label, index).eq(ord(key)).all()
+    return keys
+
+
+def test_removal_keeps_fifo_order_after_the_ring_wrapped(tmp_path):
+    store = slots(tmp_path)
+    for key in 'abcde':  # e replaces a: slots [e, b, c, d], oldest b
+        put(store, key)
+    store.remove_key('c')
+    assert stored(store) == ['b', 'd', 'e']
+
+    put(store, 'f')
+    put(store, 'g')  # Full again: replaces the oldest, b
+    put(store, 'h')  # then d
+    assert stored(store) == ['g', 'h', 'e', 'f']
+
+
+def test_removal_before_the_buffer_fills(tmp_path):
+    store = slots(tmp_path)
+    for key in 'abc':
+        put(store, key)
+    put(store, 'x', label=1)
+    store.remove_key('a')
+    put(store, 'd')
+    put(store, 'e')  # Full: the next insert replaces b, the oldest
+    put(store, 'f')
+    assert stored(store) == ['f', 'c', 'd', 'e']
+    assert stored(store, label=1) == ['x']
+
+    store.flush()
+    reopened = slots(tmp_path)
+    assert stored(reopened) == ['f', 'c', 'd', 'e']
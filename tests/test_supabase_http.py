@@ -0,0 +1,162 @@
+import asyncio
+import io
+import threading
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+import supabase_http
+from supabase_http import AsyncSupabaseClient, CircuitBreaker, CircuitOpen, SupabaseError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(supabase_http.time, "monotonic", clock)
+    return clock
+
+
+def test_opens_after_threshold_consecutive_failures(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=30.0)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record(False)
+    assert breaker.state == 'closed'
+
+    # A success resets the count
+    breaker.record(True)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record(False)
+    assert breaker.state == 'open'
+    assert breaker.times_opened == 1
+
+    clock.now += 10
+    with pytest.raises(CircuitOpen) as rejected:
+        breaker.before_call()
+    assert rejected.value.retry_after == pytest.approx(20.0)
+    assert rejected.value.status == 503
+
+
+def test_half_open_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=30.0)
+    breaker.record(False)
+    clock.now += 30
+    assert breaker.state == 'half-open'
+
+    breaker.before_call()
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()  # Only one trial at a time
+
+    breaker.record(True)
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+
+def test_failed_trial_reopens_for_a_full_cooldown(clock):
+    breaker = CircuitBreaker(threshold=1, cooldown=30.0)
+    breaker.record(False)
+    clock.now += 31
+    breaker.before_call()
+    breaker.record(False)
+
+    assert breaker.state == 'open'
+    assert breaker.times_opened == 1  # Still the same outage
+    clock.now += 29
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    clock.now += 1
+    assert breaker.state == 'half-open'
+
+
+def run_client(handler, call, **options):
+    async def scenario():
+        options.setdefault('backoff', 0.0)
+        client = AsyncSupabaseClient("https://example.supabase.co", "key", transport=httpx.MockTransport(handler), **options)
+        try:
+            return await call(client), client
+        except SupabaseError as e:
+            return e, client
+        finally:
+            await client.aclose()
+
+    return asyncio.run(scenario())
+
+
+def test_idempotent_calls_retry_transient_failures():
+    statuses = [503, 502, 200]
+
+    def handler(request):
+        return httpx.Response(statuses.pop(0), json=[{"prediction": "normal"}])
+
+    result, client = run_client(handler, lambda c: c.select("predictions", "prediction", id="x"), retries=3)
+    assert result == [{"prediction": "normal"}]
+    assert client.stats['retries'] == 2
+    assert client.breaker.state == 'closed'
+
+
+def test_non_idempotent_calls_are_not_retried_after_reaching_the_server():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503, json={"message": "unavailable"})
+
+    error, client = run_client(handler, lambda c: c.insert("predictions", {"id": "x"}), retries=3)
+    assert isinstance(error, SupabaseError) and error.status == 503
+    assert len(calls) == 1
+    assert client.breaker.failures == 1
+
+
+def test_client_errors_do_not_trip_the_breaker():
+    def handler(request):
+        return httpx.Response(404, json={"code": "PGRST202", "message": "function not found"})
+
+    error, client = run_client(handler, lambda c: c.rpc("record_feedback", {}), breaker_threshold=1)
+    assert error.code == "PGRST202"
+    assert client.breaker.state == 'closed'
+    assert client.stats['failures'] == 1
+
+
+def test_waiting_for_a_pool_slot_times_out():
+    async def call(client):
+        await client._slots.acquire()  # Every connection busy
+        return await client.select("predictions", "prediction", id="x")
+
+    error, client = run_client(lambda request: httpx.Response(200, json=[]), call,
+                               max_connections=1, timeout=0.05, retries=1)
+    assert isinstance(error, SupabaseError) and "PoolTimeout" in str(error)
+    assert client.stats['pool_timeouts'] == 2  # Retried: the request never reached the server
+    assert client.stats['requests'] == 0
+    assert client.waiting == 0
+
+
+def test_file_uploads_are_streamed_from_worker_threads(tmp_path, monkeypatch):
+    data = bytes(range(256)) * 1024
+    path = tmp_path / "scan.png"
+    path.write_bytes(data)
+    received = []
+
+    def handler(request):
+        received.append(request.content)
+        return httpx.Response(200, json={"Key": "scan.png"})
+
+    read_in = set()
+
+    class RecordingFile(io.FileIO):
+        def read(self, size=-1):
+            read_in.add(threading.current_thread())
+            return super().read(size)
+
+    with RecordingFile(str(path)) as f:
+        result, client = run_client(handler, lambda c: c.upload("images", "scan.png", f, "image/png"))
+    assert result is None and received == [data]
+    assert read_in and threading.main_thread() not in read_in
@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import io
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image, ImageFile
+
+from uploads import MaxBodySizeMiddleware, UploadTooLarge, ingest_upload
+
+
+class FakeUpload:
+    """The async file interface of FastAPI's UploadFile, over bytes."""
+
+    def __init__(self, data):
+        self.file = io.BytesIO(data)
+
+    async def seek(self, offset):
+        self.file.seek(offset)
+
+    async def read(self, size=-1):
+        return self.file.read(size)
+
+
+def png_bytes(size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.effect_noise(size, 64).convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def ingest(data, tmp_path, **kwargs):
+    options = {'max_bytes': 10 * 1024 * 1024, 'memory_bytes': 1024 * 1024, 'spool_dir': str(tmp_path), 'chunk_size': 1024}
+    options.update(kwargs)
+    return asyncio.run(ingest_upload(FakeUpload(data), **options))
+
+
+def test_small_upload_stays_in_memory(tmp_path):
+    data = png_bytes()
+    with ingest(data, tmp_path) as upload:
+        assert not upload.spooled
+        assert upload.size == len(data)
+        assert upload.sha256 == hashlib.sha256(data).hexdigest()
+        assert upload.image.size == (64, 48)
+        assert upload.storage_payload() == data
+    assert os.listdir(tmp_path) == []
+
+
+def test_large_upload_is_spooled_and_removed_on_close(tmp_path):
+    data = png_bytes((256, 256))
+    upload = ingest(data, tmp_path, memory_bytes=4096)
+    try:
+        assert upload.spooled
+        assert os.path.dirname(upload.path) == str(tmp_path)
+        payload = upload.storage_payload()
+        assert payload.read() == data
+        assert upload.image.size == (256, 256)
+    finally:
+        upload.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_over_the_limit_raises_and_leaves_no_spool_file(tmp_path):
+    data = png_bytes((256, 256))
+    with pytest.raises(UploadTooLarge) as too_large:
+        ingest(data, tmp_path, max_bytes=len(data) - 1, memory_bytes=4096)
+    assert too_large.value.max_bytes == len(data) - 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_keep_false_only_decodes(tmp_path):
+    data = png_bytes((256, 256))
+    with ingest(data, tmp_path, memory_bytes=4096, keep=False) as upload:
+        assert not upload.spooled
+        assert upload.image.size == (256, 256)
+    assert os.listdir(tmp_path) == []
+
+
+def test_decoding_runs_off_the_event_loop(tmp_path, monkeypatch):
+    threads = set()
+    feed = ImageFile.Parser.feed
+
+    def recording_feed(parser, data):
+        threads.add(threading.current_thread())
+        return feed(parser, data)
+
+    monkeypatch.setattr(ImageFile.Parser, 'feed', recording_feed)
+    with ingest(png_bytes(), tmp_path) as upload:
+        assert upload.image.size == (64, 48)
+    assert threads and threading.main_thread() not in threads
+
+
+def run_middleware(headers, chunks, max_bytes=100):
+    sent = []
+
+    async def app(scope, receive, send):
+        while (await receive()).get('more_body'):
+            pass
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+    async def scenario():
+        messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                    for i, chunk in enumerate(chunks)]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'path': '/predict/', 'headers': headers}
+        await MaxBodySizeMiddleware(app, max_bytes=max_bytes, paths=('/predict/',))(scope, receive, send)
+
+    asyncio.run(scenario())
+    return sent[0]['status']
+
+
+def test_middleware_rejects_by_content_length():
+    assert run_middleware([(b'content-length', b'101')], [b'x' * 101]) == 413
+
+
+def test_middleware_rejects_chunked_body_over_the_limit():
+    assert run_middleware([], [b'x' * 60, b'x' * 60]) == 413
+
+
+def test_middleware_passes_bodies_within_the_limit():
+    assert run_middleware([(b'content-length', b'100')], [b'x' * 50, b'x' * 50]) == 200